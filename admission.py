@@ -0,0 +1,222 @@
+"""
+QA 阶段的准入控制
+
+LLM 调用是整个服务的瓶颈。不加限制时突发流量会让所有请求一起变慢直至超时；
+AdmissionController 限制同时进行的生成数，超出的请求按优先级排队（交互请求优先于批量任务），
+队列满或排队超时时立即拒绝（429/503，带 Retry-After），让客户端退避而不是一直等待。
+
+每个 worker 进程各自计数；只在 asyncio 事件循环中调用 acquire，release 可以在任意线程调用。
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+from metrics import ADMISSION_INFLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, observe_stage
+
+# 优先级（数值越小越先处理）
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳；status_code 为 429（队列已满）或 503（排队超时、被抢占）"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """一个生成名额；release 可重复调用，可在任意线程调用"""
+
+    def __init__(self, controller: "AdmissionController", priority: str):
+        self._controller = controller
+        self.priority = priority
+        self.acquired_at = time.perf_counter()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release_threadsafe(self)
+
+
+class _Waiter:
+    __slots__ = ("rank", "seq", "priority", "future")
+
+    def __init__(self, rank: int, seq: int, priority: str, future: asyncio.Future):
+        self.rank = rank
+        self.seq = seq
+        self.priority = priority
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class AdmissionController:
+    """并发上限 + 有界优先级队列
+
+    max_inflight 为同时进行的生成数（0 表示不限制）；batch_max_inflight 限制批量任务最多占用的名额，
+    始终给交互请求留出余量。队列满时交互请求会挤掉最后排队的批量请求。
+    """
+
+    def __init__(self, max_inflight: int = 8, max_queue: int = 32, queue_timeout: float = 30,
+                 batch_max_inflight: Optional[int] = None):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        if batch_max_inflight is None:
+            batch_max_inflight = max(1, max_inflight // 2)
+        self.batch_max_inflight = batch_max_inflight
+
+        self._inflight: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self._queued: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 单个名额的平均占用时间（秒），用于估算 Retry-After
+        self._service_time = 5.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_inflight > 0
+
+    def _can_run(self, priority: str) -> bool:
+        if sum(self._inflight.values()) >= self.max_inflight:
+            return False
+        return priority != "batch" or self._inflight["batch"] < self.batch_max_inflight
+
+    def _has_waiters_ahead(self, priority: str) -> bool:
+        rank = PRIORITIES[priority]
+        return any(self._queued[name] for name, r in PRIORITIES.items() if r <= rank)
+
+    def retry_after(self) -> int:
+        """按排队长度与平均占用时间估算的重试等待秒数"""
+        queued = sum(self._queued.values())
+        estimate = self._service_time * (queued + 1) / max(self.max_inflight, 1)
+        return int(min(max(math.ceil(estimate), 1), 60))
+
+    def _reject(self, status_code: int, reason: str, priority: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.inc(priority=priority, reason=reason)
+        return AdmissionRejected(status_code, reason, self.retry_after())
+
+    def _update_metrics(self):
+        for name in PRIORITIES:
+            ADMISSION_INFLIGHT.set(self._inflight[name], priority=name)
+            ADMISSION_QUEUE_DEPTH.set(self._queued[name], priority=name)
+
+    def check(self, priority: str):
+        """不等待的快速检查：确定会被拒绝时（队列已满且不能抢占）直接抛出 AdmissionRejected
+
+        在检索之前调用，过载时被拒绝的请求不再消耗编码与向量搜索。
+        """
+        if not self.enabled or self._can_run(priority) or sum(self._queued.values()) < self.max_queue:
+            return
+        if priority == "interactive" and self._queued["batch"]:
+            return
+        raise self._reject(429, "queue_full", priority)
+
+    async def acquire(self, priority: str = "interactive") -> Ticket:
+        """取得一个生成名额，必要时排队；被拒绝时抛出 AdmissionRejected"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {priority}")
+        self._loop = asyncio.get_running_loop()
+
+        ticket = Ticket(self, priority)
+        if not self.enabled:
+            return ticket
+        if self._can_run(priority) and not self._has_waiters_ahead(priority):
+            self._inflight[priority] += 1
+            self._update_metrics()
+            return ticket
+
+        if sum(self._queued.values()) >= self.max_queue:
+            if not (priority == "interactive" and self._preempt_batch()):
+                raise self._reject(429, "queue_full", priority)
+
+        waiter = _Waiter(PRIORITIES[priority], next(self._seq), priority, self._loop.create_future())
+        heapq.heappush(self._waiters, waiter)
+        self._queued[priority] += 1
+        self._update_metrics()
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                self._dequeue(waiter)
+                raise self._reject(503, "queue_timeout", priority)
+        except asyncio.CancelledError:
+            # 客户端断开：仍在排队则退出队列，已经分到名额则归还
+            if not waiter.future.done():
+                self._dequeue(waiter)
+            elif waiter.future.exception() is None:
+                ticket.release()
+            raise
+        finally:
+            observe_stage("admission_wait", time.perf_counter() - start)
+
+        # 被抢占时 future 中是 AdmissionRejected
+        waiter.future.result()
+        ticket.acquired_at = time.perf_counter()
+        return ticket
+
+    def _dequeue(self, waiter: _Waiter):
+        waiter.future.cancel()
+        self._queued[waiter.priority] -= 1
+        self._update_metrics()
+
+    def _preempt_batch(self) -> bool:
+        """挤掉最后排队的批量请求，为交互请求腾出队列位置"""
+        candidates = [w for w in self._waiters if w.priority == "batch" and not w.future.done()]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda w: w.seq)
+        victim.future.set_exception(self._reject(503, "preempted", "batch"))
+        self._queued["batch"] -= 1
+        self._update_metrics()
+        return True
+
+    def _release_threadsafe(self, ticket: Ticket):
+        if not self.enabled:
+            return
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._release, ticket)
+
+    def _release(self, ticket: Ticket):
+        held = time.perf_counter() - ticket.acquired_at
+        self._service_time = 0.9 * self._service_time + 0.1 * held
+        self._inflight[ticket.priority] -= 1
+        self._grant_next()
+        self._update_metrics()
+
+    def _grant_next(self):
+        """按优先级把空出的名额交给排队的请求"""
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.future.done():
+                # 已超时、取消或被抢占
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_run(waiter.priority):
+                return
+            heapq.heappop(self._waiters)
+            self._queued[waiter.priority] -= 1
+            self._inflight[waiter.priority] += 1
+            waiter.future.set_result(True)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"inflight": dict(self._inflight), "queued": dict(self._queued),
+                "max_inflight": self.max_inflight, "max_queue": self.max_queue}
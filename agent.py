@@ -1,129 +1,643 @@
-import pickle
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, field
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+from concurrent.futures import Future
+from enum import Enum
+import hashlib
 import json
 import os
+import queue
+import threading
+import time
+
+from cache import TTLCache, file_version, normalize_query
+from metrics import (LLM_COST, LLM_INFLIGHT, LLM_TOKENS, PROMPT_CACHE_RATIO, ROUTE_LATENCY, ROUTE_REQUESTS,
+                     observe_stage, record_cache_lookup, time_stage)
+from llm_pool import Backend, LLMPool
+from model_router import ModelRouter, RouteDecision, estimate_tokens
+from query_condenser import QueryCondenser
+from single_flight import SharedStream, SingleFlight
+from search_filters import FilterIndex, normalize_filters
+from tracing import span
 
 # 设置环境变量来避免 tokenizers 警告
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-# 导入langchain相关组件
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain.schema import BaseMessage, HumanMessage, AIMessage
+# faiss、sentence_transformers(torch) 与 langchain 在首次使用时才导入，
+# 使 `import agent` 保持轻量，API 可以先启动再在后台加载模型和索引
+
+class Role(str, Enum):
+    """消息角色"""
+    USER = "user"
+    ASSISTANT = "assistant"
+
+class Message:
+    """一条对话消息
+    
+    大量会话常驻内存，消息不用 dict：__slots__ 去掉实例字典，角色为共享的枚举成员，
+    时间为秒级 epoch 整数（接口输出时再转为 ISO 字符串）。
+    """
+    __slots__ = ("role", "content", "timestamp")
+    
+    def __init__(self, role: Role, content: str, timestamp: Optional[int] = None):
+        self.role = Role(role)
+        self.content = content
+        self.timestamp = int(time.time()) if timestamp is None else timestamp
+    
+    def to_dict(self) -> Dict[str, str]:
+        """接口输出格式"""
+        return {
+            "role": self.role.value,
+            "content": self.content,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+    
+    def to_row(self) -> list:
+        """序列化格式：[角色, 内容, 时间]"""
+        return [self.role.value, self.content, self.timestamp]
+    
+    @classmethod
+    def from_row(cls, row) -> "Message":
+        if isinstance(row, dict):
+            # 旧格式：{"role", "content", "timestamp": ISO 字符串}
+            return cls(row["role"], row["content"], int(datetime.fromisoformat(row["timestamp"]).timestamp()))
+        return cls(*row)
 
 @dataclass
 class ConversationContext:
-    """对话上下文管理"""
-    history: List[Dict[str, str]] = field(default_factory=list)
+    """对话上下文管理
+    
+    history 只保存最近的消息，更早的由会话存储转存（见 trim 与 session_store.py），archived 为已转存的条数。
+    检索结果只保存命中条文的行号与索引版本，需要文本时通过 FAISSRetriever.passages 取回。
+    """
+    history: List[Message] = field(default_factory=list)
     current_topic: str = ""
-    retrieved_context: List[str] = field(default_factory=list)
+    retrieved_ids: List[int] = field(default_factory=list)
+    retrieved_version: str = ""
     last_query: str = ""
     session_id: str = ""
+    archived: int = 0
+    
+    @property
+    def message_count(self) -> int:
+        """消息总数（含已转存的）"""
+        return self.archived + len(self.history)
+    
+    @property
+    def last_activity(self) -> Optional[str]:
+        return self.history[-1].to_dict()["timestamp"] if self.history else None
     
     def add_message(self, role: str, content: str):
         """添加消息到历史记录"""
-        self.history.append({
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        })
+        self.history.append(Message(role, content))
     
     def get_recent_context(self, n: int = 3) -> str:
         """获取最近n轮对话的上下文"""
         recent = self.history[-n*2:] if len(self.history) >= n*2 else self.history
         context_str = ""
         for msg in recent:
-            context_str += f"{msg['role']}: {msg['content']}\n"
+            context_str += f"{msg.role.value}: {msg.content}\n"
         return context_str
+    
+    def stable_history(self, max_turns: int = 6) -> List[Message]:
+        """送入LLM的对话历史：只在末尾追加，超过 max_turns 轮时起点按 max_turns//2 轮一块整体前移
+        
+        与"最近n轮"的滑动窗口不同，相邻几轮请求的历史部分逐字相同，可以命中服务端的前缀缓存。
+        起点按含已转存消息的总轮数计算，转存不会改变窗口位置。
+        """
+        turns = self.message_count // 2
+        start = 0
+        if turns > max_turns:
+            step = max(1, max_turns // 2)
+            start = ((turns - max_turns) // step + 1) * step
+        return self.history[max(0, start * 2 - self.archived):]
+    
+    def trim(self, limit: int) -> List[Message]:
+        """内存中最多保留 limit 条（按整轮）消息，移出并返回更早的消息；limit 为 0 时不限制"""
+        if limit <= 0 or len(self.history) <= limit:
+            return []
+        overflow = len(self.history) - limit
+        overflow += overflow % 2
+        removed = self.history[:overflow]
+        del self.history[:overflow]
+        self.archived += len(removed)
+        return removed
+    
+    def version(self) -> str:
+        """对话内容的版本标识，对话有新消息或被重置后改变，用于按会话版本缓存总结等结果"""
+        digest = hashlib.sha1()
+        for msg in self.history:
+            digest.update(f"{msg.role.value}\x00{msg.content}\x00".encode("utf-8"))
+        return f"{self.message_count}x{digest.hexdigest()[:12]}"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化（会话存储使用）"""
+        return {
+            "history": [msg.to_row() for msg in self.history],
+            "current_topic": self.current_topic,
+            "retrieved_ids": list(self.retrieved_ids),
+            "retrieved_version": self.retrieved_version,
+            "last_query": self.last_query,
+            "session_id": self.session_id,
+            "archived": self.archived
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationContext":
+        """反序列化，兼容旧格式（消息为 dict、检索结果为法条全文）"""
+        return cls(
+            history=[Message.from_row(row) for row in data.get("history", [])],
+            current_topic=data.get("current_topic", ""),
+            retrieved_ids=data.get("retrieved_ids", []),
+            retrieved_version=data.get("retrieved_version", ""),
+            last_query=data.get("last_query", ""),
+            session_id=data.get("session_id", ""),
+            archived=data.get("archived", 0)
+        )
+
+class BatchingEncoder:
+    """查询编码微批处理器
+
+    并发到达的查询在 max_wait_ms 内（或凑满 max_batch_size 条）合并为一次前向计算，
+    再把各自的向量交还给调用方的 Future。
+    """
+    
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+    
+    def _ensure_worker(self):
+        """按需启动后台线程（fork 之后的子进程需要重新启动）"""
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, args=(self._queue,),
+                                            name="encoder-batcher", daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+    
+    def submit(self, text: str) -> Future:
+        """提交单条文本，返回其向量的 Future"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+    
+    def encode(self, sentences: List[str], **kwargs) -> np.ndarray:
+        """与 SentenceTransformer.encode 兼容的阻塞接口"""
+        futures = [self.submit(sentence) for sentence in sentences]
+        return np.vstack([future.result() for future in futures])
+    
+    def _run(self, pending: queue.Queue):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.model.encode(texts, batch_size=len(texts))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+# build_faiss_index.py 为每段记录的条文关联（全局行号，-1 表示没有）
+LINK_FIELDS = ('parent_start', 'parent_end', 'prev_id', 'next_id', 'chapter_start', 'chapter_end')
+
+def _resolve_data_path(path: str) -> str:
+    """相对路径按项目根目录解析"""
+    if not os.path.isabs(path):
+        # 相对于当前脚本目录
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(script_dir, path)
+    return path
+
+class IndexSnapshot:
+    """一个版本的索引及其元数据、过滤位图与条文关联
+    
+    重新加载索引时构建新的快照再整体替换；检索开始时取一次快照引用，
+    替换发生在检索过程中也会用旧版本完成。
+    """
+    
+    def __init__(self, index_path: str, metadata_path: str):
+        import faiss
+        from metadata_store import int_column, load_metadata
+        
+        # 检查文件是否存在
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"FAISS index file not found: {index_path}")
+        if not os.path.exists(metadata_path):
+            raise FileNotFoundError(f"Metadata file not found: {metadata_path}")
+        
+        self.index_path = index_path
+        self.metadata_path = metadata_path
+        self.load_timings: Dict[str, float] = {}
+        
+        # 索引版本（文件修改时间与大小），重建索引后检索结果缓存自动失效
+        self.version = file_version(index_path, metadata_path)
+        self.loaded_at = datetime.now().isoformat()
+        
+        # FAISS_MMAP=true 时索引与元数据以只读 mmap 方式打开，多个 worker 进程共享页缓存
+        use_mmap = os.getenv("FAISS_MMAP", "false").lower() in ("1", "true", "yes")
+        
+        start = time.perf_counter()
+        if use_mmap:
+            io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+            self.index = faiss.read_index(index_path, io_flags)
+        else:
+            self.index = faiss.read_index(index_path)
+        self.load_timings["index"] = time.perf_counter() - start
+        
+        # 内积索引由归一化向量构建，分数即余弦相似度；旧版L2索引仍按 1/(1+distance) 计分
+        self.use_cosine = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        if hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = int(os.getenv("HNSW_EF_SEARCH", "64"))
+        
+        start = time.perf_counter()
+        self.metadata = load_metadata(metadata_path, mmap=use_mmap)
+        self.load_timings["metadata"] = time.perf_counter() - start
+        
+        self.filter_index = FilterIndex(self.metadata)
+        
+        # 条文关联数组：命中的小段可以按下标直接扩展为完整条文或前后条文
+        self.links = {name: int_column(self.metadata, name) for name in LINK_FIELDS}
+        if any(column is None for column in self.links.values()):
+            self.links = None
+    
+    def content(self, i: int) -> str:
+        if hasattr(self.metadata, "get_field"):
+            return self.metadata.get_field(i, "content", "")
+        return self.metadata[i]["content"]
+    
+    def article_text(self, start: int) -> str:
+        """完整条文：从条文首段到 parent_end 的各段拼接"""
+        end = int(self.links["parent_end"][start])
+        return "".join(self.content(j) for j in range(start, end))
 
 class FAISSRetriever:
     """FAISS检索器"""
     
     def __init__(self, index_path: str = None, metadata_path: str = None):
-        self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+        # 各加载阶段耗时（秒）
+        self.load_timings: Dict[str, float] = {}
         
-        # 如果没有提供路径，使用默认值
-        if index_path is None:
-            index_path = 'law_index.bin'
-        if metadata_path is None:
-            metadata_path = 'metadata.pkl'
+        start = time.perf_counter()
+        self.model = self._load_encoder()
+        self.load_timings["encoder"] = time.perf_counter() - start
         
-        # 如果是相对路径，转换为绝对路径
-        if not os.path.isabs(index_path):
-            # 相对于当前脚本目录
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            index_path = os.path.join(script_dir, index_path)
+        # 并发查询合并为批量编码
+        if os.getenv("ENCODER_BATCHING", "true").lower() in ("1", "true", "yes"):
+            self.encoder = BatchingEncoder(
+                self.model,
+                max_batch_size=int(os.getenv("ENCODER_MAX_BATCH", "32")),
+                max_wait_ms=float(os.getenv("ENCODER_MAX_WAIT_MS", "5"))
+            )
+        else:
+            self.encoder = self.model
         
-        if not os.path.isabs(metadata_path):
-            # 相对于当前脚本目录
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            metadata_path = os.path.join(script_dir, metadata_path)
+        # 如果没有提供路径，使用默认值；相对路径转换为绝对路径
+        self.index_path = _resolve_data_path(index_path or 'law_index.bin')
+        self.metadata_path = _resolve_data_path(metadata_path or 'metadata.pkl')
         
-        # 检查文件是否存在
-        if not os.path.exists(index_path):
-            raise FileNotFoundError(f"FAISS index file not found: {index_path}")
-        if not os.path.exists(metadata_path):
-            raise FileNotFoundError(f"Metadata file not found: {metadata_path}")
+        self.snapshot = IndexSnapshot(self.index_path, self.metadata_path)
+        self.load_timings.update(self.snapshot.load_timings)
+        
+        self.result_cache = TTLCache(
+            maxsize=int(os.getenv("RESULT_CACHE_SIZE", "2048")),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "3600"))
+        )
+        # 查询向量只取决于编码器，不随索引版本失效；k 或过滤条件不同的检索也能复用
+        self.embedding_cache = TTLCache(
+            maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+            ttl=float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+        )
+        
+        self.min_score = float(os.getenv("RETRIEVAL_MIN_SCORE", "0"))
+        if not self.use_cosine and self.min_score > 0:
+            print("⚠️ 当前为L2索引，相关度阈值 RETRIEVAL_MIN_SCORE 不生效，请用 INDEX_TYPE=flat_ip 重建索引")
+        self.expansion = os.getenv("RETRIEVAL_EXPANSION", "parent").lower()
+        self.neighbor_window = int(os.getenv("RETRIEVAL_NEIGHBOR_WINDOW", "1"))
+        if self.links is None and self.expansion != "none":
+            print("⚠️ 索引元数据中没有条文关联信息，检索结果不做扩展，请重新运行 build_faiss_index.py")
+        
+        # 热加载状态
+        self._reload_lock = threading.Lock()
+        self.reload_state: Dict[str, Any] = {"status": "idle", "error": None, "timings": {}, "finished_at": None}
+    
+    # 当前快照的属性（检索过程中需要一致性时应先取 self.snapshot）
+    @property
+    def index(self):
+        return self.snapshot.index
+    
+    @property
+    def metadata(self):
+        return self.snapshot.metadata
+    
+    @property
+    def links(self):
+        return self.snapshot.links
+    
+    @property
+    def use_cosine(self) -> bool:
+        return self.snapshot.use_cosine
+    
+    @property
+    def index_version(self) -> str:
+        return self.snapshot.version
+    
+    def _load_encoder(self):
+        """加载查询编码器，ENCODER_BACKEND=onnx 时使用ONNX Runtime int8推理"""
+        backend = os.getenv("ENCODER_BACKEND", "torch").lower()
+        if backend == "onnx":
+            from onnx_encoder import ONNXEncoder
+            
+            model_dir = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+            quantized = os.getenv("ONNX_QUANTIZED", "true").lower() in ("1", "true", "yes")
+            num_threads = int(os.getenv("ONNX_NUM_THREADS", "0")) or None
+            return ONNXEncoder(model_dir, quantized=quantized, num_threads=num_threads)
         
-        self.index = faiss.read_index(index_path)
+        from sentence_transformers import SentenceTransformer
         
-        with open(metadata_path, 'rb') as f:
-            self.metadata = pickle.load(f)
+        return SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
     
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """搜索相关法条"""
-        query_vec = self.model.encode([query])
-        distances, indices = self.index.search(np.array(query_vec), k)
+    def reload(self, index_path: str = None, metadata_path: str = None,
+               warmup_query: str = "劳动合同解除的法律规定") -> bool:
+        """加载新的索引与元数据并原子替换当前快照（阻塞，调用方应在后台线程中执行）
+        
+        已有重新加载在进行时返回 False。加载失败时保留旧快照并抛出异常。
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        
+        self.reload_state.update(status="loading", error=None)
+        try:
+            start = time.perf_counter()
+            snapshot = IndexSnapshot(
+                _resolve_data_path(index_path or self.index_path),
+                _resolve_data_path(metadata_path or self.metadata_path)
+            )
+            timings = dict(snapshot.load_timings)
+            
+            # 替换前先用新快照跑一次检索
+            if warmup_query:
+                warmup_start = time.perf_counter()
+                self.search(warmup_query, k=3, snapshot=snapshot)
+                timings["warmup"] = time.perf_counter() - warmup_start
+            
+            previous = self.snapshot
+            self.snapshot = snapshot
+            self.index_path, self.metadata_path = snapshot.index_path, snapshot.metadata_path
+            # 缓存键包含版本号，旧条目不会再命中，这里直接清空释放内存（查询向量缓存与索引无关，保留）
+            if previous.version != snapshot.version:
+                self.result_cache.clear()
+            
+            timings["total"] = time.perf_counter() - start
+            self.reload_state.update(
+                status="idle", timings=timings, finished_at=datetime.now().isoformat(),
+                previous_version=previous.version
+            )
+            print(f"✅ 索引已切换: {previous.version} -> {snapshot.version} ({timings['total']:.2f}s)")
+            return True
+        except Exception as e:
+            self.reload_state.update(status="failed", error=str(e), finished_at=datetime.now().isoformat())
+            print(f"❌ 索引重新加载失败，继续使用 {self.snapshot.version}: {e}")
+            raise
+        finally:
+            self._reload_lock.release()
+    
+    def check_filters(self, filters: Optional[Dict[str, Any]]) -> int:
+        """校验过滤条件（格式错误或索引缺少字段时抛出 ValueError），返回匹配的条文数"""
+        snapshot = self.snapshot
+        filters = normalize_filters(filters)
+        if not filters:
+            return len(snapshot.metadata)
+        return snapshot.filter_index.selector(filters)[0]
+    
+    def _search_params(self, snapshot: IndexSnapshot, filters: Dict[str, Any]):
+        """把过滤条件转换为 FAISS 搜索参数，返回 (匹配条数, 参数)"""
+        import faiss
+        
+        count, selector, bitmap = snapshot.filter_index.selector(filters)
+        if hasattr(snapshot.index, "hnsw"):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=snapshot.index.hnsw.efSearch)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        # 搜索期间保持 selector 与位图存活（缓存淘汰时不会被回收）
+        params.referenced_objects = [selector, bitmap]
+        return count, params
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """编码查询（1×d 的 float32 数组），按归一化后的查询缓存"""
+        key = normalize_query(query)
+        if self.embedding_cache.enabled:
+            cached = self.embedding_cache.get(key)
+            record_cache_lookup("embeddings", cached is not None)
+            if cached is not None:
+                return cached.copy()
+        
+        with span("encode"), time_stage("encode"):
+            query_vec = np.ascontiguousarray(self.encoder.encode([query]), dtype=np.float32)
+        self.embedding_cache.set(key, query_vec.copy())
+        return query_vec
+    
+    def search(self, query: str, k: int = 5, min_score: float = None,
+               filters: Optional[Dict[str, Any]] = None,
+               snapshot: Optional[IndexSnapshot] = None) -> List[Dict[str, Any]]:
+        """搜索相关法条，丢弃余弦相似度低于 min_score（默认 RETRIEVAL_MIN_SCORE）的结果；
+        filters 限定法规名称、文件名、类别、章节、施行日期（见 search_filters.FILTER_FIELDS）；
+        snapshot 默认为当前快照"""
+        if snapshot is None:
+            snapshot = self.snapshot
+        if min_score is None:
+            min_score = self.min_score
+        
+        params = None
+        filters = normalize_filters(filters)
         
+        # 相同（归一化后的）查询、k、阈值、过滤条件与索引版本直接返回缓存结果
+        cache_key = (normalize_query(query), k, min_score, tuple(sorted(filters.items())), snapshot.version)
+        if self.result_cache.enabled:
+            cached = self.result_cache.get(cache_key)
+            record_cache_lookup("search_results", cached is not None)
+            if cached is not None:
+                return [dict(result) for result in cached]
+        
+        if filters:
+            count, params = self._search_params(snapshot, filters)
+            if count == 0:
+                return []
+        
+        query_vec = self.encode_query(query)
+        if snapshot.use_cosine:
+            query_vec /= np.clip(np.linalg.norm(query_vec, axis=1, keepdims=True), 1e-12, None)
+        with span("vector_search", k=k, filtered=bool(filters)) as search_span, time_stage("vector_search"):
+            if params is None:
+                scores, indices = snapshot.index.search(query_vec, k)
+            else:
+                scores, indices = snapshot.index.search(query_vec, k, params=params)
+        
+        metadata = snapshot.metadata
         results = []
-        for idx, i in enumerate(indices[0]):
-            if i < len(self.metadata):
-                results.append({
-                    'content': self.metadata[i]['content'],
-                    'filename': self.metadata[i]['filename'],
-                    'score': 1 / (1 + distances[0][idx]),
-                    'distance': distances[0][idx]
-                })
+        for score, i in zip(scores[0], indices[0]):
+            # 结果不足 k 条时 FAISS 用 -1 填充
+            if i < 0 or i >= len(metadata):
+                continue
+            if snapshot.use_cosine:
+                if score < min_score:
+                    continue
+                score, distance = float(score), 1.0 - float(score)
+            else:
+                score, distance = 1 / (1 + float(score)), float(score)
+            record = metadata[i]
+            results.append({
+                'id': int(i),
+                'content': record['content'],
+                'filename': record['filename'],
+                'score': score,
+                'distance': distance
+            })
         
+        if search_span:
+            search_span.set_attribute("hits", len(results))
+        self.result_cache.set(cache_key, [dict(result) for result in results])
         return results
+    
+    def expand(self, results: List[Dict[str, Any]], mode: str = None, window: int = None,
+               snapshot: Optional[IndexSnapshot] = None) -> List[Dict[str, Any]]:
+        """把命中的小段扩展为完整条文（parent）或连同同章内前后 window 条（neighbors）
+        
+        多个命中落在同一条文时只保留分数最高的一个；原始命中段保存在 matched_content 中。
+        snapshot 需与产生 results 的检索使用同一个快照。
+        """
+        if snapshot is None:
+            snapshot = self.snapshot
+        mode = (mode or self.expansion).lower()
+        if mode == "none" or snapshot.links is None:
+            return results
+        if window is None:
+            window = self.neighbor_window
+        
+        links = snapshot.links
+        covered = set()
+        expanded = []
+        for result in results:
+            i = result["id"]
+            start = int(links["parent_start"][i])
+            articles = [start]
+            if mode == "neighbors":
+                chapter_start, chapter_end = int(links["chapter_start"][i]), int(links["chapter_end"][i])
+                prev_id = next_id = start
+                for _ in range(window):
+                    prev_id = int(links["prev_id"][prev_id])
+                    if prev_id < chapter_start:
+                        break
+                    articles.insert(0, prev_id)
+                for _ in range(window):
+                    next_id = int(links["next_id"][next_id])
+                    if next_id < 0 or next_id >= chapter_end:
+                        break
+                    articles.append(next_id)
+            
+            articles = [a for a in articles if a not in covered]
+            if not articles:
+                continue
+            covered.update(articles)
+            expanded.append({
+                **result,
+                "content": "\n".join(snapshot.article_text(a) for a in articles),
+                "matched_content": result["content"],
+                "article_ids": articles
+            })
+        return expanded
+    
+    def passages(self, ids: List[int], version: str) -> List[str]:
+        """按检索结果的行号取回法条文本（会话中只保存行号）；索引已热加载为其他版本时行号失效，返回空列表"""
+        snapshot = self.snapshot
+        if not ids or version != snapshot.version:
+            return []
+        if self.expansion != "none" and snapshot.links is not None:
+            return [snapshot.article_text(int(snapshot.links["parent_start"][i])) for i in ids]
+        return [snapshot.content(i) for i in ids]
 
 class RetrievalAgent:
     """检索Agent"""
     
-    def __init__(self, retriever: FAISSRetriever):
+    def __init__(self, retriever: FAISSRetriever, condenser: Optional[QueryCondenser] = None):
         self.retriever = retriever
+        self.condenser = condenser
+        # 每次问答送入LLM的法条数
+        self.top_k = 3
+        # 扩展为完整条文后允许更长的上下文
+        self.max_chars = int(os.getenv("RETRIEVAL_CONTEXT_CHARS", "500" if retriever.links is None else "1500"))
     
-    def retrieve_relevant_laws(self, query: str, context: ConversationContext) -> str:
+    def retrieve_relevant_laws(self, query: str, context: ConversationContext,
+                               filters: Optional[Dict[str, Any]] = None) -> str:
         """检索相关法条"""
-        # 结合上下文优化检索查询
-        enhanced_query = query
-        if context.current_topic:
-            enhanced_query = f"{context.current_topic} {query}"
+        return self.retrieve(query, context, filters)[0]
+    
+    def retrieve(self, query: str, context: ConversationContext,
+                 filters: Optional[Dict[str, Any]] = None) -> Tuple[str, List[int], List[float]]:
+        """检索相关法条，返回 (送入LLM的法条文本, 命中条文的ID, 相关度评分)"""
+        # 结合对话话题把追问改写为独立查询
+        enhanced_query = self.condense(query, context)
         
-        results = self.retriever.search(enhanced_query, k=3)
+        # 检索与扩展使用同一个索引快照（期间发生热加载也不会错位）
+        snapshot = self.retriever.snapshot
+        results = self.retriever.search(enhanced_query, k=self.top_k, filters=filters, snapshot=snapshot)
+        article_ids = [result['id'] for result in results]
+        scores = [result['score'] for result in results]
+        with span("expand"):
+            results = self.retriever.expand(results, snapshot=snapshot)
         
         # 格式化检索结果
         formatted_results = []
         for result in results:
-            formatted_results.append(f"法条内容: {result['content'][:500]}...")
+            formatted_results.append(f"法条内容: {result['content'][:self.max_chars]}...")
+        if not formatted_results:
+            formatted_results.append("未检索到相关度足够的法条")
         
-        # 更新上下文
-        context.retrieved_context = [r['content'] for r in results]
+        # 更新上下文（只记行号，文本在元数据中）
+        context.retrieved_ids = [result['id'] for result in results]
+        context.retrieved_version = snapshot.version
         context.last_query = query
         
-        return "\n\n".join(formatted_results)
+        return "\n\n".join(formatted_results), article_ids, scores
+    
+    def condense(self, query: str, context: ConversationContext) -> str:
+        """返回用于检索的查询（未启用改写时为原问题），同时更新 context.current_topic"""
+        if self.condenser is None:
+            return query
+        with span("condense") as condense_span:
+            condensed = self.condenser.condense(query, context)
+            if condense_span:
+                condense_span.set_attribute("rewritten", condensed.rewritten)
+                condense_span.set_attribute("topic", condensed.topic)
+        return condensed.query
     
-    def display_search_results(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+    def display_search_results(self, query: str, k: int = 5, min_score: float = None,
+                               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """展示检索结果的详细信息"""
-        results = self.retriever.search(query, k=k)
+        results = self.retriever.search(query, k=k, min_score=min_score, filters=filters)
         
         print(f"\n📋 检索结果 (共找到 {len(results)} 条相关法条):")
         print("=" * 80)
@@ -139,45 +653,104 @@ class RetrievalAgent:
         
         return results
 
+# 问答的 system 提示在所有请求中保持不变，作为可缓存的公共前缀
+QA_SYSTEM_PROMPT = """你是一个专业的法律咨询助手。每个问题都附有检索到的相关法条，请根据相关法条，结合之前的对话，给出准确、专业的法律建议。如果法条不足以完全回答问题，请明确说明。
+不要使用md格式，纯文本输出"""
+QA_USER_TEMPLATE = """相关法条：
+{context}
+
+问题：{question}"""
+
 class QAAgent:
     """问答Agent"""
     
-    def __init__(self, llm):
+    def __init__(self, llm, router: Optional[ModelRouter] = None):
         self.llm = llm
-        self.qa_prompt = PromptTemplate(
-            input_variables=["context", "history", "question"],
-            template="""你是一个专业的法律咨询助手。基于以下信息回答问题：
-
-对话历史：
-{history}
-
-相关法条：
-{context}
-
-问题：{question}
-
-请根据相关法条，结合对话历史，给出准确、专业的法律建议。如果法条不足以完全回答问题，请明确说明。
-不要使用md格式，纯文本输出
-回答："""
-        )
-        self.qa_chain = LLMChain(llm=self.llm, prompt=self.qa_prompt)
+        self.router = router
+        self.history_turns = int(os.getenv("QA_HISTORY_TURNS", "6"))
+    
+    def build_messages(self, question: str, context: ConversationContext, retrieved_context: str) -> list:
+        """按前缀缓存友好的顺序组织消息：固定的 system 提示 → 只追加的对话历史 → 本轮法条与问题
+        
+        每轮变化的内容都在最后，多轮对话中前面的部分逐字不变，服务端的 prompt/KV 前缀缓存可以复用。
+        """
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+        
+        messages = [SystemMessage(content=QA_SYSTEM_PROMPT)]
+        for msg in context.stable_history(self.history_turns):
+            if msg.role is Role.USER:
+                messages.append(HumanMessage(content=msg.content))
+            elif msg.role is Role.ASSISTANT:
+                messages.append(AIMessage(content=msg.content))
+        messages.append(HumanMessage(content=QA_USER_TEMPLATE.format(context=retrieved_context, question=question)))
+        return messages
     
     def answer_question(self, question: str, context: ConversationContext, retrieved_context: str) -> str:
         """回答法律问题"""
-        history = context.get_recent_context(3)
+        return "".join(self.stream_answer(question, context, retrieved_context))
+    
+    def stream_answer(self, question: str, context: ConversationContext, retrieved_context: str,
+                      decision: Optional[RouteDecision] = None) -> Iterator[str]:
+        """流式回答法律问题，逐段返回；decision 决定使用快速模型还是大模型"""
+        with span("prompt_build"), time_stage("prompt_build"):
+            messages = self.build_messages(question, context, retrieved_context)
         print(retrieved_context)
-        response = self.qa_chain.invoke({
-            "context": retrieved_context,
-            "history": history,
-            "question": question
-        })
         
-        return response["text"]
+        route = decision.route if decision is not None else "strong"
+        llm = self.router.llm_for(decision) if self.router is not None and decision is not None else self.llm
+        ROUTE_REQUESTS.inc(route=route)
+        
+        # 以流式方式调用，记录首token延迟与总耗时
+        count = 0
+        usage = None
+        completion_chars = 0
+        start = time.perf_counter()
+        with span("llm") as llm_span, LLM_INFLIGHT.track_inprogress(agent="qa"):
+            if llm_span:
+                llm_span.set_attribute("route", route)
+            for chunk in llm.stream(messages):
+                if not count:
+                    ttft = time.perf_counter() - start
+                    observe_stage("llm_ttft", ttft)
+                    ROUTE_LATENCY.observe(ttft, route=route, phase="ttft")
+                    if llm_span:
+                        llm_span.set_attribute("ttft_ms", round(ttft * 1000, 1))
+                count += 1
+                completion_chars += len(chunk.content)
+                # 服务端返回用量时（通常在最后一段）以其为准
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk.content
+            if llm_span:
+                llm_span.set_attribute("chunks", count)
+        elapsed = time.perf_counter() - start
+        observe_stage("llm_total", elapsed)
+        ROUTE_LATENCY.observe(elapsed, route=route, phase="total")
+        
+        if usage:
+            prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+            # 命中服务端前缀缓存的 prompt token（服务端支持时返回）
+            cached_tokens = (usage.get("input_token_details") or {}).get("cache_read") or 0
+            LLM_TOKENS.inc(cached_tokens, route=route, kind="cached_prompt")
+            if prompt_tokens:
+                PROMPT_CACHE_RATIO.observe(cached_tokens / prompt_tokens, route=route,
+                                           turn="follow_up" if context.history else "first")
+            if llm_span:
+                llm_span.set_attribute("prompt_tokens", prompt_tokens)
+                llm_span.set_attribute("cached_tokens", cached_tokens)
+        else:
+            prompt_tokens = estimate_tokens(sum(len(str(m.content)) for m in messages))
+            completion_tokens = estimate_tokens(completion_chars)
+        LLM_TOKENS.inc(prompt_tokens, route=route, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, route=route, kind="completion")
+        if self.router is not None:
+            LLM_COST.inc(self.router.cost(route, prompt_tokens + completion_tokens), route=route)
 
 class SummaryAgent:
     """总结Agent"""
     
     def __init__(self, llm):
+        from langchain.prompts import PromptTemplate
+        
         self.llm = llm
         self.summary_prompt = PromptTemplate(
             input_variables=["conversation", "key_points"],
@@ -196,23 +769,48 @@ class SummaryAgent:
 
 总结："""
         )
-        self.summary_chain = LLMChain(llm=self.llm, prompt=self.summary_prompt)
     
-    def summarize_conversation(self, context: ConversationContext) -> str:
-        """总结对话内容"""
+    def stream_summary(self, context: ConversationContext, key_points: Optional[List[str]] = None) -> Iterator[str]:
+        """流式生成对话总结，逐段返回文本；key_points 为最近检索到的法条"""
+        from langchain_core.messages import HumanMessage
+        
         conversation = "\n".join([
-            f"{msg['role']}: {msg['content']}" 
+            f"{msg.role.value}: {msg.content}" 
             for msg in context.history
         ])
         
-        key_points = "\n".join(context.retrieved_context[:3])
+        key_points = "\n".join((key_points or [])[:3])
+        prompt = self.summary_prompt.format(conversation=conversation, key_points=key_points)
         
-        summary = self.summary_chain.invoke({
-            "conversation": conversation,
-            "key_points": key_points
-        })
-        
-        return summary["text"]
+        with span("summary_llm"), time_stage("summary_llm"), LLM_INFLIGHT.track_inprogress(agent="summary"):
+            for chunk in self.llm.stream([HumanMessage(content=prompt)]):
+                if chunk.content:
+                    yield chunk.content
+    
+    def summarize_conversation(self, context: ConversationContext, key_points: Optional[List[str]] = None) -> str:
+        """总结对话内容"""
+        return "".join(self.stream_summary(context, key_points))
+
+def create_chat_llm(api_key: str, base_url: str, model_name: str, callbacks: Optional[list] = None):
+    """创建流式 ChatOpenAI
+    
+    LLM_STREAM_USAGE=true（默认）时请求流式用量（stream_options.include_usage），最后一段带有
+    prompt/completion token 数及命中前缀缓存的 token 数；服务端不支持该参数时设为 false。
+    """
+    from langchain_openai import ChatOpenAI
+    
+    model_kwargs = {}
+    if os.getenv("LLM_STREAM_USAGE", "true").lower() in ("1", "true", "yes"):
+        model_kwargs["stream_options"] = {"include_usage": True}
+    return ChatOpenAI(
+        openai_api_key=api_key,
+        base_url=base_url,
+        model_name=model_name,
+        temperature=0.1,
+        streaming=True,
+        callbacks=callbacks,
+        model_kwargs=model_kwargs
+    )
 
 class LegalConsultationSystem:
     """法律咨询系统主类"""
@@ -232,18 +830,39 @@ class LegalConsultationSystem:
         return os.path.join(project_root, relative_path)
     
     def __init__(self, openai_api_key: str, index_path: str = None, metadata_path: str = None):
+        from langchain.memory import ConversationBufferWindowMemory
+        from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+        
+        # 各启动阶段耗时（秒）
+        self.startup_timings: Dict[str, float] = {}
+        
         # 初始化LLM
+        start = time.perf_counter()
         base_url = os.getenv("OPENAI_BASE_URL", "https://api.siliconflow.cn/v1")
         model_name = os.getenv("OPENAI_MODEL", "Tongyi-Zhiwen/QwenLong-L1-32B")
         
-        self.llm = ChatOpenAI(
-            openai_api_key=openai_api_key,
-            base_url=base_url,
-            model_name=model_name,
-            temperature=0.1,
-            streaming=True,
-            callbacks=[StreamingStdOutCallbackHandler()]
-        )
+        self.llm = create_chat_llm(openai_api_key, base_url, model_name, [StreamingStdOutCallbackHandler()])
+        
+        # 问答经由多后端LLM池：OPENAI_* 为首选后端，LLM_BACKENDS（JSON 列表）配置备用后端，
+        # 用于首token超时的对冲请求与出错时的故障转移（见 llm_pool.py）
+        failure_threshold = int(os.getenv("LLM_FAILURE_THRESHOLD", "3"))
+        cooldown = float(os.getenv("LLM_COOLDOWN", "30"))
+        backends = [Backend("primary", self.llm, failure_threshold, cooldown)]
+        for i, spec in enumerate(json.loads(os.getenv("LLM_BACKENDS") or "[]"), 1):
+            backend_llm = create_chat_llm(spec.get("api_key", openai_api_key), spec["base_url"],
+                                          spec.get("model", model_name))
+            backends.append(Backend(spec.get("name", f"backup{i}"), backend_llm, failure_threshold, cooldown))
+        self.llm_pool = LLMPool(backends)
+        
+        # 配置 OPENAI_FAST_MODEL 后，简单的法条查询交给快速模型（见 model_router.py）
+        self.fast_llm = None
+        fast_model_name = os.getenv("OPENAI_FAST_MODEL")
+        if fast_model_name:
+            self.fast_llm = create_chat_llm(os.getenv("OPENAI_FAST_API_KEY", openai_api_key),
+                                            os.getenv("OPENAI_FAST_BASE_URL", base_url),
+                                            fast_model_name, [StreamingStdOutCallbackHandler()])
+        self.router = ModelRouter(fast_llm=self.fast_llm, strong_llm=self.llm_pool)
+        self.startup_timings["llm"] = time.perf_counter() - start
         
         # 获取数据文件路径
         if index_path is None:
@@ -253,9 +872,20 @@ class LegalConsultationSystem:
         
         # 初始化各个Agent
         self.retriever = FAISSRetriever(index_path, metadata_path)
-        self.retrieval_agent = RetrievalAgent(self.retriever)
-        self.qa_agent = QAAgent(self.llm)
-        self.summary_agent = SummaryAgent(self.llm)
+        self.startup_timings.update(self.retriever.load_timings)
+        
+        start = time.perf_counter()
+        # QUERY_REWRITE=false 时追问按原文检索
+        self.condenser = None
+        if os.getenv("QUERY_REWRITE", "true").lower() in ("1", "true", "yes"):
+            self.condenser = QueryCondenser(self.retriever)
+        self.retrieval_agent = RetrievalAgent(self.retriever, self.condenser)
+        self.qa_agent = QAAgent(self.llm_pool, self.router)
+        self.summary_agent = SummaryAgent(self.llm_pool)
+        self.startup_timings["agents"] = time.perf_counter() - start
+        
+        # 同时到达的相同问题（无对话历史）共用一次LLM生成
+        self.single_flight = SingleFlight()
         
         # 上下文管理
         self.context = ConversationContext()
@@ -267,56 +897,61 @@ class LegalConsultationSystem:
             memory_key="chat_history"
         )
     
-    def process_query(self, query: str) -> str:
-        """处理用户查询"""
-        try:
-            # 1. 检索相关法条
-            print("🔍 正在检索相关法条...")
-            retrieved_context = self.retrieval_agent.retrieve_relevant_laws(query, self.context)
-            
-            # 2. 生成回答
-            print("🤖 正在生成法律建议...")
-            answer = self.qa_agent.answer_question(query, self.context, retrieved_context)
-            
-            # 3. 更新上下文
-            self.context.add_message("user", query)
-            self.context.add_message("assistant", answer)
-            
-            # 4. 更新记忆
-            self.memory.save_context({"input": query}, {"output": answer})
-            
-            return answer
-            
-        except Exception as e:
-            error_msg = f"处理查询时发生错误: {str(e)}"
-            print(f"❌ {error_msg}")
-            return error_msg
+    def process_query(self, query: str, context: Optional[ConversationContext] = None,
+                      filters: Optional[Dict[str, Any]] = None) -> str:
+        """处理用户查询
+        
+        context 为 None 时使用系统自身的上下文；API 服务按会话传入各自的上下文，
+        避免并发请求共用 self.context。filters 限定检索范围（见 FAISSRetriever.search）。
+        """
+        return self.process_query_with_display(query, show_results=False, context=context, filters=filters)
     
-    def search_and_display(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+    def search_and_display(self, query: str, k: int = 5, min_score: float = None,
+                           filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """搜索并展示法律文档检索结果"""
-        return self.retrieval_agent.display_search_results(query, k)
+        return self.retrieval_agent.display_search_results(query, k, min_score, filters)
     
-    def process_query_with_display(self, query: str, show_results: bool = True) -> str:
+    def prefetch(self, query: str, context: Optional[ConversationContext] = None,
+                 filters: Optional[Dict[str, Any]] = None) -> str:
+        """预取检索（用户输入过程中调用）：按提交时相同的改写与参数检索一次，
+        填充查询向量与检索结果缓存，提交后检索阶段直接命中缓存。不调用LLM。
+        
+        在上下文副本上改写，不修改会话话题。返回实际检索的查询。
+        """
+        context = replace(context if context is not None else self.context)
+        search_query = self.retrieval_agent.condense(query, context)
+        self.retriever.search(search_query, k=self.retrieval_agent.top_k, filters=filters)
+        return search_query
+    
+    def warm_up(self, query: str = "劳动合同解除的法律规定") -> float:
+        """预热编码器与索引（不调用LLM），返回耗时（秒）"""
+        start = time.perf_counter()
+        self.retriever.search(query, k=3)
+        if self.condenser is not None:
+            # 提前建立法规名称表
+            self.condenser.law_names()
+        elapsed = time.perf_counter() - start
+        self.startup_timings["warmup"] = elapsed
+        return elapsed
+    
+    def process_query_with_display(self, query: str, show_results: bool = True,
+                                   context: Optional[ConversationContext] = None,
+                                   filters: Optional[Dict[str, Any]] = None) -> str:
         """处理查询并可选择展示检索结果"""
+        if context is None:
+            context = self.context
+        
         try:
-            # 1. 检索并展示相关法条
-            print("🔍 正在检索相关法条...")
-            if show_results:
-                self.search_and_display(query, k=3)
-            
-            retrieved_context = self.retrieval_agent.retrieve_relevant_laws(query, self.context)
+            retrieved_context, flight_key, decision = self.prepare_query(query, show_results, context, filters)
             
             # 2. 生成回答
             print("🤖 正在生成法律建议...")
-            answer = self.qa_agent.answer_question(query, self.context, retrieved_context)
-            
-            # 3. 更新上下文
-            self.context.add_message("user", query)
-            self.context.add_message("assistant", answer)
-            
-            # 4. 更新记忆
-            self.memory.save_context({"input": query}, {"output": answer})
+            with span("qa"), time_stage("qa"):
+                stream, _ = self.answer_stream(query, context, retrieved_context, flight_key, decision)
+                answer = "".join(stream)
             
+            # 3. 更新上下文与记忆
+            self.complete_turn(query, answer, context)
             return answer
             
         except Exception as e:
@@ -324,12 +959,80 @@ class LegalConsultationSystem:
             print(f"❌ {error_msg}")
             return error_msg
     
-    def get_conversation_summary(self) -> str:
+    def prepare_query(self, query: str, show_results: bool = True,
+                      context: Optional[ConversationContext] = None,
+                      filters: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[tuple], RouteDecision]:
+        """检索阶段：返回 (送入LLM的法条文本, 合并键, 模型路由)
+        
+        没有对话历史时回答只取决于问题、检索到的法条和所用模型，合并键为
+        (归一化问题, 法条ID, 索引版本, 路由)；有历史的请求不参与合并，合并键为 None。
+        """
+        if context is None:
+            context = self.context
+        
+        # 1. 检索并展示相关法条
+        print("🔍 正在检索相关法条...")
+        if show_results:
+            with span("display_search"):
+                self.search_and_display(self.retrieval_agent.condense(query, context),
+                                        k=self.retrieval_agent.top_k, filters=filters)
+        
+        with span("retrieval"), time_stage("retrieval"):
+            retrieved_context, article_ids, scores = self.retrieval_agent.retrieve(query, context, filters)
+        
+        # 按检索置信度、问题长度与对话轮数选择模型
+        history_turns = context.message_count // 2
+        decision = self.router.route(query, history_turns, scores, cosine=self.retriever.use_cosine)
+        
+        flight_key = None
+        if not context.message_count:
+            flight_key = (normalize_query(query), tuple(article_ids), self.retriever.index_version, decision.route)
+        return retrieved_context, flight_key, decision
+    
+    def answer_stream(self, query: str, context: ConversationContext, retrieved_context: str,
+                      flight_key: Optional[tuple] = None,
+                      decision: Optional[RouteDecision] = None) -> Tuple[SharedStream, bool]:
+        """生成阶段：返回 (token 流, 是否与进行中的相同请求合并)
+        
+        LLM 在后台线程中生成；flight_key 相同的并发请求共用同一次生成，后到的请求从头回放。
+        """
+        history_free = ConversationContext() if flight_key is not None else context
+        stream, leader = self.single_flight.stream(
+            flight_key, lambda: self.qa_agent.stream_answer(query, history_free, retrieved_context, decision)
+        )
+        if flight_key is not None:
+            record_cache_lookup("single_flight", not leader)
+        return stream, not leader
+    
+    def complete_turn(self, query: str, answer: str, context: Optional[ConversationContext] = None):
+        """一轮问答结束后记录对话"""
+        if context is None:
+            context = self.context
+        
+        context.add_message("user", query)
+        context.add_message("assistant", answer)
+        
+        if context is self.context:
+            self.memory.save_context({"input": query}, {"output": answer})
+    
+    def get_conversation_summary(self, context: Optional[ConversationContext] = None) -> str:
         """获取对话总结"""
-        if not self.context.history:
-            return "暂无对话记录"
+        if context is None:
+            context = self.context
         
-        return self.summary_agent.summarize_conversation(self.context)
+        return "".join(self.stream_conversation_summary(context))
+    
+    def stream_conversation_summary(self, context: Optional[ConversationContext] = None) -> Iterator[str]:
+        """流式获取对话总结"""
+        if context is None:
+            context = self.context
+        
+        if not context.history:
+            yield "暂无对话记录"
+            return
+        
+        key_points = self.retriever.passages(context.retrieved_ids[:3], context.retrieved_version)
+        yield from self.summary_agent.stream_summary(context, key_points)
     
     def reset_context(self):
         """重置对话上下文"""
@@ -339,30 +1042,29 @@ class LegalConsultationSystem:
     def save_session(self, filepath: str):
         """保存会话"""
         session_data = {
-            "context": self.context.__dict__,
+            "context": self.context.to_dict(),
             "timestamp": datetime.now().isoformat()
         }
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(session_data, f, ensure_ascii=False, indent=2)
     
     def load_session(self, filepath: str):
-        """加载会话"""
+        """加载会话（兼容旧格式的会话文件）"""
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 session_data = json.load(f)
             
             # 恢复上下文
-            context_dict = session_data["context"]
-            self.context = ConversationContext(**context_dict)
+            self.context = ConversationContext.from_dict(session_data["context"])
             
             # 恢复记忆
+            user_msg = ""
             for msg in self.context.history:
-                if msg["role"] == "user":
-                    user_msg = msg["content"]
-                elif msg["role"] == "assistant":
-                    assistant_msg = msg["content"]
-                    self.memory.save_context({"input": user_msg}, {"output": assistant_msg})
+                if msg.role is Role.USER:
+                    user_msg = msg.content
+                else:
+                    self.memory.save_context({"input": user_msg}, {"output": msg.content})
                     
-        except Exception as e:
+        except (OSError, ValueError, KeyError) as e:
             print(f"加载会话失败: {str(e)}")
 
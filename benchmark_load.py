@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+REST API 压测工具（开环、按目标RPS发送）
+
+按固定速率（或泊松到达）向 /query、/search 和会话接口发送请求，问题取自 law_qa_samples_*.csv。
+发送计划与响应无关：服务变慢时不会减少发送量，延迟从"计划发送时间"开始计算，
+避免闭环压测中的 coordinated omission（服务卡顿期间少发请求导致延迟被低估）。
+
+用法:
+    # 先启动模拟LLM与API服务
+    python mock_llm_server.py --port 9000 &
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=mock ./start_system.sh
+
+    # 逐级加压，每级60秒
+    python benchmark_load.py --rps 1 2 4 8 --duration 60 --output logs/benchmark_load.json
+    python benchmark_load.py --rps 5 --mix query=0.5,search=0.4,summary=0.05,list=0.05 --arrival poisson
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmark_retrieval import load_samples
+from legal_client import APIConnectionError, APIError, LegalClient
+
+DEFAULT_MIX = "query=0.6,search=0.3,summary=0.05,list=0.03,reset=0.02"
+
+
+def parse_mix(text: str) -> List[Tuple[str, float]]:
+    """解析 "query=0.6,search=0.4" 形式的请求配比"""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"未知的请求类型: {name}（可选 {', '.join(OPERATIONS)}）")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+# ========================
+# 请求类型
+# ========================
+def op_query(client: LegalClient, question: str, session_id: str) -> Any:
+    return client.query(question, session_id=session_id)
+
+
+def op_search(client: LegalClient, question: str, session_id: str) -> Any:
+    return client.search(question, k=5)
+
+
+def op_summary(client: LegalClient, question: str, session_id: str) -> Any:
+    return client.get_summary(session_id)
+
+
+def op_list(client: LegalClient, question: str, session_id: str) -> Any:
+    return client.list_sessions()
+
+
+def op_reset(client: LegalClient, question: str, session_id: str) -> Any:
+    return client.reset_session(session_id)
+
+
+OPERATIONS: Dict[str, Callable[..., Any]] = {
+    'query': op_query,
+    'search': op_search,
+    'summary': op_summary,
+    'list': op_list,
+    'reset': op_reset,
+}
+
+# 会话还不存在时 summary/reset 会返回404，不计为错误
+EXPECTED_STATUS = {'summary': (200, 404), 'reset': (200, 404)}
+
+
+# ========================
+# 开环调度
+# ========================
+def schedule(rps: float, duration: float, arrival: str, rng: random.Random) -> List[float]:
+    """生成各请求相对开始时间的计划发送时刻"""
+    offsets = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rps) if arrival == 'poisson' else 1 / rps
+        if t >= duration:
+            return offsets
+        offsets.append(t)
+
+
+def run_stage(client: LegalClient, questions: List[str], mix: List[Tuple[str, float]], rps: float,
+              duration: float, sessions: int, arrival: str, max_workers: int, seed: int) -> List[Dict[str, Any]]:
+    """以 rps 的速率运行 duration 秒，返回每个请求的记录"""
+    rng = random.Random(seed)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    session_ids = [f"loadtest-{seed}-{i}" for i in range(sessions)]
+
+    records: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+
+    def fire(operation: str, question: str, session_id: str, intended: float):
+        started = time.perf_counter()
+        status, error = None, None
+        try:
+            OPERATIONS[operation](client, question, session_id)
+            status = 200
+        except APIError as e:
+            status = e.status_code
+            if status not in EXPECTED_STATUS.get(operation, (200,)):
+                error = f"HTTP {status}"
+        except APIConnectionError as e:
+            error = type(e.__cause__).__name__
+        finished = time.perf_counter()
+        with lock:
+            records.append({
+                'operation': operation,
+                'intended': intended,
+                # 从计划发送时间算起的延迟（包含在客户端排队的时间）
+                'latency_ms': (finished - intended) * 1000,
+                # 实际发出请求到收到响应的时间
+                'service_ms': (finished - started) * 1000,
+                'send_lag_ms': (started - intended) * 1000,
+                'status': status,
+                'error': error,
+            })
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+    start = time.perf_counter()
+    for offset in schedule(rps, duration, arrival, rng):
+        intended = start + offset
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        operation = rng.choices(names, weights)[0]
+        futures.append(executor.submit(fire, operation, rng.choice(questions), rng.choice(session_ids), intended))
+
+    wait(futures)
+    executor.shutdown()
+
+    for record in records:
+        record['intended'] -= start
+    return records
+
+
+# ========================
+# 统计
+# ========================
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def summarize(records: List[Dict[str, Any]], duration: float, warmup: float) -> Dict[str, Any]:
+    """按请求类型汇总（计划发送时间在预热期内的请求不计入）"""
+    measured = [r for r in records if r['intended'] >= warmup]
+    window = max(duration - warmup, 1e-9)
+
+    def stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ok = [r for r in rows if r['error'] is None]
+        latencies = sorted(r['latency_ms'] for r in ok)
+        service = sorted(r['service_ms'] for r in ok)
+        errors: Dict[str, int] = {}
+        for r in rows:
+            if r['error']:
+                errors[r['error']] = errors.get(r['error'], 0) + 1
+        return {
+            'requests': len(rows),
+            'ok': len(ok),
+            'error_rate': (len(rows) - len(ok)) / len(rows) if rows else 0.0,
+            'errors': errors,
+            'throughput_rps': len(ok) / window,
+            'latency_p50_ms': statistics.median(latencies) if latencies else 0.0,
+            'latency_p90_ms': percentile(latencies, 0.90),
+            'latency_p95_ms': percentile(latencies, 0.95),
+            'latency_p99_ms': percentile(latencies, 0.99),
+            'latency_max_ms': latencies[-1] if latencies else 0.0,
+            'service_p50_ms': statistics.median(service) if service else 0.0,
+            'service_p99_ms': percentile(service, 0.99),
+        }
+
+    report = {'all': stats(measured)}
+    for operation in sorted({r['operation'] for r in measured}):
+        report[operation] = stats([r for r in measured if r['operation'] == operation])
+    lags = sorted(r['send_lag_ms'] for r in measured)
+    report['all']['client_send_lag_p99_ms'] = percentile(lags, 0.99)
+    return report
+
+
+def print_stage(rps: float, summary: Dict[str, Any]):
+    print(f"\n目标 {rps} RPS")
+    print(f"{'类型':<10}{'请求':>7}{'错误率':>8}{'吞吐':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'服务p50':>10}")
+    for name, s in summary.items():
+        print(f"{name:<10}{s['requests']:>7}{s['error_rate']:>8.1%}{s['throughput_rps']:>8.2f}"
+              f"{s['latency_p50_ms']:>10.0f}{s['latency_p95_ms']:>10.0f}{s['latency_p99_ms']:>10.0f}"
+              f"{s['latency_max_ms']:>10.0f}{s['service_p50_ms']:>10.0f}")
+    if summary['all']['client_send_lag_p99_ms'] > 50:
+        print(f"⚠️ 客户端发送延迟 p99 {summary['all']['client_send_lag_p99_ms']:.0f}ms，"
+              f"请增大 --max-workers（延迟仍按计划发送时间计算）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="法律咨询API开环压测")
+    parser.add_argument('--api-url', default=os.getenv("API_URL", "http://localhost:8000"))
+    parser.add_argument('--rps', type=float, nargs='+', default=[1.0], help='目标RPS，多个值时逐级加压')
+    parser.add_argument('--duration', type=float, default=60, help='每级持续秒数')
+    parser.add_argument('--warmup', type=float, default=5, help='每级开头不计入统计的秒数')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'请求配比（默认 {DEFAULT_MIX}）')
+    parser.add_argument('--arrival', choices=['constant', 'poisson'], default='constant', help='到达间隔分布')
+    parser.add_argument('--sessions', type=int, default=20, help='轮换使用的会话数')
+    parser.add_argument('--csv', nargs='+', default=['law_qa_samples_100.csv'])
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--max-workers', type=int, default=512, help='发送线程数上限')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    questions = [s['question'] for s in load_samples(args.csv)]
+    # 压测要看到服务端的真实状态码，不重试
+    client = LegalClient(args.api_url, timeout=args.timeout, max_connections=args.max_workers, retries=0)
+
+    try:
+        client.ready()
+    except (APIError, APIConnectionError) as e:
+        print(f"❌ 服务未就绪: {e}")
+        return
+
+    print(f"📋 {len(questions)} 个问题，配比 {args.mix}，{args.arrival} 到达，每级 {args.duration}s")
+
+    stages = []
+    for i, rps in enumerate(args.rps):
+        print(f"🚀 {rps} RPS ...")
+        records = run_stage(client, questions, mix, rps, args.duration, args.sessions,
+                            args.arrival, args.max_workers, args.seed + i)
+        summary = summarize(records, args.duration, args.warmup)
+        print_stage(rps, summary)
+        stages.append({'target_rps': rps, 'summary': summary})
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'api_url': client.base_url,
+                'config': {k: v for k, v in vars(args).items() if k != 'output'},
+                'stages': stages,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
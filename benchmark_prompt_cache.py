@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+多轮对话的前缀缓存基准测试
+
+把 law_qa_samples_*.csv 中相邻的问题组成若干多轮会话，分别用旧的 prompt 结构
+（历史、法条、问题拼在一条消息里，历史为最近3轮的滑动窗口）和 QAAgent 当前的结构
+（固定 system 提示 → 只追加的历史 → 本轮法条与问题）逐轮调用LLM，按轮次统计：
+- 首token延迟
+- prompt token 数与命中服务端前缀缓存的比例（usage.prompt_tokens_details.cached_tokens）
+
+服务端需支持 stream_options.include_usage；不返回 cached_tokens 时缓存比例记为 0。
+没有真实LLM时可以用模拟服务（按整条消息模拟前缀缓存，未命中部分按速度增加首token延迟）：
+    python mock_llm_server.py --port 9000 --prefill-tokens-per-sec 2000 &
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=mock python benchmark_prompt_cache.py
+
+用法:
+    python benchmark_prompt_cache.py --sessions 5 --turns 6 --output bench/prompt_cache.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+from benchmark_retrieval import get_data_file_path, load_samples
+
+# 加载环境变量
+load_dotenv()
+
+# 调整前的 QA prompt，用于对比
+LEGACY_TEMPLATE = """你是一个专业的法律咨询助手。基于以下信息回答问题：
+
+对话历史：
+{history}
+
+相关法条：
+{context}
+
+问题：{question}
+
+请根据相关法条，结合对话历史，给出准确、专业的法律建议。如果法条不足以完全回答问题，请明确说明。
+不要使用md格式，纯文本输出
+回答："""
+
+ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+def build_messages(layout: str, qa_agent, question: str, context, retrieved_context: str) -> List[Dict[str, str]]:
+    if layout == "legacy":
+        content = LEGACY_TEMPLATE.format(history=context.get_recent_context(3), context=retrieved_context,
+                                         question=question)
+        return [{"role": "user", "content": content}]
+    return [{"role": ROLES[m.type], "content": m.content}
+            for m in qa_agent.build_messages(question, context, retrieved_context)]
+
+
+def call_llm(client, model: str, messages: List[Dict[str, str]], max_tokens: int) -> Tuple[float, str, Any]:
+    """流式调用，返回 (首token耗时, 回答, usage)"""
+    start = time.perf_counter()
+    ttft = None
+    chunks = []
+    usage = None
+    stream = client.chat.completions.create(
+        model=model, messages=messages, temperature=0.1, max_tokens=max_tokens,
+        stream=True, stream_options={"include_usage": True}
+    )
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks.append(chunk.choices[0].delta.content)
+    return ttft or (time.perf_counter() - start), "".join(chunks), usage
+
+
+def cached_tokens(usage) -> int:
+    details = getattr(usage, "prompt_tokens_details", None) if usage is not None else None
+    return (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+
+
+def run_session(layout: str, questions: List[str], client, model: str, qa_agent, retrieval_agent,
+                max_tokens: int) -> List[Dict[str, Any]]:
+    from agent import ConversationContext
+
+    context = ConversationContext()
+    rows = []
+    for turn, question in enumerate(questions, 1):
+        if retrieval_agent is not None:
+            retrieved_context = retrieval_agent.retrieve_relevant_laws(question, context)
+        else:
+            retrieved_context = "未检索到相关度足够的法条"
+        messages = build_messages(layout, qa_agent, question, context, retrieved_context)
+        ttft, answer, usage = call_llm(client, model, messages, max_tokens)
+        context.add_message("user", question)
+        context.add_message("assistant", answer)
+        rows.append({
+            "layout": layout,
+            "turn": turn,
+            "ttft_s": ttft,
+            "prompt_tokens": usage.prompt_tokens if usage is not None else 0,
+            "cached_tokens": cached_tokens(usage),
+        })
+    return rows
+
+
+def summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {}
+    for layout in ("legacy", "stable"):
+        by_turn = {}
+        for row in rows:
+            if row["layout"] == layout:
+                by_turn.setdefault(row["turn"], []).append(row)
+        turns = {}
+        for turn, items in sorted(by_turn.items()):
+            prompt = sum(r["prompt_tokens"] for r in items)
+            turns[str(turn)] = {
+                "mean_ttft_s": statistics.fmean(r["ttft_s"] for r in items),
+                "mean_prompt_tokens": prompt / len(items),
+                "cached_ratio": sum(r["cached_tokens"] for r in items) / prompt if prompt else 0.0,
+            }
+        follow_ups = [r for r in rows if r["layout"] == layout and r["turn"] > 1]
+        prompt = sum(r["prompt_tokens"] for r in follow_ups)
+        summary[layout] = {
+            "turns": turns,
+            "follow_up_mean_ttft_s": statistics.fmean(r["ttft_s"] for r in follow_ups) if follow_ups else 0.0,
+            "follow_up_cached_ratio": sum(r["cached_tokens"] for r in follow_ups) / prompt if prompt else 0.0,
+        }
+    return summary
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    from openai import OpenAI
+    from agent import FAISSRetriever, QAAgent, RetrievalAgent
+
+    csv_files = args.csv or sorted(glob.glob(get_data_file_path('law_qa_samples_*.csv')))
+    questions = [s['question'] for s in load_samples(csv_files)]
+    sessions = [questions[i * args.turns:(i + 1) * args.turns] for i in range(args.sessions)]
+    sessions = [s for s in sessions if len(s) == args.turns]
+    print(f"💬 {len(sessions)} 个会话 × {args.turns} 轮")
+
+    retrieval_agent = None
+    if not args.no_retrieval:
+        index_path = get_data_file_path(os.getenv("FAISS_INDEX_PATH", "law_index.bin"))
+        metadata_path = get_data_file_path(os.getenv("METADATA_PATH", "metadata.pkl"))
+        print("🔄 加载检索器...")
+        retrieval_agent = RetrievalAgent(FAISSRetriever(index_path, metadata_path))
+
+    model = args.model or os.getenv("OPENAI_MODEL", "Tongyi-Zhiwen/QwenLong-L1-32B")
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_BASE_URL", "https://api.siliconflow.cn/v1"))
+    # 只用 build_messages，不调用 QAAgent 自带的LLM
+    qa_agent = QAAgent(llm=None)
+
+    rows = []
+    for layout in ("legacy", "stable"):
+        for i, session in enumerate(sessions, 1):
+            print(f"🤖 {layout} 会话 {i}/{len(sessions)}...")
+            rows.extend(run_session(layout, session, client, model, qa_agent, retrieval_agent, args.max_tokens))
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "config": {
+            "model": model,
+            "base_url": os.getenv("OPENAI_BASE_URL", "https://api.siliconflow.cn/v1"),
+            "sessions": len(sessions),
+            "turns": args.turns,
+            "max_tokens": args.max_tokens,
+            "history_turns": qa_agent.history_turns,
+            "retrieval": retrieval_agent is not None,
+        },
+        "summary": summarize(rows),
+        "rows": rows,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    summary = report["summary"]
+    print(f"\n{'轮次':>4}{'旧TTFT(s)':>12}{'新TTFT(s)':>12}{'旧缓存比例':>12}{'新缓存比例':>12}{'新prompt':>10}")
+    for turn in summary["stable"]["turns"]:
+        legacy, stable = summary["legacy"]["turns"][turn], summary["stable"]["turns"][turn]
+        print(f"{turn:>4}{legacy['mean_ttft_s']:>12.3f}{stable['mean_ttft_s']:>12.3f}"
+              f"{legacy['cached_ratio']:>12.1%}{stable['cached_ratio']:>12.1%}{stable['mean_prompt_tokens']:>10.0f}")
+    print(f"\n追问（第2轮起）: 旧 TTFT {summary['legacy']['follow_up_mean_ttft_s']:.3f}s / 缓存 "
+          f"{summary['legacy']['follow_up_cached_ratio']:.1%}，新 TTFT {summary['stable']['follow_up_mean_ttft_s']:.3f}s"
+          f" / 缓存 {summary['stable']['follow_up_cached_ratio']:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比新旧 prompt 结构在多轮对话中的前缀缓存命中与首token延迟")
+    parser.add_argument('--csv', nargs='+', default=None, help='问题来源（默认全部 law_qa_samples_*.csv）')
+    parser.add_argument('--sessions', type=int, default=5, help='会话数')
+    parser.add_argument('--turns', type=int, default=6, help='每个会话的轮数')
+    parser.add_argument('--max-tokens', type=int, default=300, help='每轮回答的最大token数')
+    parser.add_argument('--model', default=None, help='模型（默认 OPENAI_MODEL）')
+    parser.add_argument('--no-retrieval', action='store_true', help='不加载索引，法条部分用固定文本')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+检索基准测试
+
+用 law_qa_samples_*.csv 中的全部问题跑 FAISSRetriever，统计：
+- 单线程检索延迟 p50/p95/p99
+- 不同并发数下的 QPS 与延迟
+- recall@k：expected_answer 中引用的《法规》第X条是否出现在前 k 条检索结果中
+- 法规命中率：只提到《法规》而没有具体条号的问题，按前 k 条中是否有该法规的条文统计
+
+索引、元数据、编码器后端都可以通过参数切换，结果写入 JSON，便于对比不同索引类型/编码器并跟踪回归。
+
+用法:
+    python benchmark_retrieval.py --output bench/flat_torch.json
+    python benchmark_retrieval.py --index law_index_hnsw.bin --encoder onnx --output bench/hnsw_onnx.json
+    python benchmark_retrieval.py --concurrency 1 4 16 --k 1 3 5 10 --runs 3
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+CITATION_PATTERN = re.compile(r'《([^》]+)》\s*第([零〇一二三四五六七八九十百千万两\d]+)条')
+LAW_PATTERN = re.compile(r'《([^》]+)》')
+CHINESE_DIGITS = '零一二三四五六七八九'
+
+
+def get_data_file_path(relative_path: str) -> str:
+    """获取数据文件的绝对路径"""
+    if os.path.isabs(relative_path):
+        return relative_path
+
+    # 相对于项目根目录
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, relative_path)
+
+
+# ========================
+# 评测数据
+# ========================
+def to_chinese_number(number: int) -> str:
+    """阿拉伯数字转为法条中使用的中文数字（1064 -> 一千零六十四）"""
+    if number == 0:
+        return CHINESE_DIGITS[0]
+
+    units = ['', '十', '百', '千']
+    digits = str(number)
+    result = ''
+    zero = False
+    for pos, ch in enumerate(digits):
+        d = int(ch)
+        unit = units[len(digits) - pos - 1]
+        if d == 0:
+            zero = True
+            continue
+        if zero:
+            result += CHINESE_DIGITS[0]
+            zero = False
+        result += CHINESE_DIGITS[d] + unit
+
+    # 10-19 写作"十X"而不是"一十X"
+    if result.startswith('一十'):
+        result = result[1:]
+    return result
+
+
+def normalize_law_name(name: str) -> str:
+    """去掉"中华人民共和国"前缀和文件名后缀，便于比较法规名称"""
+    name = name.replace('English.txt', '').replace('.txt', '').strip()
+    return name.replace('中华人民共和国', '')
+
+
+def parse_citations(text: str) -> List[Tuple[str, str]]:
+    """提取 expected_answer 中引用的 (法规名称, 第X条)"""
+    citations = []
+    for law_name, article in CITATION_PATTERN.findall(text or ''):
+        if article.isdigit():
+            article = to_chinese_number(int(article))
+        citation = (normalize_law_name(law_name), f'第{article}条')
+        if citation not in citations:
+            citations.append(citation)
+    return citations
+
+
+def parse_laws(text: str) -> List[str]:
+    """提取 expected_answer 中提到的法规名称"""
+    laws = []
+    for law_name in LAW_PATTERN.findall(text or ''):
+        law_name = normalize_law_name(law_name)
+        if law_name and law_name not in laws:
+            laws.append(law_name)
+    return laws
+
+
+def load_samples(csv_files: List[str]) -> List[Dict[str, Any]]:
+    """读取问题与其引用的法条（按问题去重，保持顺序）"""
+    samples = []
+    seen = set()
+    for csv_file in csv_files:
+        with open(get_data_file_path(csv_file), 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                question = (row.get('question') or '').strip()
+                if not question or question in seen:
+                    continue
+                seen.add(question)
+                expected = row.get('expected_answer', '')
+                samples.append({
+                    'question': question,
+                    'citations': parse_citations(expected),
+                    'laws': parse_laws(expected),
+                })
+    return samples
+
+
+def matches_law(result: Dict[str, Any], law_name: str) -> bool:
+    """检索结果是否来自该法规（名称互相包含即可，兼容简称）"""
+    result_law = normalize_law_name(result.get('law_name') or result.get('filename', ''))
+    return bool(result_law) and (law_name in result_law or result_law in law_name)
+
+
+def matches_citation(result: Dict[str, Any], citation: Tuple[str, str]) -> bool:
+    """检索结果是否为引用的法条：法规匹配，且条文以"第X条"开头"""
+    law_name, article = citation
+    return matches_law(result, law_name) and result.get('content', '').lstrip().startswith(article)
+
+
+# ========================
+# 统计
+# ========================
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    values = sorted(latencies_ms)
+    return {
+        'count': len(values),
+        'p50_ms': statistics.median(values) if values else 0.0,
+        'p95_ms': percentile(values, 0.95),
+        'p99_ms': percentile(values, 0.99),
+        'mean_ms': statistics.fmean(values) if values else 0.0,
+        'max_ms': values[-1] if values else 0.0,
+    }
+
+
+def timed_search(retriever, question: str, k: int) -> Tuple[float, List[Dict[str, Any]]]:
+    start = time.perf_counter()
+    results = retriever.search(question, k=k)
+    return (time.perf_counter() - start) * 1000, results
+
+
+def measure_recall(retriever, samples: List[Dict[str, Any]], ks: List[int]) -> Dict[str, Any]:
+    """recall@k：引用法条被检索到的比例；hit@k：至少命中一条引用的问题比例；
+    law_hit@k：前 k 条中出现所提法规的问题比例"""
+    max_k = max(ks)
+    recall = {k: [] for k in ks}
+    hit = {k: [] for k in ks}
+    law_hit = {k: [] for k in ks}
+    misses = []
+
+    for sample in samples:
+        if not sample['laws']:
+            continue
+        results = retriever.search(sample['question'], k=max_k)
+        for k in ks:
+            top = results[:k]
+            law_hit[k].append(1.0 if any(matches_law(r, law) for r in top for law in sample['laws']) else 0.0)
+            if sample['citations']:
+                found = [any(matches_citation(r, c) for r in top) for c in sample['citations']]
+                recall[k].append(sum(found) / len(found))
+                hit[k].append(1.0 if any(found) else 0.0)
+
+        if sample['citations'] and not any(matches_citation(r, c) for r in results for c in sample['citations']):
+            misses.append({
+                'question': sample['question'],
+                'citations': [''.join(c) for c in sample['citations']],
+                'top1': (results[0]['filename'] + ' ' + results[0]['content'][:30]) if results else None,
+            })
+
+    return {
+        'article_labeled_questions': sum(1 for s in samples if s['citations']),
+        'law_labeled_questions': sum(1 for s in samples if s['laws']),
+        'recall_at_k': {str(k): statistics.fmean(v) if v else 0.0 for k, v in recall.items()},
+        'hit_at_k': {str(k): statistics.fmean(v) if v else 0.0 for k, v in hit.items()},
+        'law_hit_at_k': {str(k): statistics.fmean(v) if v else 0.0 for k, v in law_hit.items()},
+        'misses': misses,
+    }
+
+
+def measure_latency(retriever, questions: List[str], k: int, runs: int) -> Dict[str, float]:
+    """单线程逐条检索的延迟"""
+    latencies = []
+    for _ in range(runs):
+        for question in questions:
+            latencies.append(timed_search(retriever, question, k)[0])
+    return latency_summary(latencies)
+
+
+def measure_concurrency(retriever, questions: List[str], k: int, concurrency: int, runs: int) -> Dict[str, float]:
+    """concurrency 个线程同时发起检索，统计吞吐与延迟"""
+    workload = questions * runs
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = [ms for ms, _ in executor.map(lambda q: timed_search(retriever, q, k), workload)]
+    elapsed = time.perf_counter() - start
+
+    stats = latency_summary(latencies)
+    stats['concurrency'] = concurrency
+    stats['qps'] = len(workload) / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    # FAISSRetriever 通过环境变量选择编码器后端与批量编码
+    if args.encoder:
+        os.environ['ENCODER_BACKEND'] = args.encoder
+    if args.onnx_model_dir:
+        os.environ['ONNX_MODEL_DIR'] = args.onnx_model_dir
+    if args.no_batching:
+        os.environ['ENCODER_BATCHING'] = 'false'
+
+    from agent import FAISSRetriever
+
+    csv_files = args.csv or sorted(glob.glob(get_data_file_path('law_qa_samples_*.csv')))
+    samples = load_samples(csv_files)
+    questions = [s['question'] for s in samples]
+    print(f"📚 {len(questions)} 个问题，其中 {sum(1 for s in samples if s['citations'])} 个引用了具体法条，"
+          f"{sum(1 for s in samples if s['laws'])} 个提到了法规名称")
+
+    index_path = get_data_file_path(args.index or os.getenv("FAISS_INDEX_PATH", "law_index.bin"))
+    metadata_path = get_data_file_path(args.metadata or os.getenv("METADATA_PATH", "metadata.pkl"))
+
+    print("🔄 加载检索器...")
+    retriever = FAISSRetriever(index_path, metadata_path)
+    k = max(args.k)
+
+    # 预热
+    for question in questions[:8]:
+        retriever.search(question, k=k)
+
+    print("🎯 计算召回率...")
+    recall = measure_recall(retriever, samples, args.k)
+
+    print("⏱️ 单线程延迟...")
+    latency = measure_latency(retriever, questions, k, args.runs)
+
+    throughput = []
+    for concurrency in args.concurrency:
+        print(f"🚀 并发 {concurrency}...")
+        throughput.append(measure_concurrency(retriever, questions, k, concurrency, args.runs))
+
+    return {
+        'label': args.label,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'index_path': index_path,
+            'index_type': type(retriever.index).__name__,
+            'index_ntotal': int(retriever.index.ntotal),
+            'metadata_path': metadata_path,
+            'encoder_backend': os.getenv("ENCODER_BACKEND", "torch"),
+            'encoder_batching': retriever.encoder is not retriever.model,
+            'faiss_mmap': os.getenv("FAISS_MMAP", "false"),
+            'k': args.k,
+            'runs': args.runs,
+            'csv_files': [os.path.basename(p) for p in csv_files],
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'load_timings': retriever.load_timings,
+        'questions': len(questions),
+        'recall': recall,
+        'latency': latency,
+        'throughput': throughput,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    config = report['config']
+    print(f"\n索引: {config['index_type']} ({config['index_ntotal']} 条)  编码器: {config['encoder_backend']}"
+          f"  批量编码: {config['encoder_batching']}")
+
+    recall = report['recall']
+    print(f"\n召回（{recall['article_labeled_questions']} 个引用法条的问题 / "
+          f"{recall['law_labeled_questions']} 个提到法规的问题）")
+    print(f"{'k':>4}{'recall@k':>12}{'hit@k':>10}{'法规命中':>10}")
+    for k in recall['recall_at_k']:
+        print(f"{k:>4}{recall['recall_at_k'][k]:>12.3f}{recall['hit_at_k'][k]:>10.3f}{recall['law_hit_at_k'][k]:>10.3f}")
+
+    latency = report['latency']
+    print(f"\n单线程延迟: p50 {latency['p50_ms']:.2f}ms  p95 {latency['p95_ms']:.2f}ms  p99 {latency['p99_ms']:.2f}ms")
+
+    print(f"\n{'并发':>6}{'QPS':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for row in report['throughput']:
+        print(f"{row['concurrency']:>6}{row['qps']:>10.1f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS检索延迟、吞吐与召回基准测试")
+    parser.add_argument('--index', default=None, help='FAISS索引路径（默认 FAISS_INDEX_PATH）')
+    parser.add_argument('--metadata', default=None, help='元数据路径（默认 METADATA_PATH）')
+    parser.add_argument('--encoder', choices=['torch', 'onnx'], default=None, help='查询编码器后端')
+    parser.add_argument('--onnx-model-dir', default=None)
+    parser.add_argument('--no-batching', action='store_true', help='关闭并发查询的批量编码')
+    parser.add_argument('--csv', nargs='+', default=None, help='评测问题（默认全部 law_qa_samples_*.csv）')
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 3, 5, 10])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--runs', type=int, default=1, help='每个测试重复的轮数')
+    parser.add_argument('--label', default=None, help='本次结果的标签（如 flat-torch）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+会话内存基准测试
+
+构造大量多轮会话，用 tracemalloc 统计三种表示常驻内存的大小：
+- legacy：调整前的 ConversationContext（每条消息一个 dict，带 ISO 时间字符串；检索结果保存法条全文副本）
+- compact：当前的 ConversationContext（__slots__ 消息、角色枚举、epoch 整数时间、检索结果只保存行号），不限制历史
+- bounded：compact 加上 SESSION_HISTORY_LIMIT，经 MemorySessionStore 保存，超出的消息转存到临时 SQLite 文件
+
+回答、问题与法条为指定长度的合成文本（每条都是独立的字符串对象）。
+
+用法:
+    python benchmark_sessions.py --sessions 10000 --turns 10 --limit 8 --output bench/sessions.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "restful"))
+
+from agent import ConversationContext
+from session_store import MemorySessionStore, MessageArchive, SQLiteConnection, ARCHIVE_SCHEMA
+
+BASE_TEXT = "根据《中华人民共和国劳动合同法》第四十六条规定，用人单位依照本法第四十条规定解除劳动合同的，应当向劳动者支付经济补偿。"
+
+
+@dataclass
+class LegacyConversationContext:
+    """调整前的会话表示，用于对比"""
+    history: List[Dict[str, str]] = field(default_factory=list)
+    current_topic: str = ""
+    retrieved_context: List[str] = field(default_factory=list)
+    last_query: str = ""
+    session_id: str = ""
+
+    def add_message(self, role: str, content: str):
+        self.history.append({
+            "role": role,
+            "content": content,
+            "timestamp": datetime.now().isoformat()
+        })
+
+
+def synthetic_text(chars: int, seed: int) -> str:
+    """长度为 chars 的新字符串（带编号，避免被解释器共享）"""
+    suffix = f"#{seed}"
+    body = (BASE_TEXT * (chars // len(BASE_TEXT) + 1))[:max(0, chars - len(suffix))]
+    return body + suffix
+
+
+def build_sessions(kind: str, args, store=None) -> Dict[str, Any]:
+    """构造 args.sessions 个会话，每个 args.turns 轮；返回会话字典与每次保存的耗时"""
+    sessions = store if store is not None else {}
+    save_ms: List[float] = []
+    for s in range(args.sessions):
+        session_id = f"bench-{s}"
+        if kind == "legacy":
+            context = LegacyConversationContext(session_id=session_id)
+        else:
+            context = ConversationContext(session_id=session_id)
+        for t in range(args.turns):
+            n = s * args.turns + t
+            question = synthetic_text(args.question_chars, n)
+            context.add_message("user", question)
+            context.add_message("assistant", synthetic_text(args.answer_chars, n))
+            context.last_query = question
+            if kind == "legacy":
+                # 扩展后的法条文本每次检索都是新拼接的字符串
+                context.retrieved_context = [synthetic_text(args.article_chars, n * 3 + i) for i in range(3)]
+            else:
+                context.retrieved_ids = [n * 3 + i for i in range(3)]
+                context.retrieved_version = "bench"
+            start = time.perf_counter()
+            sessions[session_id] = context
+            save_ms.append((time.perf_counter() - start) * 1000)
+    return {"sessions": sessions, "save_ms": save_ms}
+
+
+def measure(name: str, build: Callable[[], Dict[str, Any]], args) -> Dict[str, Any]:
+    """构造会话并统计构造后仍常驻的内存"""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    sessions = result["sessions"]
+    resident = sum(len(context.history) for context in sessions.values())
+    save_ms = sorted(result["save_ms"])
+    report = {
+        "name": name,
+        "sessions": len(sessions),
+        "resident_messages": resident,
+        "memory_mb": current / 1024 / 1024,
+        "bytes_per_session": current / max(1, len(sessions)),
+        "build_seconds": elapsed,
+        "save_ms_p50": statistics.median(save_ms) if save_ms else 0.0,
+        "save_ms_p99": save_ms[min(len(save_ms) - 1, int(len(save_ms) * 0.99))] if save_ms else 0.0,
+    }
+    del result, sessions
+    gc.collect()
+    return report
+
+
+def run(args) -> Dict[str, Any]:
+    results = [
+        measure("legacy", lambda: build_sessions("legacy", args), args),
+        measure("compact", lambda: build_sessions("compact", args), args),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "sessions.db")
+        archive = MessageArchive(SQLiteConnection(db_path, ARCHIVE_SCHEMA))
+        results.append(measure(
+            f"bounded(limit={args.limit})",
+            lambda: build_sessions("compact", args, MemorySessionStore(archive, args.limit)), args
+        ))
+        results[-1]["archive_mb"] = os.path.getsize(db_path) / 1024 / 1024
+        # 读回完整历史（转存部分 + 内存部分）
+        store = MemorySessionStore(archive, args.limit)
+        store["bench-0"] = ConversationContext(session_id="bench-0", archived=max(0, args.turns * 2 - args.limit))
+        start = time.perf_counter()
+        archived = len(store.history("bench-0"))
+        results[-1]["history_load_ms"] = (time.perf_counter() - start) * 1000
+        results[-1]["history_load_messages"] = archived
+
+    legacy_mb = results[0]["memory_mb"]
+    for result in results:
+        result["vs_legacy"] = result["memory_mb"] / legacy_mb if legacy_mb else 0.0
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "config": {
+            "sessions": args.sessions, "turns": args.turns, "limit": args.limit,
+            "question_chars": args.question_chars, "answer_chars": args.answer_chars,
+            "article_chars": args.article_chars,
+        },
+        "results": results,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    config = report["config"]
+    print(f"\n📊 {config['sessions']} 个会话 × {config['turns']} 轮"
+          f"（问题 {config['question_chars']} 字，回答 {config['answer_chars']} 字，法条 {config['article_chars']} 字）")
+    print(f"{'表示':<20}{'常驻消息':>10}{'内存MB':>10}{'每会话KB':>10}{'相对旧版':>10}{'保存p99ms':>11}")
+    for r in report["results"]:
+        print(f"{r['name']:<20}{r['resident_messages']:>10}{r['memory_mb']:>10.1f}"
+              f"{r['bytes_per_session'] / 1024:>10.2f}{r['vs_legacy']:>10.1%}{r['save_ms_p99']:>11.3f}")
+    bounded = report["results"][-1]
+    print(f"\n🗄️ 转存文件 {bounded['archive_mb']:.1f} MB；读回一个会话的 {bounded['history_load_messages']} 条"
+          f"转存消息耗时 {bounded['history_load_ms']:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比会话表示的常驻内存（旧版 dict 消息 / 紧凑表示 / 限制历史并转存）")
+    parser.add_argument('--sessions', type=int, default=10000, help='会话数')
+    parser.add_argument('--turns', type=int, default=10, help='每个会话的轮数')
+    parser.add_argument('--limit', type=int, default=int(os.getenv("SESSION_HISTORY_LIMIT", "40")),
+                        help='bounded 中每个会话在内存中保留的消息数（默认 SESSION_HISTORY_LIMIT）')
+    parser.add_argument('--question-chars', type=int, default=40, help='问题长度')
+    parser.add_argument('--answer-chars', type=int, default=600, help='回答长度')
+    parser.add_argument('--article-chars', type=int, default=800, help='每条检索到的法条长度')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 import os
 import re
 import pickle
+from bisect import bisect_right
 from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 from dotenv import load_dotenv
 
+from search_filters import extract_category
+
 # 加载环境变量
 load_dotenv()
 
@@ -27,16 +30,102 @@ INPUT_DIR = './law'            # 存放法律文件的目录
 INDEX_PATH = get_data_file_path(os.getenv("FAISS_INDEX_PATH", "law_index.bin"))
 METADATA_PATH = get_data_file_path(os.getenv("METADATA_PATH", "metadata.pkl"))
 MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'  # 多语言句向量模型
+# 索引类型：flat_ip（归一化向量 + 内积，即余弦相似度）、hnsw_ip（近似检索）、flat_l2（旧版L2距离）
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat_ip").lower()
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
 
 # ========================
 # 正则表达式匹配"第X条"结构
 # ========================
 def split_by_article(text):
+    return [chunk for _, chunk in split_by_article_with_offsets(text)]
+
+def split_by_article_with_offsets(text):
+    """切分条文，同时返回每段在原文中的起始位置"""
     pattern = r'(第.*?条[\s\S]*?)(?=(第|$))'
-    matches = re.findall(pattern, text, re.DOTALL)
-    chunks = [match[0].strip() for match in matches if match[0].strip()]
+    chunks = []
+    for match in re.finditer(pattern, text, re.DOTALL):
+        chunk = match.group(1).strip()
+        if chunk:
+            chunks.append((match.start(1), chunk))
     return chunks
 
+# ========================
+# 过滤字段：章节、施行日期、类别
+# ========================
+CHAPTER_PATTERN = re.compile(r'^[ \t\u3000]*(第[零〇一二三四五六七八九十百]+章[^\n]*)', re.MULTILINE)
+DATE_PATTERN = re.compile(
+    r'([0-9〇零一二三四五六七八九]{4})年([0-9一二三四五六七八九十]{1,3})月([0-9一二三四五六七八九十]{1,3})日起?施行'
+)
+CHINESE_DIGITS = {c: i for i, c in enumerate('〇一二三四五六七八九')}
+CHINESE_DIGITS['零'] = 0
+
+def find_chapters(text):
+    """章标题及其位置"""
+    return [(m.start(1), m.group(1).strip()) for m in CHAPTER_PATTERN.finditer(text)]
+
+def chapter_at(chapters, position):
+    """position 所在的章（之前最近的章标题）"""
+    i = bisect_right([start for start, _ in chapters], position) - 1
+    return chapters[i][1] if i >= 0 else ''
+
+def _to_int(text):
+    if text.isdigit():
+        return int(text)
+    if len(text) == 4:
+        return int(''.join(str(CHINESE_DIGITS[c]) for c in text))
+    # 月、日：十、十二、二十、三十一
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        return (CHINESE_DIGITS[tens] if tens else 1) * 10 + (CHINESE_DIGITS[ones] if ones else 0)
+    return CHINESE_DIGITS[text]
+
+def extract_effective_date(text):
+    """从"自X年X月X日起施行"中提取施行日期（YYYY-MM-DD），找不到时返回空字符串"""
+    match = DATE_PATTERN.search(text)
+    if not match:
+        return ''
+    try:
+        year, month, day = (_to_int(g) for g in match.groups())
+    except KeyError:
+        return ''
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+# ========================
+# 条文关联：所属完整条文、前后条文、同章范围（全局行号，检索时按数组下标直接取）
+# ========================
+def is_line_start(text, position):
+    """切分点是否位于行首（正文中引用的"第X条"不在行首，不是新条文）"""
+    before = text[:position].rstrip(' \t\u3000')
+    return not before or before.endswith('\n')
+
+def link_articles(text, chunks, chapter_names, base):
+    """计算每段的 parent_start/parent_end、prev_id/next_id、chapter_start/chapter_end"""
+    count = len(chunks)
+    article_starts = [i for i, (position, _) in enumerate(chunks) if i == 0 or is_line_start(text, position)]
+    article_ends = article_starts[1:] + [count]
+
+    links = [None] * count
+    for a, (start, end) in enumerate(zip(article_starts, article_ends)):
+        for i in range(start, end):
+            links[i] = {
+                'parent_start': base + start,
+                'parent_end': base + end,
+                'prev_id': base + article_starts[a - 1] if a > 0 else -1,
+                'next_id': base + article_starts[a + 1] if a + 1 < len(article_starts) else -1,
+            }
+
+    # 同一章的连续段
+    run_start = 0
+    for i in range(1, count + 1):
+        if i == count or chapter_names[i] != chapter_names[run_start]:
+            for j in range(run_start, i):
+                links[j]['chapter_start'] = base + run_start
+                links[j]['chapter_end'] = base + i
+            run_start = i
+    return links
+
 def extract_law_name(filename):
     """从文件名提取法规名称"""
     # 移除 'English.txt' 后缀
@@ -63,33 +152,56 @@ for filename in tqdm(os.listdir(INPUT_DIR)):
             text = f.read()
 
         # 按"第X条"切分
-        chunks = split_by_article(text)
+        chunks = split_by_article_with_offsets(text)
         
-        # 提取法规名称
+        # 提取法规名称、类别、施行日期与章节
         law_name = extract_law_name(filename)
+        category = extract_category(law_name)
+        effective_date = extract_effective_date(text)
+        chapters = find_chapters(text)
+        chapter_names = [chapter_at(chapters, start) for start, _ in chunks]
+        links = link_articles(text, chunks, chapter_names, base=len(all_metadata))
 
         # 添加到列表中
-        all_chunks.extend(chunks)
+        all_chunks.extend(chunk for _, chunk in chunks)
         all_metadata.extend([{
             'filename': filename,
             'law_name': law_name,
-            'content': chunk
-        } for chunk in chunks])
+            'content': chunk,
+            'category': category,
+            'effective_date': effective_date,
+            'chapter': chapter,
+            **link
+        } for (_, chunk), chapter, link in zip(chunks, chapter_names, links)])
 
 # 向量化
 print(f"Encoding {len(all_chunks)} chunks...")
 vectors = model.encode(all_chunks, show_progress_bar=True, batch_size=32)
+vectors = np.ascontiguousarray(vectors, dtype=np.float32)
 dimension = vectors.shape[1]
 
 # 构建 FAISS 索引
-print("Building FAISS index...")
-index = faiss.IndexFlatL2(dimension)
-index.add(np.array(vectors))
+print(f"Building FAISS index ({INDEX_TYPE})...")
+if INDEX_TYPE == 'flat_l2':
+    index = faiss.IndexFlatL2(dimension)
+else:
+    # 向量归一化后内积即余弦相似度，不同查询的分数可以直接比较
+    faiss.normalize_L2(vectors)
+    if INDEX_TYPE == 'hnsw_ip':
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif INDEX_TYPE == 'flat_ip':
+        index = faiss.IndexFlatIP(dimension)
+    else:
+        raise ValueError(f"Unknown INDEX_TYPE: {INDEX_TYPE}")
+index.add(vectors)
 
-# 保存索引和元数据
+# 保存索引和元数据（先写临时文件再替换，运行中的服务可以安全地热加载新索引）
 print("Saving index and metadata...")
-faiss.write_index(index, INDEX_PATH)
-with open(METADATA_PATH, 'wb') as f:
+faiss.write_index(index, f"{INDEX_PATH}.tmp")
+with open(f"{METADATA_PATH}.tmp", 'wb') as f:
     pickle.dump(all_metadata, f)
+os.replace(f"{INDEX_PATH}.tmp", INDEX_PATH)
+os.replace(f"{METADATA_PATH}.tmp", METADATA_PATH)
 
 print("✅ Done!")
@@ -0,0 +1,86 @@
+"""
+进程内缓存
+
+TTLCache：线程安全的 LRU + TTL 缓存，用于检索结果等热点数据。
+file_version：根据文件的修改时间与大小生成版本号，索引重建后版本号随之变化，
+作为缓存键的一部分，保证重建索引后不会返回旧结果。
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """容量上限 maxsize、过期时间 ttl 秒的 LRU 缓存（ttl<=0 表示不过期）"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if not self.enabled:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl > 0 else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+
+def normalize_query(query: str) -> str:
+    """缓存用的查询归一化：全角转半角、合并空白、去掉首尾标点、小写"""
+    query = unicodedata.normalize('NFKC', query).lower()
+    query = re.sub(r'\s+', ' ', query).strip()
+    return query.strip('?？。.!！ ')
+
+
+def file_version(*paths: str) -> str:
+    """由文件的修改时间与大小生成版本号"""
+    digest = hashlib.md5()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size};".encode('utf-8'))
+    return digest.hexdigest()[:12]
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+模型路由评测
+
+用 law_qa_samples_*.csv 中的问题检验 ModelRouter 的分流效果：
+- 路由分布：多少问题会走快速模型，走大模型的原因分布
+- 各路由的检索质量：fast 路由的问题 top1 是否命中引用的法规/法条（命中率应明显高于 strong）
+- 阈值扫描：--sweep 列出不同 ROUTER_MIN_SCORE 下的 fast 占比与命中率，便于选阈值
+- --llm N：每个路由抽 N 个问题，分别用快速模型和大模型回答，对比首token延迟、总耗时、
+  回答长度与回答中提到引用法规的比例（需要 OPENAI_FAST_MODEL）
+
+用法:
+    python evaluate_routing.py
+    python evaluate_routing.py --sweep 0.5 0.55 0.6 0.65 0.7 --output bench/routing.json
+    python evaluate_routing.py --csv law_qa_samples_100.csv --llm 10
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+from benchmark_retrieval import get_data_file_path, load_samples, matches_citation, matches_law, normalize_law_name
+
+# 加载环境变量
+load_dotenv()
+
+
+def classify_samples(retriever, router, samples: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    """检索每个问题并按单轮对话分类"""
+    rows = []
+    for sample in samples:
+        results = retriever.search(sample['question'], k=k)
+        decision = router.classify(sample['question'], 0, [r['score'] for r in results],
+                                   cosine=retriever.use_cosine)
+        top = results[:1]
+        rows.append({
+            'question': sample['question'],
+            'route': decision.route,
+            'reasons': decision.reasons,
+            'features': decision.features,
+            'laws': sample['laws'],
+            'law_hit_at_1': any(matches_law(r, law) for r in top for law in sample['laws']) if sample['laws'] else None,
+            'citation_hit_at_1': any(matches_citation(r, c) for r in top for c in sample['citations'])
+            if sample['citations'] else None,
+        })
+    return rows
+
+
+def rate(values: List[bool]) -> float:
+    values = [v for v in values if v is not None]
+    return statistics.fmean(values) if values else 0.0
+
+
+def summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    routes = {}
+    for route in ('fast', 'strong'):
+        subset = [r for r in rows if r['route'] == route]
+        routes[route] = {
+            'count': len(subset),
+            'share': len(subset) / len(rows) if rows else 0.0,
+            'law_hit_at_1': rate([r['law_hit_at_1'] for r in subset]),
+            'citation_hit_at_1': rate([r['citation_hit_at_1'] for r in subset]),
+            'mean_top_score': statistics.fmean(r['features']['top_score'] for r in subset) if subset else 0.0,
+        }
+    reasons = Counter(reason for r in rows for reason in r['reasons'])
+    return {'routes': routes, 'reasons': dict(reasons.most_common())}
+
+
+def sweep_thresholds(rows: List[Dict[str, Any]], router, thresholds: List[float]) -> List[Dict[str, Any]]:
+    """按已有特征重新分类（不重复检索）"""
+    original = router.min_score
+    table = []
+    try:
+        for threshold in thresholds:
+            router.min_score = threshold
+            fast = []
+            for row in rows:
+                features = row['features']
+                # 以 top_score/margin 还原两个最高分，足以重新判断
+                scores = [features['top_score'], features['top_score'] - features['margin']]
+                if router.classify(row['question'], 0, scores, features.get('cosine', True)).route == 'fast':
+                    fast.append(row)
+            table.append({
+                'min_score': threshold,
+                'fast_share': len(fast) / len(rows) if rows else 0.0,
+                'fast_law_hit_at_1': rate([r['law_hit_at_1'] for r in fast]),
+                'fast_citation_hit_at_1': rate([r['citation_hit_at_1'] for r in fast]),
+            })
+    finally:
+        router.min_score = original
+    return table
+
+
+def compare_models(retriever, router, rows: List[Dict[str, Any]], per_route: int) -> Dict[str, Any]:
+    """每个路由抽 per_route 个问题，两个模型各回答一次"""
+    from agent import ConversationContext, QAAgent, RetrievalAgent
+
+    retrieval_agent = RetrievalAgent(retriever)
+    agents = {'fast': QAAgent(router.fast_llm), 'strong': QAAgent(router.strong_llm)}
+    results = {}
+    for route in ('fast', 'strong'):
+        picked = [r for r in rows if r['route'] == route][:per_route]
+        for model, qa_agent in agents.items():
+            ttfts, totals, lengths, mentions = [], [], [], []
+            for row in picked:
+                context = ConversationContext()
+                retrieved_context = retrieval_agent.retrieve_relevant_laws(row['question'], context)
+                start = time.perf_counter()
+                ttft = None
+                chunks = []
+                for chunk in qa_agent.stream_answer(row['question'], context, retrieved_context):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    chunks.append(chunk)
+                answer = ''.join(chunks)
+                totals.append(time.perf_counter() - start)
+                ttfts.append(ttft or 0.0)
+                lengths.append(len(answer))
+                if row['laws']:
+                    mentions.append(any(normalize_law_name(law) in answer for law in row['laws']))
+            results[f'{route}_questions/{model}_model'] = {
+                'questions': len(picked),
+                'mean_ttft_s': statistics.fmean(ttfts) if ttfts else 0.0,
+                'mean_total_s': statistics.fmean(totals) if totals else 0.0,
+                'mean_answer_chars': statistics.fmean(lengths) if lengths else 0.0,
+                'law_mention_rate': rate(mentions),
+            }
+            print(f"  {route} 问题 / {model} 模型: {len(picked)} 题完成")
+    return results
+
+
+def run_evaluation(args) -> Dict[str, Any]:
+    from agent import FAISSRetriever, create_chat_llm
+    from model_router import ModelRouter
+
+    csv_files = args.csv or sorted(glob.glob(get_data_file_path('law_qa_samples_*.csv')))
+    samples = load_samples(csv_files)
+    print(f"📚 {len(samples)} 个问题")
+
+    index_path = get_data_file_path(args.index or os.getenv("FAISS_INDEX_PATH", "law_index.bin"))
+    metadata_path = get_data_file_path(args.metadata or os.getenv("METADATA_PATH", "metadata.pkl"))
+    print("🔄 加载检索器...")
+    retriever = FAISSRetriever(index_path, metadata_path)
+    if not retriever.use_cosine:
+        print("⚠️ 当前为L2索引，检索分数不是余弦相似度，所有问题都会分到 strong，请用 INDEX_TYPE=flat_ip 重建索引")
+
+    fast_llm = strong_llm = None
+    if args.llm:
+        if not os.getenv("OPENAI_FAST_MODEL"):
+            raise SystemExit("❌ --llm 需要配置 OPENAI_FAST_MODEL")
+        api_key = os.getenv("OPENAI_API_KEY")
+        base_url = os.getenv("OPENAI_BASE_URL", "https://api.siliconflow.cn/v1")
+        strong_llm = create_chat_llm(api_key, base_url, os.getenv("OPENAI_MODEL", "Tongyi-Zhiwen/QwenLong-L1-32B"))
+        fast_llm = create_chat_llm(os.getenv("OPENAI_FAST_API_KEY", api_key),
+                                   os.getenv("OPENAI_FAST_BASE_URL", base_url), os.getenv("OPENAI_FAST_MODEL"))
+    router = ModelRouter(fast_llm=fast_llm, strong_llm=strong_llm)
+
+    print("🧭 分类...")
+    rows = classify_samples(retriever, router, samples, args.k)
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'min_score': router.min_score,
+            'min_margin': router.min_margin,
+            'max_chars': router.max_chars,
+            'max_history_turns': router.max_history_turns,
+            'k': args.k,
+            'csv_files': [os.path.basename(p) for p in csv_files],
+            'index_path': index_path,
+        },
+        'questions': len(rows),
+        'summary': summarize(rows),
+    }
+    if args.sweep:
+        report['sweep'] = sweep_thresholds(rows, router, args.sweep)
+    if args.llm:
+        print("🤖 对比模型...")
+        report['models'] = compare_models(retriever, router, rows, args.llm)
+    if args.details:
+        report['rows'] = rows
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    config = report['config']
+    print(f"\n阈值: 相关度≥{config['min_score']}  差距≥{config['min_margin']}  "
+          f"问题≤{config['max_chars']}字  历史≤{config['max_history_turns']}轮")
+
+    summary = report['summary']
+    print(f"\n{'路由':>8}{'问题数':>8}{'占比':>8}{'法规命中@1':>12}{'法条命中@1':>12}{'平均相关度':>12}")
+    for route, row in summary['routes'].items():
+        print(f"{route:>8}{row['count']:>8}{row['share']:>8.1%}{row['law_hit_at_1']:>12.3f}"
+              f"{row['citation_hit_at_1']:>12.3f}{row['mean_top_score']:>12.3f}")
+    print("\n走大模型的原因: " + "  ".join(f"{k}={v}" for k, v in summary['reasons'].items()))
+
+    if report.get('sweep'):
+        print(f"\n{'min_score':>10}{'fast占比':>10}{'法规命中@1':>12}{'法条命中@1':>12}")
+        for row in report['sweep']:
+            print(f"{row['min_score']:>10.2f}{row['fast_share']:>10.1%}{row['fast_law_hit_at_1']:>12.3f}"
+                  f"{row['fast_citation_hit_at_1']:>12.3f}")
+
+    if report.get('models'):
+        print(f"\n{'问题/模型':<28}{'TTFT(s)':>10}{'总耗时(s)':>10}{'回答字数':>10}{'提到法规':>10}")
+        for name, row in report['models'].items():
+            print(f"{name:<28}{row['mean_ttft_s']:>10.2f}{row['mean_total_s']:>10.2f}"
+                  f"{row['mean_answer_chars']:>10.0f}{row['law_mention_rate']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评测按难度路由模型的分流效果")
+    parser.add_argument('--index', default=None, help='FAISS索引路径（默认 FAISS_INDEX_PATH）')
+    parser.add_argument('--metadata', default=None, help='元数据路径（默认 METADATA_PATH）')
+    parser.add_argument('--csv', nargs='+', default=None, help='评测问题（默认全部 law_qa_samples_*.csv）')
+    parser.add_argument('--k', type=int, default=3, help='检索条数（与问答时一致）')
+    parser.add_argument('--sweep', type=float, nargs='+', default=None, help='扫描的 ROUTER_MIN_SCORE 取值')
+    parser.add_argument('--llm', type=int, default=0, help='每个路由抽取的问题数，用两个模型实际回答并对比')
+    parser.add_argument('--details', action='store_true', help='在结果中包含每个问题的路由与特征')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    report = run_evaluation(args)
+    print_report(report)
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
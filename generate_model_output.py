@@ -6,13 +6,14 @@
 
 import csv
 import json
-import time
-import requests
+import httpx
 import re
 from datetime import datetime
 import logging
 import os
 
+from legal_client import APIConnectionError, APIError, LegalClient
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -20,47 +21,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def check_api_health(api_url="http://localhost:8000"):
+# 同时进行的查询数（服务端按批量优先级限制名额，繁忙时按 Retry-After 重试）
+CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+def check_api_health(client):
     """检查API服务是否正常运行"""
     try:
-        response = requests.get(f"{api_url}/health", timeout=15)
-        return response.status_code == 200
+        client.health()
+        return True
     except Exception as e:
         logger.error(f"API健康检查失败: {e}")
         return False
 
-def query_question(question, api_url="http://localhost:8000"):
-    """查询单个问题"""
-    try:
-        payload = {
-            "question": question,
-            "show_results": False
-        }
-        
-        response = requests.post(
-            f"{api_url}/query",
-            json=payload,
-            timeout=120
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result.get('answer', '无回答')
-        else:
-            logger.error(f"API请求失败: {response.status_code} - {response.text}")
-            return f"API请求失败: {response.status_code}"
-            
-    except requests.exceptions.Timeout:
+def answer_text(result, question):
+    """query_many 的单个结果转为写入CSV的文本"""
+    if isinstance(result, APIConnectionError) and isinstance(result.__cause__, httpx.TimeoutException):
         logger.error(f"查询超时: {question}")
         return "查询超时"
-    except Exception as e:
-        logger.error(f"查询异常: {e}")
-        return f"查询异常: {str(e)}"
+    if isinstance(result, APIError):
+        logger.error(f"API请求失败: {result.status_code} - {result.detail}")
+        return f"API请求失败: {result.status_code}"
+    if isinstance(result, Exception):
+        logger.error(f"查询异常: {result}")
+        return f"查询异常: {str(result)}"
+    return result.get('answer', '无回答')
 
 def main():
     """主函数"""
     csv_file = "law_qa_samples_100.csv"
     api_url = "http://localhost:8000"
+    # 以批量优先级发送，服务繁忙（429/503）时按 Retry-After 等待后重试
+    client = LegalClient(api_url, timeout=120, retries=5)
     
     # 检查文件是否存在
     if not os.path.exists(csv_file):
@@ -69,7 +60,7 @@ def main():
     
     # 检查API服务状态
     print("🔍 检查API服务状态...")
-    if not check_api_health(api_url):
+    if not check_api_health(client):
         print("❌ API服务不可用，请确保FastAPI服务正在运行")
         print("   请运行: python restful/main.py")
         return
@@ -115,7 +106,7 @@ def main():
     print("🚀 开始批量查询...")
     start_time = datetime.now()
     
-    processed = 0
+    targets = []
     for i, row in enumerate(data):
         question = row.get('question', '').strip()
         
@@ -132,11 +123,19 @@ def main():
         if current_output == "查询超时":
             print(f"🔄 检测到查询超时，重新尝试第 {i+1} 条")
         
+        targets.append(row)
+    
+    processed = 0
+    
+    def on_result(index, result):
+        """每条查询完成后立即写回CSV（在主线程中调用）"""
+        nonlocal processed
+        row = targets[index]
+        question = row['question'].strip()
         processed += 1
-        print(f"📝 处理第 {processed}/{len(need_process)} 条: {question[:50]}...")
+        print(f"📝 完成第 {processed}/{len(targets)} 条: {question[:50]}...")
         
-        # 查询API
-        answer = query_question(question, api_url)
+        answer = answer_text(result, question)
         # 清理答案中的换行符和多余空格，避免影响CSV格式
         cleaned_answer = answer.replace('\n', ' ').replace('\r', ' ').strip()
         # 将多个连续空格替换为单个空格
@@ -154,10 +153,13 @@ def main():
         except Exception as e:
             print(f"❌ 保存文件失败: {e}")
             # 即使保存失败，也继续处理下一条
-        
-        # 延迟以避免过于频繁的请求
-        if processed < len(need_process):
-            time.sleep(1.0)
+    
+    print(f"🔀 并发数: {CONCURRENCY}")
+    client.query_many(
+        [row['question'].strip() for row in targets],
+        concurrency=CONCURRENCY, on_result=on_result, show_results=False, priority="batch"
+    )
+    client.close()
     
     # 处理完成
     end_time = datetime.now()
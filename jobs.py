@@ -0,0 +1,156 @@
+"""
+后台任务（会话总结等耗时的LLM调用）
+
+提交后立即返回任务ID，任务在工作线程池中执行，客户端轮询或订阅（SSE）进度与结果。
+任务ID由调用方按输入决定（例如 会话ID + 会话版本），相同ID的任务未失败时直接复用，
+重复点击不会重复调用LLM。已结束的任务保留 ttl 秒。
+
+每个 worker 进程各自维护任务表。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cache import TTLCache
+from metrics import JOBS_TOTAL, observe_stage
+
+# 任务状态
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class JobQueueFull(Exception):
+    """排队中的任务过多"""
+
+
+class Job:
+    """一个后台任务；update 可在任意线程调用，wait_for_update 用于等待下一次变化"""
+
+    def __init__(self, job_id: str, kind: str):
+        self.id = job_id
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = 0.0
+        self.stage = "排队中"
+        self.partial = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        # 每次变化加一，订阅者据此判断是否有新进度
+        self.version = 0
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def update(self, progress: Optional[float] = None, stage: Optional[str] = None, partial: Optional[str] = None):
+        with self._cond:
+            if progress is not None:
+                self.progress = min(max(progress, self.progress), 1.0)
+            if stage is not None:
+                self.stage = stage
+            if partial is not None:
+                self.partial = partial
+            self.version += 1
+            self._cond.notify_all()
+
+    def _finish(self, status: str, result: Any = None, error: Optional[str] = None):
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            if status == SUCCEEDED:
+                self.progress = 1.0
+                self.stage = "已完成"
+            else:
+                self.stage = "失败"
+            self.finished_at = datetime.now().isoformat()
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait_for_update(self, seen_version: int, timeout: Optional[float] = None) -> bool:
+        """等待 version 超过 seen_version 或任务结束；超时返回 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version > seen_version or self.done, timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待任务结束；超时返回 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": round(self.progress, 3),
+                "stage": self.stage,
+                "partial": self.partial,
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "version": self.version,
+            }
+
+
+class JobManager:
+    """固定大小的工作线程池 + 按ID去重的任务表"""
+
+    def __init__(self, max_workers: int = 2, ttl: float = 3600, max_pending: int = 100):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._jobs = TTLCache(maxsize=max(1024, max_pending * 4), ttl=ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def submit(self, job_id: str, kind: str, fn: Callable[[Job], Any]) -> Tuple[Job, bool]:
+        """返回 (任务, 是否新建)；相同ID的任务排队中、进行中或已成功时直接返回它，失败的任务重新执行
+
+        fn(job) 在工作线程中执行，可调用 job.update 报告进度，返回值为任务结果。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != FAILED:
+                JOBS_TOTAL.inc(kind=kind, result="reused")
+                return job, False
+            if self._pending >= self.max_pending:
+                JOBS_TOTAL.inc(kind=kind, result="rejected")
+                raise JobQueueFull(f"排队中的任务已达上限 {self.max_pending}")
+            job = Job(job_id, kind)
+            self._jobs.set(job_id, job)
+            self._pending += 1
+        JOBS_TOTAL.inc(kind=kind, result="submitted")
+        self._executor.submit(self._run, job, fn, time.perf_counter())
+        return job, True
+
+    def _run(self, job: Job, fn: Callable[[Job], Any], submitted: float):
+        observe_stage("job_queue_wait", time.perf_counter() - submitted)
+        with self._lock:
+            self._pending -= 1
+        job.status = RUNNING
+        job.started_at = datetime.now().isoformat()
+        job.update(stage="进行中")
+        try:
+            result = fn(job)
+        except Exception as e:
+            job._finish(FAILED, error=str(e))
+            JOBS_TOTAL.inc(kind=job.kind, result="failed")
+            print(f"❌ 后台任务 {job.id} 失败: {e}")
+        else:
+            job._finish(SUCCEEDED, result=result)
+            JOBS_TOTAL.inc(kind=job.kind, result="succeeded")
+
+    def stats(self) -> Dict[str, int]:
+        return {"jobs": len(self._jobs), "pending": self._pending, "max_workers": self.max_workers}
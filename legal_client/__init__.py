@@ -0,0 +1,32 @@
+"""
+法律咨询API的 Python 客户端
+
+同步（LegalClient）与 asyncio（AsyncLegalClient）两个版本，接口相同：
+- 连接池（安装 httpx[http2] 时使用 HTTP/2），一个客户端可供多个线程/协程共用
+- 排队被拒（429/503，按 Retry-After）与连接失败自动重试，指数退避
+- query_many / search_many：限制并发的批量咨询与检索
+- stream_query / stream_answer / job_events：SSE 流式迭代
+
+用法:
+    from legal_client import LegalClient
+
+    with LegalClient("http://localhost:8000") as client:
+        for text in client.stream_answer("劳动合同怎么解除"):
+            print(text, end="", flush=True)
+        results = client.query_many(questions, concurrency=8, priority="batch")
+"""
+
+from ._common import (HTTP2_AVAILABLE, APIConnectionError, APIError, LegalClientError, RetryPolicy, SSEEvent)
+from .async_client import AsyncLegalClient
+from .client import LegalClient
+
+__all__ = [
+    "LegalClient",
+    "AsyncLegalClient",
+    "LegalClientError",
+    "APIError",
+    "APIConnectionError",
+    "RetryPolicy",
+    "SSEEvent",
+    "HTTP2_AVAILABLE",
+]
@@ -0,0 +1,147 @@
+"""
+同步与异步客户端共用的部分：错误类型、重试策略、SSE 解析与请求体
+"""
+
+import json
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+
+try:
+    # HTTP/2 需要 httpx[http2]（h2）；未安装时使用 HTTP/1.1 连接池
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_BASE_URL = "http://localhost:8000"
+
+# 排队已满 / 排队超时：服务端没有处理请求，任何请求都可以重试
+REJECTED_STATUS = (429, 503)
+# 网关错误：请求可能已被处理，只重试幂等请求
+GATEWAY_STATUS = (502, 504)
+# 请求尚未发出的传输错误，任何请求都可以重试
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class LegalClientError(Exception):
+    """客户端错误基类"""
+
+
+class APIError(LegalClientError):
+    """服务端返回错误状态码"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class APIConnectionError(LegalClientError):
+    """连接失败或超时（重试用尽后），原始异常见 __cause__"""
+
+
+@dataclass
+class RetryPolicy:
+    """指数退避重试；服务端给出 Retry-After 时按它等待"""
+    retries: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        base = min(self.max_backoff, self.backoff * (2 ** attempt))
+        # 抖动，避免大量客户端同时重试
+        return random.uniform(base / 2, base)
+
+    def should_retry_status(self, attempt: int, status_code: int, idempotent: bool) -> bool:
+        if attempt >= self.retries:
+            return False
+        return status_code in REJECTED_STATUS or (idempotent and status_code in GATEWAY_STATUS)
+
+    def should_retry_error(self, attempt: int, error: httpx.TransportError, idempotent: bool) -> bool:
+        if attempt >= self.retries:
+            return False
+        return idempotent or isinstance(error, UNSENT_ERRORS)
+
+
+@dataclass
+class SSEEvent:
+    """一条 Server-Sent Event"""
+    event: str
+    data: Dict[str, Any]
+
+
+class SSEDecoder:
+    """逐行解析 text/event-stream，空行时返回完整的事件"""
+
+    def __init__(self):
+        self._event: Optional[str] = None
+        self._data = []
+
+    def feed(self, line: str) -> Optional[SSEEvent]:
+        if not line:
+            if not self._data:
+                self._event = None
+                return None
+            event = SSEEvent(self._event or "message", json.loads("\n".join(self._data)))
+            self._event = None
+            self._data = []
+            return event
+        if line.startswith(":"):
+            # 注释（保活）
+            return None
+        name, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if name == "event":
+            self._event = value
+        elif name == "data":
+            self._data.append(value)
+        return None
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def api_error(response: httpx.Response) -> APIError:
+    """由错误响应构造 APIError（响应体须已读取）"""
+    try:
+        body = response.json()
+        detail = body.get("error") or body.get("detail") or json.dumps(body, ensure_ascii=False)
+    except ValueError:
+        detail = response.text
+    return APIError(response.status_code, str(detail), retry_after_seconds(response))
+
+
+def query_payload(question: str, session_id: Optional[str], show_results: bool,
+                  filters: Optional[Dict[str, Any]], priority: str) -> Dict[str, Any]:
+    payload = {"question": question, "show_results": show_results, "priority": priority}
+    if session_id:
+        payload["session_id"] = session_id
+    if filters:
+        payload["filters"] = filters
+    return payload
+
+
+def search_payload(query: str, k: int, min_score: Optional[float],
+                   filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    payload = {"query": query, "k": k}
+    if min_score is not None:
+        payload["min_score"] = min_score
+    if filters:
+        payload["filters"] = filters
+    return payload
+
+
+def http_limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
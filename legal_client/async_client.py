@@ -0,0 +1,242 @@
+"""
+asyncio 客户端，接口与 LegalClient 相同，方法均为协程（流式方法为异步迭代器）
+"""
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from ._common import (DEFAULT_BASE_URL, HTTP2_AVAILABLE, APIConnectionError, APIError, LegalClientError,
+                      RetryPolicy, SSEDecoder, SSEEvent, api_error, http_limits, query_payload,
+                      retry_after_seconds, search_payload)
+
+
+class AsyncLegalClient:
+    """法律咨询API的异步客户端
+
+    所有请求共用一个 httpx.AsyncClient 连接池（安装了 h2 时使用 HTTP/2）。重试规则同 LegalClient。
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, timeout: float = 120.0, max_connections: int = 32,
+                 http2: Optional[bool] = None, retries: int = 3, backoff: float = 0.5, max_backoff: float = 30.0,
+                 headers: Optional[Dict[str, str]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.retry = RetryPolicy(retries, backoff, max_backoff)
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url, timeout=timeout, headers=headers,
+            http2=HTTP2_AVAILABLE if http2 is None else http2, limits=http_limits(max_connections)
+        )
+
+    async def close(self):
+        await self._http.aclose()
+
+    async def __aenter__(self) -> "AsyncLegalClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # ========================
+    # 请求与重试
+    # ========================
+    async def _request(self, method: str, path: str, idempotent: bool = False, retry: bool = True,
+                       **kwargs) -> Any:
+        attempt = 0
+        while True:
+            try:
+                response = await self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if retry and self.retry.should_retry_error(attempt, e, idempotent):
+                    await asyncio.sleep(self.retry.delay(attempt))
+                    attempt += 1
+                    continue
+                raise APIConnectionError(f"{method} {path} 失败: {e}") from e
+            if response.status_code < 400:
+                return response.json()
+            if retry and self.retry.should_retry_status(attempt, response.status_code, idempotent):
+                await asyncio.sleep(self.retry.delay(attempt, retry_after_seconds(response)))
+                attempt += 1
+                continue
+            raise api_error(response)
+
+    async def _events(self, method: str, path: str, idempotent: bool = False, **kwargs) -> AsyncIterator[SSEEvent]:
+        """SSE 请求；只在收到事件之前重试"""
+        attempt = 0
+        while True:
+            started = False
+            delay = None
+            try:
+                async with self._http.stream(method, path, **kwargs) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        if not self.retry.should_retry_status(attempt, response.status_code, idempotent):
+                            raise api_error(response)
+                        delay = self.retry.delay(attempt, retry_after_seconds(response))
+                    else:
+                        decoder = SSEDecoder()
+                        async for line in response.aiter_lines():
+                            event = decoder.feed(line)
+                            if event is not None:
+                                started = True
+                                yield event
+                        return
+            except httpx.TransportError as e:
+                if started or not self.retry.should_retry_error(attempt, e, idempotent):
+                    raise APIConnectionError(f"{method} {path} 失败: {e}") from e
+                delay = self.retry.delay(attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _map(self, function: Callable[[Any], Awaitable[Any]], items: Iterable[Any], concurrency: int,
+                   return_exceptions: bool, on_result: Optional[Callable[[int, Any], None]]) -> List[Any]:
+        """最多 concurrency 个并发执行 function，结果按输入顺序返回；on_result(序号, 结果) 在完成时调用"""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(i: int, item: Any) -> Any:
+            async with semaphore:
+                try:
+                    result = await function(item)
+                except LegalClientError as e:
+                    if not return_exceptions:
+                        raise
+                    result = e
+            if on_result is not None:
+                on_result(i, result)
+            return result
+
+        tasks = [asyncio.ensure_future(run(i, item)) for i, item in enumerate(items)]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    # ========================
+    # 状态
+    # ========================
+    async def health(self) -> Dict[str, Any]:
+        return await self._request("GET", "/health", idempotent=True)
+
+    async def ready(self) -> Dict[str, Any]:
+        """就绪检查；加载中时抛出 APIError(503)，不重试"""
+        return await self._request("GET", "/health/ready", retry=False)
+
+    # ========================
+    # 咨询与检索
+    # ========================
+    async def query(self, question: str, session_id: Optional[str] = None, show_results: bool = False,
+                    filters: Optional[Dict[str, Any]] = None, priority: str = "interactive") -> Dict[str, Any]:
+        """法律咨询，返回 answer、session_id、route 等"""
+        return await self._request("POST", "/query",
+                                   json=query_payload(question, session_id, show_results, filters, priority))
+
+    def stream_query(self, question: str, session_id: Optional[str] = None, show_results: bool = False,
+                     filters: Optional[Dict[str, Any]] = None,
+                     priority: str = "interactive") -> AsyncIterator[SSEEvent]:
+        """流式法律咨询，逐个返回 meta / token / done / error 事件"""
+        return self._events("POST", "/query/stream",
+                            json=query_payload(question, session_id, show_results, filters, priority))
+
+    async def stream_answer(self, question: str, session_id: Optional[str] = None,
+                            meta: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        """流式法律咨询，逐段返回回答文本；meta / done 事件的内容写入 meta，error 事件抛出 APIError"""
+        async for event in self.stream_query(question, session_id, **kwargs):
+            if event.event == "token":
+                yield event.data["content"]
+            elif event.event == "error":
+                raise APIError(500, event.data.get("detail", "Unknown error"))
+            elif meta is not None:
+                meta.update(event.data)
+
+    async def search(self, query: str, k: int = 5, min_score: Optional[float] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """检索法律条文"""
+        return await self._request("POST", "/search", idempotent=True,
+                                   json=search_payload(query, k, min_score, filters))
+
+    async def prefetch(self, question: str, session_id: Optional[str] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> bool:
+        """输入过程中预取检索，返回是否已安排；失败不抛出异常"""
+        payload = {"question": question}
+        if session_id:
+            payload["session_id"] = session_id
+        if filters:
+            payload["filters"] = filters
+        try:
+            result = await self._request("POST", "/search/prefetch", retry=False, json=payload)
+            return result.get("accepted", False)
+        except LegalClientError:
+            return False
+
+    async def query_many(self, questions: Iterable[str], concurrency: int = 4, return_exceptions: bool = True,
+                         on_result: Optional[Callable[[int, Any], None]] = None, **kwargs) -> List[Any]:
+        """并发咨询多个问题（各自独立的会话），结果按输入顺序返回；失败的位置为异常对象"""
+        return await self._map(lambda question: self.query(question, **kwargs), questions, concurrency,
+                               return_exceptions, on_result)
+
+    async def search_many(self, queries: Iterable[str], concurrency: int = 8, return_exceptions: bool = True,
+                          on_result: Optional[Callable[[int, Any], None]] = None, **kwargs) -> List[Any]:
+        """并发检索多个查询，结果按输入顺序返回；失败的位置为异常对象"""
+        return await self._map(lambda query: self.search(query, **kwargs), queries, concurrency,
+                               return_exceptions, on_result)
+
+    # ========================
+    # 会话
+    # ========================
+    async def list_sessions(self) -> Dict[str, Any]:
+        return await self._request("GET", "/sessions", idempotent=True)
+
+    async def get_history(self, session_id: str) -> Dict[str, Any]:
+        return await self._request("GET", f"/sessions/{session_id}/history", idempotent=True)
+
+    # 重置与删除在可能已被处理时不重试：已成功的删除重试会返回 404，重置会清掉其间新增的消息
+    async def reset_session(self, session_id: str) -> Dict[str, Any]:
+        return await self._request("POST", f"/sessions/{session_id}/reset")
+
+    async def delete_session(self, session_id: str) -> Dict[str, Any]:
+        return await self._request("DELETE", f"/sessions/{session_id}")
+
+    async def get_summary(self, session_id: str) -> Dict[str, Any]:
+        """会话总结（阻塞到生成完成）"""
+        return await self._request("GET", f"/sessions/{session_id}/summary", idempotent=True)
+
+    # ========================
+    # 后台任务
+    # ========================
+    async def start_summary_job(self, session_id: str) -> Dict[str, Any]:
+        """提交会话总结任务；会话内容未变时返回已有任务"""
+        return await self._request("POST", f"/sessions/{session_id}/summary/jobs", idempotent=True)
+
+    async def get_job(self, job_id: str) -> Dict[str, Any]:
+        return await self._request("GET", f"/jobs/{job_id}", idempotent=True)
+
+    def job_events(self, job_id: str) -> AsyncIterator[SSEEvent]:
+        """订阅任务进度，逐个返回 progress / done / error 事件"""
+        return self._events("GET", f"/jobs/{job_id}/events", idempotent=True)
+
+    async def wait_job(self, job_id: str, interval: float = 0.5, timeout: Optional[float] = None,
+                       on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """轮询任务直到结束，返回最终状态；超时抛出 TimeoutError"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            job = await self.get_job(job_id)
+            if on_progress is not None:
+                on_progress(job)
+            if job["status"] in ("succeeded", "failed"):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"任务 {job_id} 未在 {timeout} 秒内完成")
+            await asyncio.sleep(interval)
+
+    async def summarize(self, session_id: str, timeout: Optional[float] = None,
+                        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """提交总结任务并等待结果（summary、session_id、timestamp）；任务失败时抛出 LegalClientError"""
+        job = await self.start_summary_job(session_id)
+        if job["status"] not in ("succeeded", "failed"):
+            job = await self.wait_job(job["job_id"], timeout=timeout, on_progress=on_progress)
+        if job["status"] == "failed":
+            raise LegalClientError(f"总结失败: {job['error']}")
+        return job["result"]
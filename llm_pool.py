@@ -0,0 +1,320 @@
+"""
+多后端LLM池：健康跟踪、对冲请求与故障转移
+
+只连一个 OpenAI 兼容服务时，尾延迟完全取决于这个服务最慢的时候。LLMPool 把多个后端
+（SiliconFlow、内网 qwen 服务等）组合成一个与 ChatOpenAI.stream 用法相同的对象：
+- 按配置顺序使用第一个可用的后端；
+- 首token 超过该后端近期 p95 仍未到达时，向下一个后端发出对冲请求，先出首token的一方胜出，另一方被中止；
+- 首token 之前出错时立即转到下一个后端；连续失败的后端熔断一段时间后再试。
+首token 之后出错无法无缝切换（已输出的内容不能撤回），直接抛出。
+"""
+
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+from metrics import LLM_BACKEND_AVAILABLE, LLM_BACKEND_REQUESTS, LLM_BACKEND_TTFT, LLM_FAILOVERS, LLM_HEDGES
+
+
+class Backend:
+    """一个 OpenAI 兼容后端及其健康状态"""
+
+    def __init__(self, name: str, llm, failure_threshold: int = 3, cooldown: float = 30, window: int = 100):
+        self.name = name
+        self.llm = llm
+        self.model = getattr(llm, "model_name", None)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.requests = 0
+        self.errors = 0
+        self.inflight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_error: Optional[str] = None
+        # 最近的首token耗时（秒）
+        self._ttfts = deque(maxlen=window)
+        self._lock = threading.Lock()
+        LLM_BACKEND_AVAILABLE.set(1, backend=name)
+
+    @property
+    def available(self) -> bool:
+        """未熔断；熔断期过后允许再试（失败则重新熔断）"""
+        return time.monotonic() >= self.open_until
+
+    def ttft_percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._ttfts)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def samples(self) -> int:
+        return len(self._ttfts)
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.inflight += 1
+
+    def end(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def record_ttft(self, seconds: float):
+        with self._lock:
+            self._ttfts.append(seconds)
+        LLM_BACKEND_TTFT.observe(seconds, backend=self.name)
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+        LLM_BACKEND_REQUESTS.inc(backend=self.name, result="ok")
+        LLM_BACKEND_AVAILABLE.set(1, backend=self.name)
+
+    def record_failure(self, error: BaseException):
+        with self._lock:
+            self.errors += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            tripped = self.consecutive_failures >= self.failure_threshold
+            if tripped:
+                self.open_until = time.monotonic() + self.cooldown
+        LLM_BACKEND_REQUESTS.inc(backend=self.name, result="error")
+        if tripped:
+            LLM_BACKEND_AVAILABLE.set(0, backend=self.name)
+            print(f"⚠️ LLM后端 {self.name} 连续失败 {self.consecutive_failures} 次，暂停使用 {self.cooldown:.0f} 秒")
+
+    def record_cancelled(self):
+        LLM_BACKEND_REQUESTS.inc(backend=self.name, result="cancelled")
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.ttft_percentile(0.5), self.ttft_percentile(0.95)
+        return {
+            "name": self.name,
+            "model": self.model,
+            "available": self.available,
+            "requests": self.requests,
+            "errors": self.errors,
+            "inflight": self.inflight,
+            "consecutive_failures": self.consecutive_failures,
+            "ttft_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "ttft_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class _Attempt:
+    """在一个后端上进行的一次流式调用（后台线程），输出写入共享队列"""
+
+    def __init__(self, backend: Backend, messages, events: queue.Queue, reason: str):
+        self.backend = backend
+        self.messages = messages
+        self.events = events
+        self.reason = reason
+        self.finished = False
+        self._cancelled = threading.Event()
+
+    def start(self):
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._run,),
+                         name=f"llm-{self.backend.name}", daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self):
+        backend = self.backend
+        backend.begin()
+        start = time.perf_counter()
+        started = False
+        try:
+            chunks = backend.llm.stream(self.messages)
+            try:
+                for chunk in chunks:
+                    if self._cancelled.is_set():
+                        break
+                    if not started:
+                        if not chunk.content:
+                            # 首token之前的角色等空段不算首token
+                            continue
+                        started = True
+                        backend.record_ttft(time.perf_counter() - start)
+                    self.events.put(("chunk", self, chunk))
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+            if self._cancelled.is_set():
+                if not started:
+                    # 被对冲请求抢先：实际首token耗时至少为此，计入样本避免 p95 偏低、对冲过多
+                    backend.record_ttft(time.perf_counter() - start)
+                backend.record_cancelled()
+            else:
+                backend.record_success()
+            self.events.put(("done", self, None))
+        except Exception as e:
+            if self._cancelled.is_set():
+                backend.record_cancelled()
+            else:
+                backend.record_failure(e)
+            self.events.put(("error", self, e))
+        finally:
+            backend.end()
+
+
+class LLMPool:
+    """多个后端组成的LLM，stream(messages) 与 ChatOpenAI.stream 用法相同"""
+
+    def __init__(self, backends: List[Backend], hedge: Optional[bool] = None):
+        if not backends:
+            raise ValueError("LLMPool 至少需要一个后端")
+        self.backends = backends
+        if hedge is None:
+            hedge = os.getenv("LLM_HEDGE", "true").lower() in ("1", "true", "yes")
+        self.hedge = hedge
+        # 样本不足时的对冲等待时间，以及等待时间下限（秒）
+        self.hedge_default = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "3000")) / 1000
+        self.hedge_min = float(os.getenv("LLM_HEDGE_MIN_MS", "200")) / 1000
+        self.hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        # 最近 100 次请求中最多对冲的比例，防止后端整体变慢时请求量翻倍
+        self.max_hedge_ratio = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+        self._recent_hedges = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self) -> Optional[str]:
+        return self.backends[0].model
+
+    def ordered_backends(self) -> List[Backend]:
+        """可用的后端按配置顺序在前，熔断中的放在最后（都不可用时仍然尝试）"""
+        available = [b for b in self.backends if b.available]
+        return available + [b for b in self.backends if not b.available]
+
+    def hedge_delay(self, backend: Backend) -> float:
+        """等待该后端首token的时间，超过后发出对冲请求"""
+        p95 = backend.ttft_percentile(0.95) if backend.samples() >= self.hedge_min_samples else None
+        return max(self.hedge_min, p95 if p95 is not None else self.hedge_default)
+
+    def _hedge_allowed(self) -> bool:
+        with self._lock:
+            return sum(self._recent_hedges) < self.max_hedge_ratio * self._recent_hedges.maxlen
+
+    def _record_request(self, hedged: bool):
+        with self._lock:
+            self._recent_hedges.append(hedged)
+
+    def stream(self, messages, **kwargs) -> Iterator[Any]:
+        candidates = self.ordered_backends()
+        if len(candidates) == 1:
+            yield from self._stream_single(candidates[0], messages)
+            return
+
+        events: queue.Queue = queue.Queue()
+        attempts: List[_Attempt] = []
+        pending = list(candidates)
+
+        def launch(reason: str) -> float:
+            attempt = _Attempt(pending.pop(0), messages, events, reason)
+            attempts.append(attempt)
+            attempt.start()
+            return time.monotonic() + self.hedge_delay(attempt.backend)
+
+        deadline = launch("primary")
+        hedged = False
+        winner: Optional[_Attempt] = None
+        last_error: Optional[BaseException] = None
+        try:
+            # 等待第一个输出首token的后端
+            while winner is None:
+                active = [a for a in attempts if not a.finished]
+                if not active:
+                    if not pending:
+                        raise last_error
+                    LLM_FAILOVERS.inc(backend=attempts[-1].backend.name)
+                    print(f"🔁 LLM后端 {attempts[-1].backend.name} 调用失败，转到 {pending[0].name}")
+                    deadline = launch("failover")
+                    continue
+
+                timeout = None
+                if self.hedge and not hedged and pending and len(active) == 1 and self._hedge_allowed():
+                    timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    kind, attempt, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedged = True
+                    LLM_HEDGES.inc(outcome="started")
+                    launch("hedge")
+                    continue
+
+                if kind == "chunk":
+                    winner = attempt
+                    yield payload
+                elif kind == "done":
+                    # 没有输出任何内容就正常结束
+                    attempt.finished = True
+                    winner = attempt
+                else:
+                    attempt.finished = True
+                    last_error = payload
+
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+            if winner.reason == "hedge":
+                LLM_HEDGES.inc(outcome="won")
+
+            # 继续输出胜出后端的内容，忽略被中止的请求
+            while not winner.finished:
+                kind, attempt, payload = events.get()
+                if attempt is not winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    winner.finished = True
+                else:
+                    raise payload
+        finally:
+            # 正常结束、出错或调用方停止读取时中止所有未结束的请求
+            for attempt in attempts:
+                attempt.cancel()
+            self._record_request(hedged)
+
+    def _stream_single(self, backend: Backend, messages) -> Iterator[Any]:
+        """只有一个后端时直接在调用线程中读取，只做健康统计"""
+        backend.begin()
+        start = time.perf_counter()
+        started = False
+        try:
+            for chunk in backend.llm.stream(messages):
+                if not started and chunk.content:
+                    started = True
+                    backend.record_ttft(time.perf_counter() - start)
+                yield chunk
+            backend.record_success()
+        except GeneratorExit:
+            backend.record_cancelled()
+            raise
+        except Exception as e:
+            backend.record_failure(e)
+            raise
+        finally:
+            backend.end()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = len(self._recent_hedges)
+            hedged = sum(self._recent_hedges)
+        return {
+            "hedge": self.hedge,
+            "recent_hedge_ratio": hedged / recent if recent else 0.0,
+            "backends": [
+                dict(backend.stats(), hedge_delay_ms=round(self.hedge_delay(backend) * 1000, 1))
+                for backend in self.backends
+            ],
+        }
@@ -31,13 +31,20 @@ with open(metadata_path, 'rb') as f:
 
 # 查询
 query = "夫妻共同债务如何认定"
-query_vec = model.encode([query])
+query_vec = np.ascontiguousarray(model.encode([query]), dtype=np.float32)
+use_cosine = index.metric_type == faiss.METRIC_INNER_PRODUCT
+if use_cosine:
+    # 内积索引由归一化向量构建，查询向量同样归一化后内积即余弦相似度
+    faiss.normalize_L2(query_vec)
 k = 5
-distances, indices = index.search(np.array(query_vec), k)
+distances, indices = index.search(query_vec, k)
 
 print("Top results:")
 for idx, i in enumerate(indices[0]):
-    print(f"\nScore: {1 / (1 + distances[0][idx]):.4f}")
+    if i < 0:
+        continue
+    score = distances[0][idx] if use_cosine else 1 / (1 + distances[0][idx])
+    print(f"\nScore: {score:.4f}")
     print(f"法规名称: {metadata[i]['law_name']}")
     print(f"文件名: {metadata[i]['filename']}")
     print(f"内容: {metadata[i]['content']}")
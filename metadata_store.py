@@ -0,0 +1,193 @@
+"""
+内存映射的元数据列存储
+
+metadata.pkl 反序列化后是每个进程私有的 list[dict]，多 worker 部署时会按进程数成倍占用内存。
+这里把元数据转换为按列存放的文件（字符串列：UTF-8 拼接 + 偏移数组；整数列：npy），
+以只读 mmap 方式打开，多个进程通过操作系统页缓存共享同一份数据。
+"""
+
+import json
+import os
+import pickle
+import shutil
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows：不加锁（单进程部署）
+    fcntl = None
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def get_store_dir(metadata_path: str) -> str:
+    """metadata.pkl 对应的列存储目录（metadata.store）"""
+    root, _ = os.path.splitext(metadata_path)
+    return root + '.store'
+
+
+def _source_signature(path: str) -> Dict[str, int]:
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _is_int_column(values: List[Any]) -> bool:
+    return all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in values)
+
+
+def write_metadata_store(metadata: List[Dict[str, Any]], store_dir: str, source: Dict[str, int] = None):
+    """将元数据写为列存储（先写临时目录再重命名，避免读到写了一半的文件）"""
+    fields = []
+    for record in metadata:
+        for name in record:
+            if name not in fields:
+                fields.append(name)
+
+    tmp_dir = f"{store_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = {}
+    for name in fields:
+        values = [record.get(name) for record in metadata]
+        if _is_int_column(values):
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(values, dtype=np.int64))
+            columns[name] = 'int'
+            continue
+
+        encoded = [('' if v is None else str(v)).encode('utf-8') for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        with open(os.path.join(tmp_dir, f"{name}.bin"), 'wb') as f:
+            for b in encoded:
+                f.write(b)
+        np.save(os.path.join(tmp_dir, f"{name}.offsets.npy"), offsets)
+        columns[name] = 'str'
+
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'count': len(metadata), 'columns': columns, 'source': source or {}}, f)
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, store_dir)
+    except OSError:
+        # 其他进程已经写好了同一份存储
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class _StringColumn:
+    """UTF-8 拼接存储的字符串列"""
+
+    def __init__(self, blob_path: str, offsets_path: str):
+        self.offsets = np.load(offsets_path, mmap_mode='r')
+        if os.path.getsize(blob_path) > 0:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+
+class MetadataStore:
+    """只读的元数据列存储，按行返回与 metadata.pkl 相同结构的字典"""
+
+    def __init__(self, store_dir: str):
+        with open(os.path.join(store_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+
+        self.store_dir = store_dir
+        self._count = self.manifest['count']
+        self.columns = {}
+        for name, kind in self.manifest['columns'].items():
+            if kind == 'int':
+                self.columns[name] = np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode='r')
+            else:
+                self.columns[name] = _StringColumn(
+                    os.path.join(store_dir, f"{name}.bin"),
+                    os.path.join(store_dir, f"{name}.offsets.npy")
+                )
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return {
+            name: int(column[i]) if self.manifest['columns'][name] == 'int' else column[i]
+            for name, column in self.columns.items()
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self._count):
+            yield self[i]
+
+    def get_field(self, i: int, name: str, default: Any = None) -> Any:
+        """只读取一列，避免构造整行字典"""
+        column = self.columns.get(name)
+        if column is None:
+            return default
+        value = column[i]
+        return int(value) if self.manifest['columns'][name] == 'int' else value
+
+
+def int_column(metadata, name: str):
+    """整数列的 numpy 数组（列存储时直接返回 mmap 数组）；任何一行缺少该字段时返回 None"""
+    if isinstance(metadata, MetadataStore):
+        if metadata.manifest['columns'].get(name) != 'int':
+            return None
+        return metadata.columns[name]
+
+    values = [record.get(name) for record in metadata]
+    if not values or any(v is None for v in values):
+        return None
+    return np.asarray(values, dtype=np.int64)
+
+
+def load_metadata(metadata_path: str, mmap: bool = False):
+    """加载元数据；mmap=True 时使用（必要时先生成）列存储"""
+    if not mmap:
+        with open(metadata_path, 'rb') as f:
+            return pickle.load(f)
+
+    store_dir = get_store_dir(metadata_path)
+    source = _source_signature(metadata_path)
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+
+    # 多个 worker 同时热加载时串行化：先拿到锁的进程重建，其余进程等待后看到新的 manifest 直接打开。
+    # 打开（mmap）也在锁内完成，之后目录即使被其他进程替换，已映射的文件仍然有效
+    with _store_lock(store_dir):
+        stale = True
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                stale = json.load(f).get('source') != source
+
+        if stale:
+            with open(metadata_path, 'rb') as f:
+                metadata = pickle.load(f)
+            write_metadata_store(metadata, store_dir, source)
+            del metadata
+
+        return MetadataStore(store_dir)
+
+
+@contextmanager
+def _store_lock(store_dir: str):
+    """跨进程的列存储目录锁（store_dir.lock 上的 flock）"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{store_dir}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
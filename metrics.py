@@ -0,0 +1,259 @@
+"""
+Prometheus 文本格式的运行指标（无外部依赖）
+
+agent.py 与 restful/main.py 在各处理阶段记录耗时与计数，
+/metrics 接口以 Prometheus exposition 格式输出，供 Prometheus 抓取。
+多 worker 部署时每个进程各自统计。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，也可以在抓取时通过回调计算"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """抓取时调用 function 获取当前值（仅用于无标签指标）"""
+        self._function = function
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各桶计数 + sum + count
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            for i, bound in enumerate(self.buckets):
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {_format_value(state[i])}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {repr(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ========================
+# 指标定义
+# ========================
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "legal_http_requests_total", "HTTP请求数", ("method", "endpoint", "status")))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "legal_http_request_duration_seconds", "HTTP请求总耗时", ("method", "endpoint")))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "legal_stage_duration_seconds",
+    "咨询流程各阶段耗时（encode/vector_search/prompt_build/llm_ttft/llm_total 等）", ("stage",)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "legal_cache_requests_total", "缓存查询次数（result=hit/miss）", ("cache", "result")))
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "legal_active_sessions", "活跃会话数"))
+LLM_INFLIGHT = REGISTRY.register(Gauge(
+    "legal_llm_inflight_requests", "正在进行的LLM调用数", ("agent",)))
+ADMISSION_INFLIGHT = REGISTRY.register(Gauge(
+    "legal_admission_inflight", "已取得名额、正在生成的请求数", ("priority",)))
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "legal_admission_queue_depth", "排队等待生成名额的请求数", ("priority",)))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "legal_admission_rejected_total", "被拒绝的请求数（reason=queue_full/queue_timeout/preempted）",
+    ("priority", "reason")))
+ROUTE_REQUESTS = REGISTRY.register(Counter(
+    "legal_llm_route_total", "按难度路由的问答数（route=fast/strong）", ("route",)))
+ROUTE_LATENCY = REGISTRY.register(Histogram(
+    "legal_llm_route_duration_seconds", "各路由的LLM耗时（phase=ttft/total）", ("route", "phase")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "legal_llm_tokens_total", "各路由消耗的token数（kind=prompt/completion/cached_prompt，服务端未返回用量时为估算值）",
+    ("route", "kind")))
+LLM_COST = REGISTRY.register(Counter(
+    "legal_llm_cost_total", "各路由的LLM成本（按 ROUTER_*_COST_PER_1K 计算）", ("route",)))
+PROMPT_CACHE_RATIO = REGISTRY.register(Histogram(
+    "legal_llm_prompt_cache_ratio", "每次问答中命中服务端前缀缓存的 prompt token 比例（turn=first/follow_up）",
+    ("route", "turn"), buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)))
+LLM_BACKEND_REQUESTS = REGISTRY.register(Counter(
+    "legal_llm_backend_requests_total", "各LLM后端的调用数（result=ok/error/cancelled）", ("backend", "result")))
+LLM_BACKEND_TTFT = REGISTRY.register(Histogram(
+    "legal_llm_backend_ttft_seconds", "各LLM后端的首token耗时（被对冲请求抢先的按中止时的耗时计）", ("backend",)))
+LLM_BACKEND_AVAILABLE = REGISTRY.register(Gauge(
+    "legal_llm_backend_available", "LLM后端是否可用（0表示连续失败后熔断中）", ("backend",)))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "legal_llm_hedges_total", "对冲请求数（outcome=started 发出 / won 先于原请求输出首token）", ("outcome",)))
+LLM_FAILOVERS = REGISTRY.register(Counter(
+    "legal_llm_failovers_total", "首token前出错后转到下一个后端的次数（backend 为出错的后端）", ("backend",)))
+WS_CONNECTIONS = REGISTRY.register(Gauge(
+    "legal_ws_connections", "当前的 WebSocket 对话连接数"))
+WS_TURNS = REGISTRY.register(Counter(
+    "legal_ws_turns_total", "WebSocket 对话的问答轮数（result=done/cancelled/rejected/error）", ("result",)))
+TRACES_DROPPED = REGISTRY.register(Counter(
+    "legal_traces_dropped_total", "导出队列已满（导出器过慢或不可用）而丢弃的 trace 数"))
+JOBS_TOTAL = REGISTRY.register(Counter(
+    "legal_jobs_total", "后台任务数（result=submitted/reused/rejected/succeeded/failed，reused 为复用已有任务或结果）",
+    ("kind", "result")))
+
+
+def observe_stage(stage: str, seconds: float):
+    """记录某个阶段的耗时"""
+    STAGE_LATENCY.observe(seconds, stage=stage)
+
+
+def time_stage(stage: str):
+    """计时上下文管理器：with time_stage("encode"): ..."""
+    return STAGE_LATENCY.time(stage=stage)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """记录一次缓存查询结果"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def render_metrics() -> str:
+    """以 Prometheus 文本格式输出全部指标"""
+    return REGISTRY.render()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容的模拟LLM服务
+
+实现 /v1/chat/completions（含 stream=true 的 SSE 流式输出）和 /v1/models，
+首token延迟、输出速度、输出长度、错误率均可配置，用于在没有真实LLM的情况下对整套服务做压测和性能分析。
+模拟按整条消息匹配的前缀缓存：usage 中返回 prompt_tokens_details.cached_tokens（流式请求需
+stream_options.include_usage），设置 --prefill-tokens-per-sec 后未命中缓存的 prompt 会增加首token延迟。
+
+用法:
+    python mock_llm_server.py --port 9000 --ttft-ms 800 --tokens-per-sec 40 --output-tokens 300
+
+    # 让API服务使用模拟LLM
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=mock ./start_system.sh
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# 模拟回答的素材，按"token"切分后循环使用
+ANSWER_TEXT = (
+    "根据您提供的法条内容，结合您的问题分析如下：一、法律依据。相关法律规定，当事人应当按照约定全面履行自己的义务，"
+    "违反约定的应当承担继续履行、采取补救措施或者赔偿损失等违约责任。二、具体分析。结合您描述的情况，"
+    "建议首先收集并保存相关证据材料，包括合同、付款凭证、聊天记录等，其次可以与对方协商解决，"
+    "协商不成的可以向有关部门投诉或者依法向人民法院提起诉讼。三、注意事项。请注意诉讼时效期间为三年，"
+    "自权利人知道或者应当知道权利受到损害以及义务人之日起计算。以上建议仅供参考，具体情况请咨询专业律师。"
+)
+CHARS_PER_TOKEN = 2
+PREFIX_CACHE_SIZE = 10000
+
+
+class MockSettings:
+    """模拟参数（可在运行时通过 /mock/config 修改）"""
+
+    def __init__(self):
+        self.ttft_ms = float(os.getenv("MOCK_TTFT_MS", "500"))
+        self.tokens_per_sec = float(os.getenv("MOCK_TOKENS_PER_SEC", "30"))
+        self.output_tokens = int(os.getenv("MOCK_OUTPUT_TOKENS", "200"))
+        self.jitter = float(os.getenv("MOCK_JITTER", "0.1"))
+        self.error_rate = float(os.getenv("MOCK_ERROR_RATE", "0"))
+        self.max_concurrency = int(os.getenv("MOCK_MAX_CONCURRENCY", "0"))
+        # 未命中前缀缓存的 prompt 的处理速度（0 表示 prompt 长度不影响首token延迟）
+        self.prefill_tokens_per_sec = float(os.getenv("MOCK_PREFILL_TOKENS_PER_SEC", "0"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class ChatMessage(BaseModel):
+    role: str
+    content: Any = ""
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str = "mock-llm"
+    messages: List[ChatMessage]
+    stream: bool = False
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    stream_options: Optional[Dict[str, Any]] = None
+
+
+class ConfigUpdate(BaseModel):
+    ttft_ms: Optional[float] = None
+    tokens_per_sec: Optional[float] = None
+    output_tokens: Optional[int] = None
+    jitter: Optional[float] = None
+    error_rate: Optional[float] = None
+    prefill_tokens_per_sec: Optional[float] = None
+
+
+settings = MockSettings()
+stats = {"requests": 0, "streaming": 0, "errors": 0, "inflight": 0, "max_inflight": 0, "rejected": 0,
+         "prompt_tokens": 0, "cached_tokens": 0}
+# 见过的消息前缀（逐条消息累积的哈希 -> 该前缀的 token 数）
+prefix_cache: "OrderedDict[str, int]" = OrderedDict()
+
+app = FastAPI(title="Mock OpenAI-compatible LLM", version="1.0.0")
+
+
+def _jittered(value: float) -> float:
+    if settings.jitter <= 0:
+        return value
+    return max(0.0, value * random.uniform(1 - settings.jitter, 1 + settings.jitter))
+
+
+def _tokens(count: int) -> List[str]:
+    text = ANSWER_TEXT * (count * CHARS_PER_TOKEN // len(ANSWER_TEXT) + 1)
+    return [text[i * CHARS_PER_TOKEN:(i + 1) * CHARS_PER_TOKEN] for i in range(count)]
+
+
+def _prompt_tokens(messages: List[ChatMessage]) -> Tuple[int, int]:
+    """返回 (prompt token 数, 命中前缀缓存的 token 数)，并记录本次请求的各级前缀"""
+    digest = hashlib.sha1()
+    total = cached = 0
+    for message in messages:
+        digest.update(f"{message.role}\x00{message.content}\x01".encode('utf-8'))
+        total += len(str(message.content)) // CHARS_PER_TOKEN
+        key = digest.hexdigest()
+        if key in prefix_cache:
+            prefix_cache.move_to_end(key)
+            cached = total
+        else:
+            prefix_cache[key] = total
+    while len(prefix_cache) > PREFIX_CACHE_SIZE:
+        prefix_cache.popitem(last=False)
+    stats["prompt_tokens"] += total
+    stats["cached_tokens"] += cached
+    return total, cached
+
+
+def _usage(prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+
+
+def _prefill_seconds(prompt_tokens: int, cached_tokens: int) -> float:
+    if settings.prefill_tokens_per_sec <= 0:
+        return 0.0
+    return (prompt_tokens - cached_tokens) / settings.prefill_tokens_per_sec
+
+
+def _chunk(completion_id: str, model: str, delta: Dict[str, str], finish_reason: Optional[str] = None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _admit():
+    """按配置模拟上游错误和并发限制"""
+    stats["requests"] += 1
+    if settings.max_concurrency and stats["inflight"] >= settings.max_concurrency:
+        stats["rejected"] += 1
+        raise HTTPException(status_code=429, detail="Too many concurrent requests")
+    if settings.error_rate and random.random() < settings.error_rate:
+        stats["errors"] += 1
+        raise HTTPException(status_code=500, detail="Mock upstream error")
+
+
+class _Inflight:
+    def __enter__(self):
+        stats["inflight"] += 1
+        stats["max_inflight"] = max(stats["max_inflight"], stats["inflight"])
+
+    def __exit__(self, *exc):
+        stats["inflight"] -= 1
+
+
+async def _stream(request: ChatCompletionRequest, tokens: List[str], prompt_tokens: int, cached_tokens: int):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    with _Inflight():
+        await asyncio.sleep(_jittered(settings.ttft_ms) / 1000 + _prefill_seconds(prompt_tokens, cached_tokens))
+        yield _chunk(completion_id, request.model, {"role": "assistant", "content": ""})
+
+        interval = 1 / settings.tokens_per_sec if settings.tokens_per_sec > 0 else 0
+        start = time.perf_counter()
+        for i, token in enumerate(tokens):
+            # 按目标速率输出，sleep 的误差不会累积
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield _chunk(completion_id, request.model, {"content": token})
+
+        yield _chunk(completion_id, request.model, {}, finish_reason="stop")
+        if (request.stream_options or {}).get("include_usage"):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.model,
+                "choices": [],
+                "usage": _usage(prompt_tokens, cached_tokens, len(tokens)),
+            }
+            yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    _admit()
+    count = request.max_tokens if request.max_tokens else settings.output_tokens
+    count = max(1, int(_jittered(min(count, settings.output_tokens))))
+    tokens = _tokens(count)
+    prompt_tokens, cached_tokens = _prompt_tokens(request.messages)
+
+    if request.stream:
+        stats["streaming"] += 1
+        return StreamingResponse(_stream(request, tokens, prompt_tokens, cached_tokens),
+                                 media_type="text/event-stream")
+
+    with _Inflight():
+        generation = count / settings.tokens_per_sec if settings.tokens_per_sec > 0 else 0
+        prefill = _prefill_seconds(prompt_tokens, cached_tokens)
+        await asyncio.sleep(_jittered(settings.ttft_ms) / 1000 + prefill + generation)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(tokens)},
+            "finish_reason": "stop",
+        }],
+        "usage": _usage(prompt_tokens, cached_tokens, count),
+    }
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "mock-llm", "object": "model", "owned_by": "mock"}]}
+
+
+@app.get("/mock/stats")
+async def get_stats():
+    return {"stats": stats, "config": settings.to_dict()}
+
+
+@app.post("/mock/config")
+async def update_config(update: ConfigUpdate):
+    """压测过程中调整模拟参数，例如逐步增大首token延迟"""
+    for name, value in update.dict().items():
+        if value is not None:
+            setattr(settings, name, value)
+    return settings.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI兼容的模拟LLM服务")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--ttft-ms', type=float, default=settings.ttft_ms, help='首token延迟（毫秒）')
+    parser.add_argument('--tokens-per-sec', type=float, default=settings.tokens_per_sec, help='输出速度')
+    parser.add_argument('--output-tokens', type=int, default=settings.output_tokens, help='每次回答的token数')
+    parser.add_argument('--jitter', type=float, default=settings.jitter, help='延迟与长度的随机波动比例')
+    parser.add_argument('--error-rate', type=float, default=settings.error_rate, help='返回500的比例')
+    parser.add_argument('--max-concurrency', type=int, default=settings.max_concurrency,
+                        help='超过该并发数返回429（0为不限制）')
+    parser.add_argument('--prefill-tokens-per-sec', type=float, default=settings.prefill_tokens_per_sec,
+                        help='未命中前缀缓存的prompt处理速度（0为不模拟）')
+    args = parser.parse_args()
+
+    settings.ttft_ms = args.ttft_ms
+    settings.tokens_per_sec = args.tokens_per_sec
+    settings.output_tokens = args.output_tokens
+    settings.jitter = args.jitter
+    settings.error_rate = args.error_rate
+    settings.max_concurrency = args.max_concurrency
+    settings.prefill_tokens_per_sec = args.prefill_tokens_per_sec
+
+    print(f"🤖 模拟LLM服务 http://{args.host}:{args.port}/v1  "
+          f"TTFT={settings.ttft_ms}ms  {settings.tokens_per_sec} tokens/s  {settings.output_tokens} tokens")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
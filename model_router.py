@@ -0,0 +1,103 @@
+"""
+按问题难度选择模型
+
+简单的法条查询（"醉酒驾驶会被怎么处罚"，答案就是检索到的一条法条）不需要 32B 长上下文模型。
+ModelRouter 根据检索置信度（最高相关度及其与第二名的差距）、问题长度和对话轮数判断难度：
+简单问题交给 OPENAI_FAST_MODEL 配置的快速模型，其余交给 OPENAI_MODEL。
+没有配置快速模型时所有问题都走 strong。相关度阈值按余弦相似度设定，旧版L2索引的分数
+（1/(1+距离)）尺度不同，无法比较，此时所有问题都走 strong。
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+# 需要推理、比较或假设的问题特征词
+REASONING_MARKERS = ('如果', '假如', '是否', '能否', '区别', '比较', '为什么', '哪个', '还是', '同时', '但是', '而且')
+# 服务端不返回用量时按字符数估算 token（中文约 1.5 字/token）
+CHARS_PER_TOKEN = 1.5
+
+
+def estimate_tokens(chars: int) -> int:
+    return int(round(chars / CHARS_PER_TOKEN))
+
+
+@dataclass
+class RouteDecision:
+    """路由结果：route 为 fast/strong，reasons 说明走 strong 的原因"""
+    route: str
+    reasons: List[str] = field(default_factory=list)
+    features: Dict[str, Any] = field(default_factory=dict)
+
+
+class ModelRouter:
+    """按检索置信度、问题长度与对话轮数在快速模型与大模型之间路由"""
+
+    def __init__(self, fast_llm=None, strong_llm=None):
+        self.fast_llm = fast_llm
+        self.strong_llm = strong_llm
+        self.min_score = float(os.getenv("ROUTER_MIN_SCORE", "0.6"))
+        self.min_margin = float(os.getenv("ROUTER_MIN_MARGIN", "0.02"))
+        self.max_chars = int(os.getenv("ROUTER_MAX_CHARS", "40"))
+        self.max_history_turns = int(os.getenv("ROUTER_MAX_HISTORY_TURNS", "1"))
+        self._warned_non_cosine = False
+        # 每千 token 的价格（任意货币单位），用于统计各路由的成本
+        self.cost_per_1k = {
+            "fast": float(os.getenv("ROUTER_FAST_COST_PER_1K", "0")),
+            "strong": float(os.getenv("ROUTER_STRONG_COST_PER_1K", "0")),
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.fast_llm is not None
+
+    def classify(self, question: str, history_turns: int, scores: List[float], cosine: bool = True) -> RouteDecision:
+        """只看特征、不依赖模型是否配置的分类（evaluate_routing.py 也用它）
+        
+        cosine 为 False 表示分数不是余弦相似度（L2索引），不按相关度判断，直接走 strong。
+        """
+        top = scores[0] if scores else 0.0
+        margin = top - scores[1] if len(scores) > 1 else top
+        length = len(question.strip())
+        markers = [m for m in REASONING_MARKERS if m in question]
+        features = {
+            "top_score": round(top, 4),
+            "margin": round(margin, 4),
+            "chars": length,
+            "history_turns": history_turns,
+            "markers": markers,
+            "cosine": cosine,
+        }
+
+        reasons = []
+        if not scores:
+            reasons.append("no_hits")
+        elif not cosine:
+            reasons.append("non_cosine_index")
+        elif top < self.min_score:
+            reasons.append("low_score")
+        elif margin < self.min_margin:
+            # 前几条相关度接近，需要综合多条法条
+            reasons.append("ambiguous")
+        if length > self.max_chars:
+            reasons.append("long_question")
+        if history_turns > self.max_history_turns:
+            reasons.append("deep_history")
+        if markers:
+            reasons.append("reasoning")
+        return RouteDecision("strong" if reasons else "fast", reasons, features)
+
+    def route(self, question: str, history_turns: int, scores: List[float], cosine: bool = True) -> RouteDecision:
+        if not self.enabled:
+            return RouteDecision("strong", ["no_fast_model"])
+        if not cosine and not self._warned_non_cosine:
+            self._warned_non_cosine = True
+            print("⚠️ 当前为L2索引，检索分数不是余弦相似度，模型路由不生效（全部使用 OPENAI_MODEL），"
+                  "请用 INDEX_TYPE=flat_ip 重建索引")
+        return self.classify(question, history_turns, scores, cosine)
+
+    def llm_for(self, decision: RouteDecision):
+        return self.fast_llm if decision.route == "fast" else self.strong_llm
+
+    def cost(self, route: str, tokens: int) -> float:
+        return self.cost_per_1k.get(route, 0.0) * tokens / 1000
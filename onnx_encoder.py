@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+查询编码器的ONNX/int8 CPU推理路径
+
+将 SentenceTransformer 模型导出为ONNX，并使用ONNX Runtime动态int8量化，
+池化与归一化方式与原PyTorch模型保持一致。
+
+用法:
+    python onnx_encoder.py export --output onnx_model
+    python onnx_encoder.py evaluate --model-dir onnx_model --k 5
+"""
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import time
+from typing import Dict, List, Union
+
+import numpy as np
+
+# 设置环境变量来避免 tokenizers 警告
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+CONFIG_FILE = 'encoder_config.json'
+FP32_FILE = 'model.onnx'
+INT8_FILE = 'model_int8.onnx'
+
+
+def get_data_file_path(relative_path: str) -> str:
+    """获取数据文件的绝对路径"""
+    if os.path.isabs(relative_path):
+        return relative_path
+
+    # 相对于项目根目录
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, relative_path)
+
+
+def _pooling_mode(pooling_module) -> str:
+    """读取 SentenceTransformer 池化层的配置"""
+    if getattr(pooling_module, 'pooling_mode_cls_token', False):
+        return 'cls'
+    if getattr(pooling_module, 'pooling_mode_max_tokens', False):
+        return 'max'
+    return 'mean'
+
+
+def export_onnx_model(output_dir: str, model_name: str = MODEL_NAME,
+                      quantize: bool = True, opset: int = 14) -> Dict[str, str]:
+    """导出ONNX模型，并可选地生成动态int8量化版本"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0]
+    tokenizer = transformer.tokenizer
+    module_names = [type(module).__name__ for module in model]
+
+    class _EncoderWrapper(torch.nn.Module):
+        """只输出 last_hidden_state，池化在ONNX外部完成"""
+
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, input_ids, attention_mask):
+            return self.auto_model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.save_pretrained(output_dir)
+
+    wrapper = _EncoderWrapper(transformer.auto_model.eval())
+    dummy = tokenizer(["劳动合同解除的法律规定"], padding=True, truncation=True, return_tensors='pt')
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+
+    print(f"Exporting {model_name} to {fp32_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (dummy['input_ids'], dummy['attention_mask']),
+            fp32_path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'last_hidden_state': {0: 'batch', 1: 'sequence'},
+            },
+            opset_version=opset,
+        )
+
+    paths = {'fp32': fp32_path}
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, INT8_FILE)
+        print(f"Quantizing to {int8_path}...")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        paths['int8'] = int8_path
+
+    config = {
+        'model_name': model_name,
+        'max_seq_length': model.max_seq_length,
+        'pooling': _pooling_mode(model[1]) if len(model) > 1 else 'mean',
+        'normalize': 'Normalize' in module_names,
+        'dimension': model.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+    return paths
+
+
+class ONNXEncoder:
+    """基于ONNX Runtime的句向量编码器，接口与 SentenceTransformer.encode 兼容"""
+
+    def __init__(self, model_dir: str, quantized: bool = True, num_threads: int = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = get_data_file_path(model_dir)
+        config_path = os.path.join(model_dir, CONFIG_FILE)
+        if not os.path.exists(config_path):
+            raise FileNotFoundError(
+                f"ONNX encoder not found: {model_dir}，请先运行 python onnx_encoder.py export"
+            )
+
+        with open(config_path, 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+
+        model_path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model file not found: {model_path}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = self.config.get('max_seq_length', 128)
+        self.model_path = model_path
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config['dimension']
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """与 sentence_transformers.models.Pooling 相同的池化方式"""
+        pooling = self.config.get('pooling', 'mean')
+        if pooling == 'cls':
+            return hidden[:, 0]
+        mask = mask[..., None].astype(hidden.dtype)
+        if pooling == 'max':
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        summed = (hidden * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        return summed / counts
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """编码句子，返回 float32 向量"""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            encoded = self.tokenizer(
+                batch, padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors='np'
+            )
+            feeds = {
+                name: encoded[name].astype(np.int64)
+                for name in ('input_ids', 'attention_mask', 'token_type_ids')
+                if name in self.input_names and name in encoded
+            }
+            hidden = self.session.run(None, feeds)[0]
+            embeddings.append(self._pool(hidden, encoded['attention_mask']))
+
+        if embeddings:
+            vectors = np.vstack(embeddings).astype(np.float32)
+        else:
+            vectors = np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        if self.config.get('normalize'):
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+        return vectors[0] if single else vectors
+
+
+def load_questions(csv_files: List[str]) -> List[str]:
+    """从 law_qa_samples 读取问题（去重，保持顺序）"""
+    questions = []
+    seen = set()
+    for csv_file in csv_files:
+        with open(get_data_file_path(csv_file), 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                question = (row.get('question') or '').strip()
+                if question and question not in seen:
+                    seen.add(question)
+                    questions.append(question)
+    return questions
+
+
+def _latency_stats(encoder, questions: List[str], runs: int) -> Dict[str, float]:
+    """逐条编码的延迟统计（毫秒）"""
+    encoder.encode(questions[:4])  # 预热
+    latencies = []
+    for _ in range(runs):
+        for question in questions:
+            start = time.perf_counter()
+            encoder.encode([question])
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        'mean_ms': statistics.fmean(latencies),
+    }
+
+
+def evaluate(model_dir: str, csv_files: List[str], k: int = 5, runs: int = 3,
+             index_path: str = None) -> Dict[str, Dict[str, float]]:
+    """对比PyTorch与ONNX编码器的检索一致性和延迟"""
+    import faiss
+    from sentence_transformers import SentenceTransformer
+
+    questions = load_questions(csv_files)
+    print(f"Loaded {len(questions)} questions")
+
+    index = faiss.read_index(get_data_file_path(index_path or os.getenv("FAISS_INDEX_PATH", "law_index.bin")))
+
+    encoders = {'torch': SentenceTransformer(MODEL_NAME, device='cpu')}
+    for name, quantized in (('onnx_fp32', False), ('onnx_int8', True)):
+        try:
+            encoders[name] = ONNXEncoder(model_dir, quantized=quantized)
+        except FileNotFoundError as e:
+            print(f"跳过 {name}: {e}")
+
+    # 内积索引需要归一化的查询向量
+    normalize = index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+    def search(vectors: np.ndarray) -> np.ndarray:
+        if normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return index.search(np.ascontiguousarray(vectors), k)[1]
+
+    reference = np.asarray(encoders['torch'].encode(questions), dtype=np.float32)
+    reference_ids = search(reference)
+
+    report = {}
+    for name, encoder in encoders.items():
+        vectors = np.asarray(encoder.encode(questions), dtype=np.float32)
+        ids = search(vectors)
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(reference_ids, ids)]
+        cosine = np.sum(reference * vectors, axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1)
+        )
+
+        stats = _latency_stats(encoder, questions, runs)
+        stats[f'top{k}_overlap'] = float(np.mean(overlap))
+        stats['top1_agreement'] = float(np.mean(reference_ids[:, 0] == ids[:, 0]))
+        stats['min_cosine'] = float(cosine.min())
+        report[name] = stats
+
+    print(f"\n{'encoder':<12}{'p50(ms)':>10}{'p95(ms)':>10}{'mean(ms)':>10}"
+          f"{f'top{k}重合':>12}{'top1一致':>10}{'最小cos':>10}")
+    for name, stats in report.items():
+        print(f"{name:<12}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['mean_ms']:>10.2f}"
+              f"{stats[f'top{k}_overlap']:>12.3f}{stats['top1_agreement']:>10.3f}{stats['min_cosine']:>10.4f}")
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询编码器ONNX导出与评估")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='导出ONNX模型并量化')
+    export_parser.add_argument('--output', default=os.getenv("ONNX_MODEL_DIR", "onnx_model"))
+    export_parser.add_argument('--model', default=MODEL_NAME)
+    export_parser.add_argument('--no-quantize', action='store_true', help='只导出FP32模型')
+
+    eval_parser = subparsers.add_parser('evaluate', help='对比检索结果与延迟')
+    eval_parser.add_argument('--model-dir', default=os.getenv("ONNX_MODEL_DIR", "onnx_model"))
+    eval_parser.add_argument('--k', type=int, default=5)
+    eval_parser.add_argument('--runs', type=int, default=3)
+    eval_parser.add_argument('--index', default=None, help='FAISS索引路径')
+    eval_parser.add_argument('--output', default=None, help='将评估结果写入JSON文件')
+    eval_parser.add_argument('--csv', nargs='+', default=['law_qa_samples_100.csv'])
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        paths = export_onnx_model(get_data_file_path(args.output), args.model,
+                                  quantize=not args.no_quantize)
+        for name, path in paths.items():
+            print(f"✅ {name}: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+    else:
+        report = evaluate(args.model_dir, args.csv, k=args.k, runs=args.runs, index_path=args.index)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+追问改写（本地关键词匹配，不调用LLM）
+
+"那赔偿多少？"这类追问单独检索效果很差。QueryCondenser 根据最近的对话维护当前话题
+（法规名称 + 法律主题词，保存在 ConversationContext.current_topic），并把追问改写为可以
+独立检索的查询，例如 "劳动合同法 解除劳动合同 那赔偿多少？"。
+只做字符串匹配，耗时在毫秒以内；同一会话同一轮的改写结果会被缓存。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from cache import TTLCache, normalize_query
+from metrics import record_cache_lookup
+
+# 法律主题词（长词优先匹配，"解除劳动合同"不会再拆出"劳动合同"）
+TOPIC_TERMS = (
+    # 劳动
+    '劳动合同', '解除劳动合同', '劳动仲裁', '劳务派遣', '试用期', '工资', '加班', '加班费', '经济补偿',
+    '辞退', '裁员', '竞业限制', '工伤', '社会保险', '社保', '公积金', '年休假', '产假',
+    # 婚姻家庭与继承
+    '离婚', '结婚', '彩礼', '抚养权', '抚养费', '探望权', '赡养', '夫妻共同财产', '夫妻共同债务',
+    '家庭暴力', '家暴', '收养', '继承', '遗嘱', '遗产',
+    # 合同与债务
+    '买卖合同', '借款', '民间借贷', '欠款', '利息', '担保', '保证人', '抵押', '违约', '定金', '合同',
+    # 房产与土地
+    '租赁', '租房', '押金', '房屋买卖', '购房', '商品房', '物业', '业主', '拆迁', '征收', '宅基地', '土地承包',
+    # 侵权与人身
+    '交通事故', '酒驾', '醉驾', '医疗事故', '医疗纠纷', '人身损害', '精神损害', '名誉权', '肖像权',
+    '隐私', '个人信息', '侵权',
+    # 消费
+    '消费者', '网购', '退货', '退款', '产品质量', '食品安全', '保险', '理赔',
+    # 知识产权与公司
+    '著作权', '商标', '专利', '股东', '股权', '合伙', '破产',
+    # 刑事
+    '诈骗', '盗窃', '抢劫', '故意伤害', '正当防卫', '自首', '取保候审', '缓刑', '刑事责任',
+    # 行政与程序
+    '行政处罚', '行政复议', '行政诉讼', '诉讼时效', '起诉', '上诉', '仲裁', '强制执行',
+    '未成年人', '环境污染', '个人所得税', '税收',
+)
+
+# 以这些词开头的问题视为追问；问题里有新的主题词时，只有"那"开头或带指代词才算追问
+FOLLOW_UP_PREFIXES = (
+    '那', '如果', '要是', '假如', '还有', '另外', '此外', '然后', '还能', '还要', '还可以', '而且', '同时', '这种', '这样',
+)
+ANAPHORA_PREFIXES = ('那',)
+# 指代前文的词
+REFERENCE_WORDS = ('这个', '这种', '这样', '上述', '上面', '前面', '刚才', '对此', '该情况', '此情况', '对方', '他们', '她们')
+# 不含主题词且不超过该字数的问题视为追问
+SHORT_QUERY_CHARS = 12
+MAX_TOPIC_TERMS = 4
+BOOK_TITLE_PATTERN = re.compile(r'《([^》]{2,40})》')
+
+
+def short_law_name(name: str) -> str:
+    """去掉"中华人民共和国"前缀、修正年份等括注"""
+    name = re.sub(r'[（(][^）)]*[）)]$', '', name.strip())
+    return name.replace('中华人民共和国', '')
+
+
+@dataclass
+class CondensedQuery:
+    """改写结果：用于检索的查询、本轮之后的话题、是否做了改写"""
+    query: str
+    topic: str
+    rewritten: bool = False
+
+
+class QueryCondenser:
+    """维护对话话题并把追问改写为独立查询"""
+
+    def __init__(self, retriever=None, cache_size: int = 4096, cache_ttl: float = 1800):
+        # 法规名称取自当前索引快照，索引热加载后自动更新
+        self.retriever = retriever
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._terms = sorted(set(TOPIC_TERMS), key=len, reverse=True)
+        self._law_names: List[str] = []
+        self._law_names_version: Optional[str] = None
+
+    def law_names(self) -> List[str]:
+        """索引中的法规简称（长名称优先）"""
+        if self.retriever is None:
+            return self._law_names
+        snapshot = self.retriever.snapshot
+        if snapshot.version != self._law_names_version:
+            names = {short_law_name(name) for name in snapshot.filter_index.values('law_name')}
+            self._law_names = sorted((n for n in names if len(n) >= 2), key=len, reverse=True)
+            self._law_names_version = snapshot.version
+        return self._law_names
+
+    def extract(self, text: str) -> Tuple[List[str], List[str]]:
+        """提取文本中的 (法规名称, 主题词)，按出现顺序"""
+        laws = [short_law_name(name) for name in BOOK_TITLE_PATTERN.findall(text)]
+        remaining = BOOK_TITLE_PATTERN.sub(' ', text)
+        for name in self.law_names():
+            if name in remaining:
+                laws.append(name)
+                remaining = remaining.replace(name, ' ')
+
+        found = []
+        for term in self._terms:
+            position = remaining.find(term)
+            if position >= 0:
+                found.append((position, term))
+                remaining = remaining.replace(term, ' ' * len(term))
+        terms = [term for _, term in sorted(found)]
+        return list(dict.fromkeys(laws)), terms
+
+    @staticmethod
+    def is_follow_up(query: str, has_own_topic: bool) -> bool:
+        query = query.strip()
+        if query.startswith(ANAPHORA_PREFIXES) or any(word in query for word in REFERENCE_WORDS):
+            return True
+        if has_own_topic:
+            return False
+        return query.startswith(FOLLOW_UP_PREFIXES) or len(query) <= SHORT_QUERY_CHARS
+
+    def _split_topic(self, topic: str) -> Tuple[List[str], List[str]]:
+        laws, terms = [], []
+        for item in topic.split():
+            (terms if item in TOPIC_TERMS else laws).append(item)
+        return laws, terms
+
+    def _topic_from_history(self, context, turns: int = 3) -> Tuple[List[str], List[str]]:
+        """current_topic 为空时（例如旧会话）从最近几轮用户提问中恢复话题"""
+        laws, terms = [], []
+        user_messages = [m.content for m in context.history if m.role == 'user'][-turns:]
+        for content in user_messages:
+            message_laws, message_terms = self.extract(content)
+            if message_laws or message_terms:
+                laws, terms = message_laws or laws, message_terms
+        return laws, terms
+
+    def _condense(self, query: str, context) -> CondensedQuery:
+        laws, terms = self.extract(query)
+        if not context.history:
+            return CondensedQuery(query, " ".join((laws + terms)[:MAX_TOPIC_TERMS]))
+
+        if context.current_topic:
+            topic_laws, topic_terms = self._split_topic(context.current_topic)
+        else:
+            topic_laws, topic_terms = self._topic_from_history(context)
+
+        # 只提到法规名称（"民法典怎么规定"），或主题词都在原话题中时，仍是同一话题下的追问
+        new_terms = [term for term in terms if term not in topic_terms]
+        if not self.is_follow_up(query, bool(new_terms)):
+            # 独立的新问题：换成新话题；识别不出话题时沿用原话题
+            if laws or terms:
+                topic_laws, topic_terms = laws, terms
+            topic = " ".join((topic_laws + topic_terms)[:MAX_TOPIC_TERMS])
+            return CondensedQuery(query, topic)
+
+        # 追问：补上原话题中问题里没有的部分，新出现的法规与主题词并入话题
+        prefix = [item for item in topic_laws + topic_terms if item not in query]
+        if not prefix and not (topic_laws or topic_terms):
+            # 没有识别出任何话题时，直接带上上一个问题
+            last_question = next((m.content for m in reversed(context.history) if m.role == 'user'), "")
+            prefix = [last_question[:50]] if last_question else []
+
+        topic_laws = laws or topic_laws
+        topic_terms = list(dict.fromkeys(terms + topic_terms))
+        topic = " ".join((topic_laws + topic_terms)[:MAX_TOPIC_TERMS])
+        if not prefix:
+            return CondensedQuery(query, topic)
+        return CondensedQuery(f"{' '.join(prefix)} {query}", topic, rewritten=True)
+
+    def condense(self, query: str, context) -> CondensedQuery:
+        """返回用于检索的查询，并更新 context.current_topic
+
+        结果按 (会话, 对话内容版本, 查询) 缓存：同一轮中的展示检索与正式检索只计算一次，
+        重试同一个问题也不会把话题叠加两次。版本由对话内容决定，会话被删除或重置后
+        以同一ID重新对话、或 id() 被其他对象复用时不会命中旧结果。
+        """
+        key = (context.session_id or id(context), context.version(), normalize_query(query))
+        result = self.cache.get(key)
+        record_cache_lookup("condense", result is not None)
+        if result is None:
+            result = self._condense(query, context)
+            self.cache.set(key, result)
+        context.current_topic = result.topic
+        return result
@@ -3,41 +3,32 @@ API客户端示例代码
 演示如何使用法律咨询API
 """
 
-import requests
-import json
+import os
+import sys
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 
+# legal_client 在项目根目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from legal_client import LegalClient, LegalClientError
+
 class LegalConsultationClient:
-    """法律咨询API客户端"""
+    """法律咨询API客户端（在 legal_client.LegalClient 上记住当前会话ID）"""
     
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
-        self.session = requests.Session()
+        self.client = LegalClient(base_url)
         self.session_id = None
     
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
-        """发送HTTP请求"""
-        url = f"{self.base_url}{endpoint}"
-        response = self.session.request(method, url, **kwargs)
-        response.raise_for_status()
-        return response.json()
-    
     def health_check(self) -> Dict[str, Any]:
         """健康检查"""
-        return self._make_request("GET", "/health")
+        return self.client.health()
     
     def query_law(self, question: str, session_id: Optional[str] = None, 
                   show_results: bool = True) -> Dict[str, Any]:
         """法律咨询查询"""
-        data = {
-            "question": question,
-            "show_results": show_results
-        }
-        if session_id:
-            data["session_id"] = session_id
-        
-        response = self._make_request("POST", "/query", json=data)
+        response = self.client.query(question, session_id=session_id, show_results=show_results)
         
         # 保存会话ID
         if not self.session_id:
@@ -47,11 +38,7 @@ class LegalConsultationClient:
     
     def search_laws(self, query: str, k: int = 5) -> Dict[str, Any]:
         """搜索法律文档"""
-        data = {
-            "query": query,
-            "k": k
-        }
-        return self._make_request("POST", "/search", json=data)
+        return self.client.search(query, k=k)
     
     def get_session_summary(self, session_id: Optional[str] = None) -> Dict[str, Any]:
         """获取会话总结"""
@@ -59,7 +46,7 @@ class LegalConsultationClient:
         if not sid:
             raise ValueError("No session ID available")
         
-        return self._make_request("GET", f"/sessions/{sid}/summary")
+        return self.client.summarize(sid)
     
     def delete_session(self, session_id: Optional[str] = None) -> Dict[str, Any]:
         """删除会话"""
@@ -67,7 +54,7 @@ class LegalConsultationClient:
         if not sid:
             raise ValueError("No session ID available")
         
-        response = self._make_request("DELETE", f"/sessions/{sid}")
+        response = self.client.delete_session(sid)
         
         # 清除本地会话ID
         if sid == self.session_id:
@@ -77,7 +64,7 @@ class LegalConsultationClient:
     
     def list_sessions(self) -> Dict[str, Any]:
         """列出所有活跃会话"""
-        return self._make_request("GET", "/sessions")
+        return self.client.list_sessions()
     
     def reset_session(self, session_id: Optional[str] = None) -> Dict[str, Any]:
         """重置会话"""
@@ -85,7 +72,7 @@ class LegalConsultationClient:
         if not sid:
             raise ValueError("No session ID available")
         
-        return self._make_request("POST", f"/sessions/{sid}/reset")
+        return self.client.reset_session(sid)
 
 def main():
     """示例使用方法"""
@@ -128,6 +115,26 @@ def main():
         print(f"回答: {response2['answer'][:200]}...")
         print()
         
+        # 流式回答
+        print("=== 流式回答 ===")
+        follow_up = "工伤赔偿的标准是怎样的？"
+        print(f"问题: {follow_up}")
+        print("回答: ", end="")
+        for text in client.client.stream_answer(follow_up, session_id=client.session_id):
+            print(text, end="", flush=True)
+        print("\n")
+        
+        # 批量咨询（并发，各自独立会话）
+        print("=== 批量咨询 ===")
+        questions = ["劳动合同到期不续签有补偿吗？", "试用期可以随时辞职吗？", "加班费怎么计算？"]
+        results = client.client.query_many(questions, concurrency=3, priority="batch")
+        for q, result in zip(questions, results):
+            if isinstance(result, LegalClientError):
+                print(f"{q} -> 失败: {result}")
+            else:
+                print(f"{q} -> {result['answer'][:60]}...")
+        print()
+        
         # 获取会话总结
         print("=== 会话总结 ===")
         summary = client.get_session_summary()
@@ -149,11 +156,13 @@ def main():
         delete_response = client.delete_session()
         print(f"删除结果: {delete_response['message']}")
         
-    except requests.exceptions.RequestException as e:
+    except LegalClientError as e:
         print(f"请求错误: {e}")
         print("请确保API服务正在运行 (python main.py)")
     except Exception as e:
         print(f"错误: {e}")
+    finally:
+        client.client.close()
 
 if __name__ == "__main__":
     main()
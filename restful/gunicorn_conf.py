@@ -0,0 +1,33 @@
+"""
+多 worker 部署的 gunicorn 配置
+
+用法（在 restful 目录下）:
+    gunicorn main:app -c gunicorn_conf.py
+
+主进程先加载编码器、以 mmap 方式打开 FAISS 索引与元数据（preload_app），再 fork 出 worker，
+N 个 worker 的内存占用接近单进程。会话保存在 SQLite 中，各 worker 共享。
+"""
+
+import multiprocessing
+import os
+import sys
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "180"))
+graceful_timeout = 30
+
+# 在导入 main 之前设置，主进程据此预加载系统
+os.environ.setdefault("PRELOAD_SYSTEM", "true")
+os.environ.setdefault("FAISS_MMAP", "true")
+os.environ.setdefault("SESSION_STORE", "sqlite")
+
+
+def post_fork(server, worker):
+    """按 worker 数划分CPU线程，避免多个进程的推理线程互相争抢"""
+    threads = int(os.getenv("WORKER_THREADS", "0")) or max(1, multiprocessing.cpu_count() // workers)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    server.log.info(f"Worker {worker.pid} using {threads} inference threads")
@@ -1,18 +1,33 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Literal, Optional, Dict, Any, Callable
 import os
+import gc
 import sys
 from datetime import datetime
 import uuid
+import json
+import time
+import asyncio
 import logging
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import replace
 
 # 添加父目录到系统路径，以便导入agent模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from agent import LegalConsultationSystem, ConversationContext
+from admission import AdmissionController, AdmissionRejected
+from cache import file_version
+from jobs import Job, JobManager, JobQueueFull
+from session_store import create_session_store
+from metrics import (ACTIVE_SESSIONS, REQUESTS_TOTAL, REQUEST_LATENCY, WS_CONNECTIONS, WS_TURNS, observe_stage,
+                     render_metrics, time_stage)
+from tracing import finish_trace_after, set_attribute as set_trace_attribute, span, start_trace
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -44,13 +59,36 @@ def verify_data_files():
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用启动时在后台线程加载模型与索引，liveness 检查无需等待"""
+    loop = asyncio.get_running_loop()
+    if consultation_system is not None:
+        # 预加载模式：模型与索引已在 fork 前加载，每个 worker 自行预热
+        if os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes"):
+            loop.run_in_executor(None, _warm_up_preloaded)
+    elif os.getenv("BACKGROUND_STARTUP", "true").lower() in ("1", "true", "yes"):
+        _schedule_initialize()
+    
+    # 监视索引文件，重建后自动热加载（每个 worker 各自监视）
+    stop_watching = threading.Event()
+    watch_interval = float(os.getenv("INDEX_WATCH_INTERVAL", "0"))
+    if watch_interval > 0:
+        threading.Thread(
+            target=_watch_index_files, args=(stop_watching, watch_interval),
+            name="index-watcher", daemon=True
+        ).start()
+    yield
+    stop_watching.set()
+
 # 创建FastAPI应用
 app = FastAPI(
     title="法律咨询API",
     description="基于FAISS检索和LLM的法律咨询系统RESTful API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 添加CORS中间件
@@ -60,56 +98,226 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-Id"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """为每个请求建立 trace，并通过 X-Request-Id 响应头返回请求ID"""
+    request_id = request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    with start_trace(f"{request.method} {request.url.path}", request_id, finish=False,
+                     **{"http.method": request.method, "http.path": request.url.path}) as root:
+        response = await call_next(request)
+        root.set_attribute("http.status_code", response.status_code)
+        route = request.scope.get("route")
+        if route is not None:
+            root.name = f"{request.method} {route.path}"
+    # 流式响应（/query/stream 等）在这之后才生成，响应体发送完再结束根 span
+    response.body_iterator = finish_trace_after(response.body_iterator, root)
+    response.headers["X-Request-Id"] = request_id
+    return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """记录每个接口的请求数与耗时"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # 使用路由模板（如 /sessions/{session_id}）而不是实际路径，避免标签基数膨胀
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        REQUESTS_TOTAL.inc(method=request.method, endpoint=endpoint, status=str(status))
+        REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint)
+
 # 全局变量存储咨询系统实例
 consultation_system = None
 
-def get_consultation_system():
-    """获取咨询系统实例"""
+# 启动状态：pending / loading / ready / failed
+startup_state: Dict[str, Any] = {
+    "status": "pending",
+    "stage": None,
+    "timings": {},
+    "error": None
+}
+_init_lock = threading.Lock()
+
+def initialize_consultation_system(warmup: bool = True):
+    """分阶段初始化咨询系统并记录各阶段耗时（只初始化一次）"""
     global consultation_system
-    if consultation_system is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured")
+    with _init_lock:
+        if consultation_system is not None:
+            return consultation_system
         
+        startup_state.update(status="loading", error=None)
+        started = time.perf_counter()
         try:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY not configured")
+            
             # 验证数据文件是否存在
+            startup_state["stage"] = "verify_data_files"
             index_path, metadata_path = verify_data_files()
             logger.info(f"Using FAISS index: {index_path}")
             logger.info(f"Using metadata: {metadata_path}")
             
-            consultation_system = LegalConsultationSystem(
+            # 加载编码器、索引、元数据与LLM客户端
+            startup_state["stage"] = "load_system"
+            system = LegalConsultationSystem(
                 openai_api_key=api_key,
                 index_path=index_path,
                 metadata_path=metadata_path
             )
-        except FileNotFoundError as e:
-            logger.error(f"Data files not found: {e}")
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Required data files not found: {str(e)}"
-            )
+            
+            # 预热查询，避免首个用户请求承担懒加载开销
+            if warmup and os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes"):
+                startup_state["stage"] = "warmup"
+                system.warm_up(os.getenv("WARMUP_QUERY", "劳动合同解除的法律规定"))
         except Exception as e:
-            logger.error(f"Failed to initialize consultation system: {e}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to initialize consultation system: {str(e)}"
-            )
+            startup_state.update(status="failed", error=str(e))
+            raise
+        
+        timings = dict(system.startup_timings)
+        timings["total"] = time.perf_counter() - started
+        for stage, seconds in timings.items():
+            logger.info(f"Startup stage {stage}: {seconds:.2f}s")
+        
+        startup_state.update(status="ready", stage=None, timings=timings)
+        consultation_system = system
+        return consultation_system
+
+def _background_initialize():
+    """后台初始化，失败时记录到启动状态中"""
+    try:
+        initialize_consultation_system()
+    except Exception as e:
+        logger.error(f"Failed to initialize consultation system: {e}")
+
+def _warm_up_preloaded():
+    """fork 后在 worker 中预热（编码器线程池等不能跨 fork 复用）"""
+    try:
+        seconds = consultation_system.warm_up(os.getenv("WARMUP_QUERY", "劳动合同解除的法律规定"))
+        startup_state["timings"]["warmup"] = seconds
+        logger.info(f"Worker {os.getpid()} warm-up: {seconds:.2f}s")
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+
+def _reload_index():
+    """热加载索引，失败时保留旧索引（错误记录在 reload_state 中）"""
+    try:
+        return consultation_system.retriever.reload(warmup_query=os.getenv("WARMUP_QUERY", "劳动合同解除的法律规定"))
+    except Exception as e:
+        logger.error(f"Index reload failed: {e}")
+        return False
+
+def _watch_index_files(stop_event: threading.Event, interval: float):
+    """定期检查索引与元数据文件的版本，变化且连续两次检查一致（写入完成）后热加载"""
+    pending_version = None
+    failed_version = None
+    while not stop_event.wait(interval):
+        if consultation_system is None:
+            continue
+        retriever = consultation_system.retriever
+        try:
+            version = file_version(retriever.index_path, retriever.metadata_path)
+        except OSError:
+            # 文件正在被替换
+            continue
+        
+        if version in (retriever.index_version, failed_version):
+            pending_version = None
+            continue
+        if version != pending_version:
+            pending_version = version
+            continue
+        
+        logger.info(f"Index files changed ({retriever.index_version} -> {version}), reloading")
+        if not _reload_index() and retriever.reload_state["status"] == "failed":
+            failed_version = version
+        pending_version = None
+
+# 初始化失败后，请求最多每隔这么多秒触发一次后台重试
+INIT_RETRY_INTERVAL = float(os.getenv("INIT_RETRY_INTERVAL", "30"))
+_init_schedule_lock = threading.Lock()
+_last_init_attempt: Optional[float] = None
+
+def _schedule_initialize():
+    """在后台线程中（重新）初始化；正在加载或距上次尝试不足 INIT_RETRY_INTERVAL 秒时不重复启动"""
+    global _last_init_attempt
+    with _init_schedule_lock:
+        if consultation_system is not None or startup_state["status"] == "loading":
+            return
+        if _last_init_attempt is not None and time.monotonic() - _last_init_attempt < INIT_RETRY_INTERVAL:
+            return
+        _last_init_attempt = time.monotonic()
+        startup_state["status"] = "loading"
+    threading.Thread(target=_background_initialize, name="system-init", daemon=True).start()
+
+def get_consultation_system():
+    """获取咨询系统实例
     
-    return consultation_system
+    未就绪时返回503，不在请求中同步加载（会阻塞事件循环）；
+    未启动或初始化失败时由后台线程重试。
+    """
+    if consultation_system is not None:
+        return consultation_system
+    
+    _schedule_initialize()
+    if startup_state["status"] == "failed":
+        detail = f"Service failed to start: {startup_state['error']}"
+    else:
+        detail = f"Service is starting (stage: {startup_state['stage']})"
+    raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+# 预加载模式（gunicorn preload_app）：在主进程中加载模型、mmap索引与元数据，
+# worker 随后 fork 出来，以写时复制方式共享这些只读内存
+if os.getenv("PRELOAD_SYSTEM", "false").lower() in ("1", "true", "yes"):
+    initialize_consultation_system(warmup=False)
+    # 冻结已有对象，避免 worker 中的垃圾回收触碰这些页面导致复制
+    gc.freeze()
 
 # Pydantic模型定义
+class SearchFilters(BaseModel):
+    """检索过滤条件（各条件同时满足，列表内任一匹配）"""
+    law_name: Optional[List[str]] = Field(None, description="法规名称，可用简称，如 劳动合同法")
+    filename: Optional[List[str]] = Field(None, description="法规文件名")
+    category: Optional[List[str]] = Field(None, description="法规类别：法律/行政法规/部门规章/司法解释/其他")
+    chapter: Optional[List[str]] = Field(None, description="章节，如 第四章 或 劳动合同的解除")
+    effective_after: Optional[str] = Field(None, description="施行日期不早于（YYYY-MM-DD）")
+    effective_before: Optional[str] = Field(None, description="施行日期不晚于（YYYY-MM-DD）")
+
 class QueryRequest(BaseModel):
     """查询请求模型"""
     question: str = Field(..., description="法律咨询问题", min_length=1)
     session_id: Optional[str] = Field(None, description="会话ID")
     show_results: bool = Field(True, description="是否展示检索结果")
+    filters: Optional[SearchFilters] = Field(None, description="检索过滤条件")
+    priority: Literal["interactive", "batch"] = Field("interactive", description="优先级：交互请求优先于批量任务")
 
 class SearchRequest(BaseModel):
     """搜索请求模型"""
     query: str = Field(..., description="搜索查询", min_length=1)
     k: int = Field(5, description="返回结果数量", ge=1, le=20)
+    min_score: Optional[float] = Field(None, description="最低相关度（余弦相似度），不填时使用 RETRIEVAL_MIN_SCORE", ge=-1, le=1)
+    filters: Optional[SearchFilters] = Field(None, description="检索过滤条件")
+
+class PrefetchRequest(BaseModel):
+    """预取检索请求模型（输入过程中调用）"""
+    question: str = Field(..., description="用户正在输入的问题", min_length=1)
+    session_id: Optional[str] = Field(None, description="会话ID，用于按对话话题改写追问")
+    filters: Optional[SearchFilters] = Field(None, description="检索过滤条件，应与提交时一致")
+
+class ChatMessage(BaseModel):
+    """WebSocket 对话中客户端发送的消息"""
+    type: Literal["query", "cancel", "ping"] = Field(..., description="query 提问 / cancel 取消进行中的回答 / ping")
+    question: Optional[str] = Field(None, description="法律咨询问题（type=query）", min_length=1)
+    show_results: bool = Field(False, description="是否在 retrieval 事件中返回送入LLM的法条")
+    filters: Optional[SearchFilters] = Field(None, description="检索过滤条件")
+    priority: Literal["interactive", "batch"] = Field("interactive", description="优先级")
 
 class SessionRequest(BaseModel):
     """会话请求模型"""
@@ -121,13 +329,14 @@ class QueryResponse(BaseModel):
     session_id: str = Field(..., description="会话ID")
     timestamp: str = Field(..., description="响应时间")
     question: str = Field(..., description="原始问题")
+    route: Optional[str] = Field(None, description="回答所用的模型路由（fast/strong）")
 
 class SearchResult(BaseModel):
     """搜索结果模型"""
     content: str = Field(..., description="法条内容")
     filename: str = Field(..., description="文件名")
-    score: float = Field(..., description="相关度评分")
-    distance: float = Field(..., description="距离值")
+    score: float = Field(..., description="相关度评分（余弦相似度）")
+    distance: float = Field(..., description="距离值（1 - 余弦相似度）")
 
 class SearchResponse(BaseModel):
     """搜索响应模型"""
@@ -136,17 +345,56 @@ class SearchResponse(BaseModel):
     query: str = Field(..., description="搜索查询")
     timestamp: str = Field(..., description="搜索时间")
 
+class PrefetchResponse(BaseModel):
+    """预取检索响应模型"""
+    accepted: bool = Field(..., description="是否已安排预取")
+    reason: Optional[str] = Field(None, description="未安排预取的原因")
+    timestamp: str = Field(..., description="当前时间")
+
 class SummaryResponse(BaseModel):
     """总结响应模型"""
     summary: str = Field(..., description="对话总结")
     session_id: str = Field(..., description="会话ID")
     timestamp: str = Field(..., description="总结时间")
 
+class JobResponse(BaseModel):
+    """后台任务响应模型"""
+    job_id: str = Field(..., description="任务ID")
+    kind: str = Field(..., description="任务类型")
+    status: Literal["queued", "running", "succeeded", "failed"] = Field(..., description="任务状态")
+    progress: float = Field(..., description="进度（0~1）")
+    stage: str = Field(..., description="当前阶段")
+    partial: str = Field("", description="已生成的部分结果")
+    result: Optional[Dict[str, Any]] = Field(None, description="任务结果（成功后）")
+    error: Optional[str] = Field(None, description="失败原因")
+    created_at: str = Field(..., description="创建时间")
+    started_at: Optional[str] = Field(None, description="开始执行时间")
+    finished_at: Optional[str] = Field(None, description="结束时间")
+
 class StatusResponse(BaseModel):
     """状态响应模型"""
     status: str = Field(..., description="服务状态")
     version: str = Field(..., description="API版本")
     timestamp: str = Field(..., description="当前时间")
+    index_version: Optional[str] = Field(None, description="当前索引版本")
+
+class IndexStatusResponse(BaseModel):
+    """索引状态响应模型"""
+    index_version: str = Field(..., description="当前索引版本")
+    index_path: str = Field(..., description="索引文件路径")
+    metadata_path: str = Field(..., description="元数据文件路径")
+    loaded_at: str = Field(..., description="当前索引加载时间")
+    documents: int = Field(..., description="条文段数")
+    reload: Dict[str, Any] = Field(default_factory=dict, description="最近一次热加载的状态")
+
+class ReadinessResponse(BaseModel):
+    """就绪状态响应模型"""
+    status: str = Field(..., description="启动状态")
+    version: str = Field(..., description="API版本")
+    timestamp: str = Field(..., description="当前时间")
+    stage: Optional[str] = Field(None, description="当前启动阶段")
+    startup_timings: Dict[str, float] = Field(default_factory=dict, description="各启动阶段耗时（秒）")
+    error: Optional[str] = Field(None, description="启动失败原因")
 
 class ErrorResponse(BaseModel):
     """错误响应模型"""
@@ -154,8 +402,122 @@ class ErrorResponse(BaseModel):
     detail: Optional[str] = Field(None, description="详细信息")
     timestamp: str = Field(..., description="错误时间")
 
-# 会话管理
-sessions: Dict[str, ConversationContext] = {}
+# 会话管理（SESSION_STORE=sqlite 时多个 worker 共享会话）
+sessions = create_session_store()
+ACTIVE_SESSIONS.set_function(lambda: len(sessions))
+
+# 预取检索的并发上限与最短输入，超出时直接丢弃（预取只是优化，不排队）
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", "4"))
+prefetch_slots = threading.BoundedSemaphore(int(os.getenv("PREFETCH_MAX_INFLIGHT", "4")))
+
+# QA 阶段准入控制：限制同时进行的LLM生成，超出的按优先级排队，队列满或超时快速拒绝
+admission = AdmissionController(
+    max_inflight=int(os.getenv("ADMISSION_MAX_INFLIGHT", "8")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30")),
+    batch_max_inflight=int(os.getenv("ADMISSION_BATCH_MAX_INFLIGHT")) if os.getenv("ADMISSION_BATCH_MAX_INFLIGHT") else None
+)
+
+def rejection_to_http(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=f"Server busy ({e.reason}), retry after {e.retry_after}s",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def start_answer(system, question: str, context: ConversationContext, retrieved_context: str,
+                       flight_key: Optional[tuple], decision, priority: str):
+    """QA 阶段：相同问题正在生成时直接加入（不占名额）；否则排队取得名额再发起生成，生成结束时归还"""
+    ticket = None
+    if system.single_flight.get(flight_key) is None:
+        with span("admission_wait", priority=priority):
+            ticket = await admission.acquire(priority)
+    
+    try:
+        stream, shared = system.answer_stream(question, context, retrieved_context, flight_key, decision)
+    except BaseException:
+        if ticket:
+            ticket.release()
+        raise
+    if ticket:
+        if shared:
+            # 等待名额期间已有相同问题开始生成
+            ticket.release()
+        else:
+            stream.add_done_callback(ticket.release)
+            # 读取者全部离开（断开、取消）时立即归还名额，生成在下一个 token 到达时中止
+            stream.add_abandon_callback(ticket.release)
+    return stream, shared
+
+# 后台任务（会话总结）：固定数量的工作线程执行，任务ID含会话版本，同一版本重复提交直接复用
+jobs = JobManager(
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    ttl=float(os.getenv("JOB_TTL", "3600")),
+    max_pending=int(os.getenv("JOB_MAX_PENDING", "32"))
+)
+# 用于估算总结进度的预期长度（字）
+SUMMARY_EXPECTED_CHARS = int(os.getenv("SUMMARY_EXPECTED_CHARS", "400"))
+
+def submit_summary_job(system, session_id: str, context: ConversationContext) -> Job:
+    """提交会话总结任务；该会话当前版本的总结已完成或正在进行时直接返回那个任务"""
+    job_id = f"summary-{context.version()}-{session_id}"
+    # 总结执行期间会话可能继续对话，按提交时的内容总结（包括已转存的早期消息）
+    snapshot = replace(context, history=sessions.history(session_id, context),
+                       retrieved_ids=list(context.retrieved_ids), archived=0)
+    
+    def run(job: Job) -> Dict[str, Any]:
+        logger.info(f"Getting summary for session {session_id}")
+        job.update(progress=0.05, stage="生成总结")
+        chunks = []
+        chars = 0
+        for chunk in system.stream_conversation_summary(snapshot):
+            chunks.append(chunk)
+            chars += len(chunk)
+            job.update(progress=0.05 + 0.9 * min(1.0, chars / SUMMARY_EXPECTED_CHARS), partial="".join(chunks))
+        return SummaryResponse(
+            summary="".join(chunks),
+            session_id=session_id,
+            timestamp=datetime.now().isoformat()
+        ).dict()
+    
+    try:
+        job, _ = jobs.submit(job_id, "summary", run)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Server busy ({e}), retry later", headers={"Retry-After": "10"})
+    return job
+
+def find_job(job_id: str) -> Job:
+    """按ID查找任务
+    
+    多 worker 部署时轮询可能落到没有该任务的 worker：总结任务的ID由会话ID与会话版本决定，
+    会话内容未变时在本进程重新提交（结果相同），会话已变化或已删除时返回404。
+    """
+    job = jobs.get(job_id)
+    if job is not None:
+        return job
+    
+    kind, _, rest = job_id.partition("-")
+    version, _, session_id = rest.partition("-")
+    if kind == "summary" and session_id in sessions:
+        context = sessions[session_id]
+        if context.version() == version:
+            return submit_summary_job(get_consultation_system(), session_id, context)
+    raise HTTPException(status_code=404, detail="Job not found")
+
+# 同一会话的请求串行处理，不同会话之间并发
+session_locks: Dict[str, asyncio.Lock] = {}
+
+def get_session_lock(session_id: str) -> asyncio.Lock:
+    """获取会话锁"""
+    if session_id not in session_locks:
+        session_locks[session_id] = asyncio.Lock()
+    return session_locks[session_id]
+
+def load_session(session_id: str) -> ConversationContext:
+    """恢复或创建会话上下文；SQLite 存储会读磁盘，需在线程池中调用"""
+    if session_id in sessions:
+        return sessions[session_id]
+    return ConversationContext(session_id=session_id)
 
 @app.get("/", response_model=StatusResponse)
 async def root():
@@ -175,7 +537,15 @@ async def health_check():
         return StatusResponse(
             status="healthy",
             version="1.0.0",
-            timestamp=datetime.now().isoformat()
+            timestamp=datetime.now().isoformat(),
+            index_version=system.retriever.index_version
+        )
+    except HTTPException as e:
+        logger.error(f"Health check failed: {e.detail}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service unhealthy: {e.detail}",
+            headers=e.headers
         )
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
@@ -184,39 +554,144 @@ async def health_check():
             detail=f"Service unhealthy: {str(e)}"
         )
 
+@app.get("/health/live", response_model=StatusResponse)
+async def liveness_check():
+    """存活检查：进程可以响应请求即可"""
+    return StatusResponse(
+        status="alive",
+        version="1.0.0",
+        timestamp=datetime.now().isoformat()
+    )
+
+@app.get("/health/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """就绪检查：模型与索引加载完成后返回200，否则返回503"""
+    response = ReadinessResponse(
+        status=startup_state["status"],
+        version="1.0.0",
+        timestamp=datetime.now().isoformat(),
+        stage=startup_state["stage"],
+        startup_timings=startup_state["timings"],
+        error=startup_state["error"]
+    )
+    if consultation_system is None:
+        return JSONResponse(status_code=503, content=response.dict(), headers={"Retry-After": "5"})
+    return response
+
+def check_admin_token(request: Request):
+    """设置了 ADMIN_TOKEN 时，管理接口需要 X-Admin-Token 请求头"""
+    token = os.getenv("ADMIN_TOKEN")
+    if token and request.headers.get("X-Admin-Token") != token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def _index_status(system) -> IndexStatusResponse:
+    snapshot = system.retriever.snapshot
+    return IndexStatusResponse(
+        index_version=snapshot.version,
+        index_path=snapshot.index_path,
+        metadata_path=snapshot.metadata_path,
+        loaded_at=snapshot.loaded_at,
+        documents=len(snapshot.metadata),
+        reload=system.retriever.reload_state
+    )
+
+@app.get("/admin/index", response_model=IndexStatusResponse, dependencies=[Depends(check_admin_token)])
+async def index_status():
+    """当前索引版本与热加载状态"""
+    return _index_status(get_consultation_system())
+
+@app.post("/admin/reload-index", response_model=IndexStatusResponse, status_code=202,
+          dependencies=[Depends(check_admin_token)])
+async def reload_index(wait: bool = Query(False, description="等待加载完成后再返回")):
+    """在后台加载重建后的索引与元数据并原子替换，进行中的查询继续使用旧索引完成
+    
+    多 worker 部署时只有处理该请求的 worker 会重新加载，建议改用 INDEX_WATCH_INTERVAL。
+    """
+    system = get_consultation_system()
+    if system.retriever.reload_state["status"] == "loading":
+        raise HTTPException(status_code=409, detail="Index reload already in progress")
+    
+    if not wait:
+        asyncio.get_running_loop().run_in_executor(None, _reload_index)
+        return _index_status(system)
+    
+    await run_in_threadpool(_reload_index)
+    if system.retriever.reload_state["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Index reload failed: {system.retriever.reload_state['error']}")
+    return JSONResponse(status_code=200, content=_index_status(system).dict())
+
+@app.get("/admin/llm", dependencies=[Depends(check_admin_token)])
+async def llm_status():
+    """各LLM后端的健康状态、首token p50/p95 与当前对冲等待时间"""
+    return get_consultation_system().llm_pool.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 指标"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/query", response_model=QueryResponse)
 async def query_law(request: QueryRequest):
-    """法律咨询查询"""
+    """法律咨询查询
+    
+    同时进行的生成数超过 ADMISSION_MAX_INFLIGHT 时排队；队列已满返回 429，排队超时返回 503，均带 Retry-After。
+    """
     try:
         system = get_consultation_system()
         
+        # 队列已满时在检索之前直接拒绝
+        admission.check(request.priority)
+        
         # 生成或使用现有会话ID
         session_id = request.session_id or str(uuid.uuid4())
         
-        # 恢复或创建会话上下文
-        if session_id in sessions:
-            system.context = sessions[session_id]
-        else:
-            system.reset_context()
-            system.context.session_id = session_id
-        
-        # 处理查询
-        logger.info(f"Processing query for session {session_id}: {request.question}")
-        answer = system.process_query_with_display(
-            request.question, 
-            show_results=request.show_results
-        )
+        filters = request.filters.dict(exclude_none=True) if request.filters else None
+        if filters:
+            await run_in_threadpool(system.retriever.check_filters, filters)
         
-        # 保存会话上下文
-        sessions[session_id] = system.context
+        session_lock = get_session_lock(session_id)
+        with span("session_lock_wait"), time_stage("session_lock_wait"):
+            await session_lock.acquire()
+        try:
+            # 恢复或创建会话上下文
+            with span("session_load"), time_stage("session_load"):
+                context = await run_in_threadpool(load_session, session_id)
+            
+            # 处理查询（在线程池中执行，避免阻塞事件循环）
+            logger.info(f"Processing query for session {session_id}: {request.question}")
+            set_trace_attribute("session.id", session_id)
+            retrieved_context, flight_key, decision = await run_in_threadpool(
+                system.prepare_query, request.question,
+                show_results=request.show_results, context=context, filters=filters
+            )
+            with span("qa"), time_stage("qa"):
+                stream, _ = await start_answer(
+                    system, request.question, context, retrieved_context, flight_key, decision, request.priority
+                )
+                answer = await run_in_threadpool("".join, stream)
+            system.complete_turn(request.question, answer, context)
+            
+            # 保存会话上下文
+            with span("session_save"), time_stage("session_save"):
+                await run_in_threadpool(sessions.__setitem__, session_id, context)
+        finally:
+            session_lock.release()
         
         return QueryResponse(
             answer=answer,
             session_id=session_id,
             timestamp=datetime.now().isoformat(),
-            question=request.question
+            question=request.question,
+            route=decision.route
         )
         
+    except AdmissionRejected as e:
+        raise rejection_to_http(e)
+    except ValueError as e:
+        # 过滤条件不合法，或索引缺少对应字段
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Query processing failed: {str(e)}")
         raise HTTPException(
@@ -224,6 +699,238 @@ async def query_law(request: QueryRequest):
             detail=f"Query processing failed: {str(e)}"
         )
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class CleanupStreamingResponse(StreamingResponse):
+    """发送结束后必定执行 cleanup 的流式响应
+    
+    客户端在读取 body 之前断开或发送 http.response.start 失败时，body 生成器从未开始，
+    其中的 finally 不会执行；cleanup 放在响应发送的 finally 中，保证会话锁与订阅都会释放。
+    """
+    
+    def __init__(self, content, cleanup: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cleanup()
+
+@app.post("/query/stream")
+async def query_law_stream(request: QueryRequest):
+    """流式法律咨询（Server-Sent Events）
+    
+    事件依次为 meta（会话ID、是否与相同问题合并、模型路由）、若干 token、done；出错时为 error。
+    没有对话历史的相同问题同时到达时共用一次LLM生成，后到的请求先回放已生成的部分。
+    排队与拒绝规则同 /query（拒绝发生在开始推送事件之前）。
+    """
+    system = get_consultation_system()
+    session_id = request.session_id or str(uuid.uuid4())
+    
+    try:
+        admission.check(request.priority)
+    except AdmissionRejected as e:
+        raise rejection_to_http(e)
+    
+    filters = request.filters.dict(exclude_none=True) if request.filters else None
+    if filters:
+        try:
+            await run_in_threadpool(system.retriever.check_filters, filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    session_lock = get_session_lock(session_id)
+    with span("session_lock_wait"), time_stage("session_lock_wait"):
+        await session_lock.acquire()
+    try:
+        with span("session_load"), time_stage("session_load"):
+            context = await run_in_threadpool(load_session, session_id)
+        
+        logger.info(f"Streaming query for session {session_id}: {request.question}")
+        set_trace_attribute("session.id", session_id)
+        retrieved_context, flight_key, decision = await run_in_threadpool(
+            system.prepare_query, request.question,
+            show_results=request.show_results, context=context, filters=filters
+        )
+        stream, shared = await start_answer(
+            system, request.question, context, retrieved_context, flight_key, decision, request.priority
+        )
+    except AdmissionRejected as e:
+        session_lock.release()
+        raise rejection_to_http(e)
+    except Exception as e:
+        session_lock.release()
+        logger.error(f"Query processing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Query processing failed: {str(e)}")
+    except BaseException:
+        session_lock.release()
+        raise
+    
+    # 在返回响应之前订阅：响应结束（含客户端断开）时关闭订阅，所有订阅者都离开后后台生成会停止
+    subscription = stream.subscribe()
+    
+    def cleanup():
+        subscription.close()
+        session_lock.release()
+    
+    async def events():
+        start = time.perf_counter()
+        try:
+            yield sse_event("meta", {"session_id": session_id, "shared": shared, "route": decision.route})
+            chunks = []
+            async for chunk in iterate_in_threadpool(subscription):
+                chunks.append(chunk)
+                yield sse_event("token", {"content": chunk})
+            observe_stage("qa", time.perf_counter() - start)
+            
+            answer = "".join(chunks)
+            system.complete_turn(request.question, answer, context)
+            with time_stage("session_save"):
+                await run_in_threadpool(sessions.__setitem__, session_id, context)
+            yield sse_event("done", {"session_id": session_id, "timestamp": datetime.now().isoformat()})
+        except Exception as e:
+            logger.error(f"Streaming query failed: {str(e)}")
+            yield sse_event("error", {"detail": f"Query processing failed: {str(e)}"})
+        finally:
+            subscription.close()
+    
+    return CleanupStreamingResponse(
+        events(), cleanup, media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def ws_send(websocket: WebSocket, event: str, **data) -> bool:
+    """发送一条 WebSocket 事件；连接已关闭时返回 False"""
+    try:
+        await websocket.send_text(json.dumps({"event": event, **data}, ensure_ascii=False))
+        return True
+    except Exception:
+        return False
+
+async def run_chat_turn(websocket: WebSocket, system, session_id: str, turn: int, message: ChatMessage):
+    """WebSocket 对话中的一轮问答；任务被取消时停止读取，没有其他读取者时后台生成随之中止"""
+    subscription = None
+    result = "error"
+    session_lock = get_session_lock(session_id)
+    with start_trace("WS /ws/chat", uuid.uuid4().hex, **{"session.id": session_id, "ws.turn": turn}):
+        with span("session_lock_wait"), time_stage("session_lock_wait"):
+            await session_lock.acquire()
+        try:
+            admission.check(message.priority)
+            filters = message.filters.dict(exclude_none=True) if message.filters else None
+            if filters:
+                await run_in_threadpool(system.retriever.check_filters, filters)
+            
+            with span("session_load"), time_stage("session_load"):
+                context = await run_in_threadpool(load_session, session_id)
+            
+            await ws_send(websocket, "retrieving", turn=turn)
+            retrieved_context, flight_key, decision = await run_in_threadpool(
+                system.prepare_query, message.question, show_results=False, context=context, filters=filters
+            )
+            await ws_send(websocket, "retrieval", turn=turn, route=decision.route,
+                          context=retrieved_context if message.show_results else None)
+            
+            stream, shared = await start_answer(
+                system, message.question, context, retrieved_context, flight_key, decision, message.priority
+            )
+            # 取得 token 流后立即订阅，之后取消时才能让生成随之中止
+            subscription = stream.subscribe()
+            await ws_send(websocket, "meta", turn=turn, session_id=session_id, shared=shared, route=decision.route)
+            
+            start = time.perf_counter()
+            chunks = []
+            async for chunk in iterate_in_threadpool(subscription):
+                chunks.append(chunk)
+                await ws_send(websocket, "token", turn=turn, content=chunk)
+            observe_stage("qa", time.perf_counter() - start)
+            
+            answer = "".join(chunks)
+            system.complete_turn(message.question, answer, context)
+            with time_stage("session_save"):
+                await run_in_threadpool(sessions.__setitem__, session_id, context)
+            result = "done"
+            await ws_send(websocket, "done", turn=turn, session_id=session_id, timestamp=datetime.now().isoformat())
+        except asyncio.CancelledError:
+            # 用户修改问题或断开：未完成的回答不记入对话历史
+            result = "cancelled"
+            if subscription is not None:
+                subscription.close()
+            await ws_send(websocket, "cancelled", turn=turn)
+            raise
+        except AdmissionRejected as e:
+            result = "rejected"
+            await ws_send(websocket, "error", turn=turn, status=e.status_code, retry_after=e.retry_after,
+                          detail=f"Server busy ({e.reason}), retry after {e.retry_after}s")
+        except ValueError as e:
+            await ws_send(websocket, "error", turn=turn, status=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"WebSocket query failed: {str(e)}")
+            await ws_send(websocket, "error", turn=turn, status=500, detail=f"Query processing failed: {str(e)}")
+        finally:
+            if subscription is not None:
+                subscription.close()
+            session_lock.release()
+            WS_TURNS.inc(result=result)
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, session_id: Optional[str] = None):
+    """WebSocket 多轮对话：一个连接对应一个会话
+    
+    客户端发送 {"type": "query", "question": ...}，服务端依次推送 retrieving、retrieval、meta、
+    若干 token、done 事件（均带 turn 序号）；出错时为 error。回答进行中再次提问或发送
+    {"type": "cancel"} 会取消当前回答（推送 cancelled），生成名额立即归还。
+    """
+    await websocket.accept()
+    try:
+        system = get_consultation_system()
+    except HTTPException as e:
+        await ws_send(websocket, "error", status=e.status_code, detail=e.detail)
+        await websocket.close(code=1013)
+        return
+    
+    session_id = session_id or str(uuid.uuid4())
+    await ws_send(websocket, "session", session_id=session_id)
+    logger.info(f"WebSocket chat opened for session {session_id}")
+    
+    turn = 0
+    current: Optional[asyncio.Task] = None
+    
+    async def cancel_current():
+        if current is not None and not current.done():
+            current.cancel()
+            await asyncio.gather(current, return_exceptions=True)
+    
+    WS_CONNECTIONS.inc()
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = ChatMessage(**json.loads(raw))
+            except (ValueError, TypeError, ValidationError) as e:
+                await ws_send(websocket, "error", status=400, detail=f"Invalid message: {e}")
+                continue
+            
+            if message.type == "ping":
+                await ws_send(websocket, "pong", timestamp=datetime.now().isoformat())
+            elif message.type == "cancel":
+                await cancel_current()
+            elif not message.question:
+                await ws_send(websocket, "error", status=400, detail="question is required")
+            else:
+                await cancel_current()
+                turn += 1
+                current = asyncio.create_task(run_chat_turn(websocket, system, session_id, turn, message))
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket chat closed for session {session_id}")
+    finally:
+        await cancel_current()
+        WS_CONNECTIONS.dec()
+
 @app.post("/search", response_model=SearchResponse)
 async def search_laws(request: SearchRequest):
     """搜索法律文档"""
@@ -231,7 +938,10 @@ async def search_laws(request: SearchRequest):
         system = get_consultation_system()
         
         logger.info(f"Searching for: {request.query}")
-        results = system.search_and_display(request.query, k=request.k)
+        results = await run_in_threadpool(
+            system.search_and_display, request.query, k=request.k, min_score=request.min_score,
+            filters=request.filters.dict(exclude_none=True) if request.filters else None
+        )
         
         # 转换结果格式
         search_results = [
@@ -251,6 +961,11 @@ async def search_laws(request: SearchRequest):
             timestamp=datetime.now().isoformat()
         )
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # 过滤条件不合法，或索引缺少对应字段
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Search failed: {str(e)}")
         raise HTTPException(
@@ -258,9 +973,100 @@ async def search_laws(request: SearchRequest):
             detail=f"Search failed: {str(e)}"
         )
 
+def _prefetch(system, question: str, session_id: Optional[str], filters: Optional[Dict[str, Any]]):
+    """在线程池中执行预取：只读会话上下文，不加会话锁"""
+    try:
+        context = sessions[session_id] if session_id and session_id in sessions else None
+        if context is None:
+            context = ConversationContext(session_id=session_id or "")
+        system.prefetch(question, context=context, filters=filters)
+    except Exception as e:
+        logger.warning(f"Prefetch failed: {str(e)}")
+    finally:
+        prefetch_slots.release()
+
+@app.post("/search/prefetch", response_model=PrefetchResponse, status_code=202)
+async def prefetch_search(request: PrefetchRequest):
+    """用户输入过程中预取检索
+    
+    按提交 /query 时相同的追问改写、条数与过滤条件在后台检索一次，填充查询向量与检索结果缓存，
+    提交后检索阶段直接命中缓存，只剩LLM调用。立即返回，不等待检索完成。
+    """
+    system = get_consultation_system()
+    
+    question = request.question.strip()
+    if len(question) < PREFETCH_MIN_CHARS:
+        return PrefetchResponse(accepted=False, reason="too_short", timestamp=datetime.now().isoformat())
+    if not prefetch_slots.acquire(blocking=False):
+        return PrefetchResponse(accepted=False, reason="busy", timestamp=datetime.now().isoformat())
+    
+    filters = request.filters.dict(exclude_none=True) if request.filters else None
+    asyncio.get_running_loop().run_in_executor(
+        None, _prefetch, system, question, request.session_id, filters
+    )
+    return PrefetchResponse(accepted=True, timestamp=datetime.now().isoformat())
+
+@app.post("/sessions/{session_id}/summary/jobs", response_model=JobResponse, status_code=202)
+async def create_summary_job(session_id: str):
+    """提交会话总结任务，立即返回任务ID
+    
+    通过 GET /jobs/{job_id} 轮询或 GET /jobs/{job_id}/events 订阅进度与结果。
+    会话内容未变时重复提交返回同一个任务（已完成的直接带结果），不会重复调用LLM。
+    """
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    system = get_consultation_system()
+    job = submit_summary_job(system, session_id, sessions[session_id])
+    return JobResponse(**job.snapshot())
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """查询后台任务的状态、进度与结果"""
+    return JobResponse(**find_job(job_id).snapshot())
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """订阅后台任务进度（Server-Sent Events）
+    
+    事件为若干 progress（进度、阶段、新生成的文本 delta），最后为 done（任务结果）或 error。
+    """
+    job = find_job(job_id)
+    
+    async def events():
+        seen = -1
+        sent = 0
+        while True:
+            changed = await run_in_threadpool(job.wait_for_update, seen, 15)
+            state = job.snapshot()
+            if not changed:
+                # 保持连接
+                yield ": keep-alive\n\n"
+                continue
+            seen = state["version"]
+            if state["status"] == "succeeded":
+                yield sse_event("done", {"job_id": job_id, "result": state["result"]})
+                return
+            if state["status"] == "failed":
+                yield sse_event("error", {"job_id": job_id, "detail": state["error"]})
+                return
+            yield sse_event("progress", {
+                "job_id": job_id,
+                "status": state["status"],
+                "progress": state["progress"],
+                "stage": state["stage"],
+                "delta": state["partial"][sent:],
+            })
+            sent = len(state["partial"])
+    
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/sessions/{session_id}/summary", response_model=SummaryResponse)
 async def get_session_summary(session_id: str):
-    """获取会话总结"""
+    """获取会话总结（等待总结完成；与总结任务共用同一会话版本的结果）"""
     try:
         if session_id not in sessions:
             raise HTTPException(
@@ -269,16 +1075,12 @@ async def get_session_summary(session_id: str):
             )
         
         system = get_consultation_system()
-        system.context = sessions[session_id]
+        job = submit_summary_job(system, session_id, sessions[session_id])
+        await run_in_threadpool(job.wait)
+        if job.status == "failed":
+            raise HTTPException(status_code=500, detail=f"Summary generation failed: {job.error}")
         
-        logger.info(f"Getting summary for session {session_id}")
-        summary = system.get_conversation_summary()
-        
-        return SummaryResponse(
-            summary=summary,
-            session_id=session_id,
-            timestamp=datetime.now().isoformat()
-        )
+        return SummaryResponse(**job.result)
         
     except HTTPException:
         raise
@@ -289,6 +1091,33 @@ async def get_session_summary(session_id: str):
             detail=f"Summary generation failed: {str(e)}"
         )
 
+@app.get("/sessions/{session_id}/history")
+async def get_session_history(session_id: str):
+    """获取会话历史消息"""
+    try:
+        if session_id not in sessions:
+            raise HTTPException(
+                status_code=404,
+                detail="Session not found"
+            )
+        
+        history = [msg.to_dict() for msg in sessions.history(session_id)]
+        return {
+            "session_id": session_id,
+            "messages": history,
+            "total": len(history),
+            "timestamp": datetime.now().isoformat()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Session history retrieval failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Session history retrieval failed: {str(e)}"
+        )
+
 @app.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     """删除会话"""
@@ -300,6 +1129,7 @@ async def delete_session(session_id: str):
             )
         
         del sessions[session_id]
+        session_locks.pop(session_id, None)
         logger.info(f"Deleted session {session_id}")
         
         return {"message": "Session deleted successfully", "session_id": session_id}
@@ -321,8 +1151,8 @@ async def list_sessions():
         for session_id, context in sessions.items():
             session_info.append({
                 "session_id": session_id,
-                "message_count": len(context.history),
-                "last_activity": context.history[-1]['timestamp'] if context.history else None,
+                "message_count": context.message_count,
+                "last_activity": context.last_activity,
                 "current_topic": context.current_topic
             })
         
@@ -349,9 +1179,9 @@ async def reset_session(session_id: str):
                 detail="Session not found"
             )
         
-        # 重置会话上下文
-        sessions[session_id] = ConversationContext()
-        sessions[session_id].session_id = session_id
+        # 重置会话上下文（同时删除已转存的早期消息）
+        del sessions[session_id]
+        sessions[session_id] = ConversationContext(session_id=session_id)
         
         logger.info(f"Reset session {session_id}")
         
@@ -374,7 +1204,8 @@ async def http_exception_handler(request, exc):
         content=ErrorResponse(
             error=exc.detail,
             timestamp=datetime.now().isoformat()
-        ).dict()
+        ).dict(),
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
@@ -0,0 +1,208 @@
+"""
+会话存储
+
+单进程部署使用内存字典；多 worker 部署时各进程内存不共享，
+改用 SQLite 文件保存会话，使同一会话的请求无论落到哪个 worker 都能恢复上下文。
+
+设置 SESSION_HISTORY_LIMIT 后每个会话只保留最近的消息，保存会话时更早的消息
+转存到 SQLite 的 session_messages 表（MessageArchive），需要完整历史时再读出。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from typing import Iterator, List, Optional, Tuple
+
+from agent import ConversationContext, Message
+
+
+class SQLiteConnection:
+    """每个线程（及 fork 后的每个进程）使用独立连接，首次连接时建表"""
+
+    def __init__(self, db_path: str, schema: List[str]):
+        self.db_path = db_path
+        self.schema = schema
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                for statement in self.schema:
+                    conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+ARCHIVE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS session_messages ("
+    "session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+    "timestamp INTEGER NOT NULL, PRIMARY KEY (session_id, seq))"
+]
+
+
+class MessageArchive:
+    """会话早期消息的持久化存储（按会话内序号保存）"""
+
+    def __init__(self, connect: SQLiteConnection):
+        self._connect = connect
+
+    def append(self, session_id: str, start: int, messages: List[Message], conn: sqlite3.Connection = None):
+        """写入序号从 start 开始的消息；传入 conn 时在调用方的事务中执行"""
+        rows = [(session_id, start + i, msg.role.value, msg.content, msg.timestamp) for i, msg in enumerate(messages)]
+        sql = "INSERT OR REPLACE INTO session_messages VALUES (?, ?, ?, ?, ?)"
+        if conn is not None:
+            conn.executemany(sql, rows)
+            return
+        with self._connect() as conn:
+            conn.executemany(sql, rows)
+
+    def load(self, session_id: str, limit: int) -> List[Message]:
+        """读出前 limit 条消息"""
+        rows = self._connect().execute(
+            "SELECT role, content, timestamp FROM session_messages WHERE session_id = ? AND seq < ? ORDER BY seq",
+            (session_id, limit)
+        ).fetchall()
+        return [Message(*row) for row in rows]
+
+    def delete(self, session_id: str, conn: sqlite3.Connection = None):
+        sql = "DELETE FROM session_messages WHERE session_id = ?"
+        if conn is not None:
+            conn.execute(sql, (session_id,))
+            return
+        with self._connect() as conn:
+            conn.execute(sql, (session_id,))
+
+
+class ArchivedHistoryMixin:
+    """两种会话存储共用：读出完整的会话历史"""
+
+    def history(self, session_id: str, context: ConversationContext = None) -> List[Message]:
+        """完整的会话历史（含已转存的消息）"""
+        if context is None:
+            context = self[session_id]
+        if not context.archived:
+            return list(context.history)
+        return self.archive.load(session_id, context.archived) + context.history
+
+
+class MemorySessionStore(ArchivedHistoryMixin, dict):
+    """内存会话存储；保存会话时把超出 history_limit 的消息转存到 archive（没有 archive 时不限制）"""
+
+    def __init__(self, archive: Optional[MessageArchive], history_limit: int):
+        super().__init__()
+        self.archive = archive
+        # 没有可转存的地方时不截断，消息不会丢失
+        self.history_limit = history_limit if archive is not None else 0
+
+    def __setitem__(self, session_id: str, context: ConversationContext):
+        start = context.archived
+        overflow = context.trim(self.history_limit)
+        if overflow:
+            self.archive.append(session_id, start, overflow)
+        super().__setitem__(session_id, context)
+
+    def __delitem__(self, session_id: str):
+        super().__delitem__(session_id)
+        if self.archive is not None:
+            self.archive.delete(session_id)
+
+
+class SQLiteSessionStore(ArchivedHistoryMixin, MutableMapping):
+    """基于 SQLite 的会话存储，接口与 Dict[str, ConversationContext] 相同"""
+
+    def __init__(self, db_path: str, history_limit: int = 0):
+        self.db_path = db_path
+        self.history_limit = history_limit
+        self._connect = SQLiteConnection(db_path, [
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        ] + ARCHIVE_SCHEMA)
+        self.archive = MessageArchive(self._connect)
+        self._connect()
+
+    @staticmethod
+    def _dumps(context: ConversationContext) -> str:
+        return json.dumps(context.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def _loads(data: str) -> ConversationContext:
+        return ConversationContext.from_dict(json.loads(data))
+
+    def __getitem__(self, session_id: str) -> ConversationContext:
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        return self._loads(row[0])
+
+    def __setitem__(self, session_id: str, context: ConversationContext):
+        start = context.archived
+        overflow = context.trim(self.history_limit)
+        with self._connect() as conn:
+            if overflow:
+                self.archive.append(session_id, start, overflow, conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                (session_id, self._dumps(context), time.time())
+            )
+
+    def __delitem__(self, session_id: str):
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self.archive.delete(session_id, conn)
+        if cursor.rowcount == 0:
+            raise KeyError(session_id)
+
+    def __contains__(self, session_id) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self._connect().execute("SELECT session_id FROM sessions ORDER BY updated_at").fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def items(self) -> List[Tuple[str, ConversationContext]]:
+        rows = self._connect().execute(
+            "SELECT session_id, data FROM sessions ORDER BY updated_at"
+        ).fetchall()
+        return [(session_id, self._loads(data)) for session_id, data in rows]
+
+
+def resolve_db_path() -> str:
+    db_path = os.getenv("SESSION_DB_PATH", "sessions.db")
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    return db_path
+
+
+def create_session_store():
+    """根据 SESSION_STORE 环境变量创建会话存储（memory 或 sqlite）
+
+    SESSION_HISTORY_LIMIT 为每个会话在内存中保留的消息数（0 表示不限制、不转存），更早的消息转存到
+    SESSION_DB_PATH，完整历史仍可读出。sqlite 存储默认 40；memory 存储默认 0，与原来一样不写磁盘，
+    显式设置后才把更早的消息转存到 SQLite 文件。
+    """
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteSessionStore(resolve_db_path(), int(os.getenv("SESSION_HISTORY_LIMIT", "40")))
+
+    history_limit = int(os.getenv("SESSION_HISTORY_LIMIT", "0"))
+    archive = None
+    if history_limit > 0:
+        archive = MessageArchive(SQLiteConnection(resolve_db_path(), ARCHIVE_SCHEMA))
+    return MemorySessionStore(archive, history_limit)
@@ -27,4 +27,11 @@ echo "API文档: http://localhost:8000/docs"
 echo "ReDoc文档: http://localhost:8000/redoc"
 echo "按 Ctrl+C 停止服务"
 
-python3 -m uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+# WORKERS>1 时使用 gunicorn 预加载 + 多 worker 模式（共享mmap索引与元数据）
+WORKERS=${WORKERS:-1}
+if [ "$WORKERS" -gt 1 ]; then
+    echo "多worker模式: $WORKERS 个worker"
+    WORKERS=$WORKERS python3 -m gunicorn main:app -c gunicorn_conf.py
+else
+    python3 -m uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+fi
@@ -0,0 +1,139 @@
+"""
+检索过滤条件
+
+按法规名称、文件名、法规类别、章节、施行日期限定检索范围。
+过滤条件先转换为候选条文的位图，再通过 FAISS 的 IDSelectorBitmap 在索引内部过滤，
+不需要多取结果再在 Python 里筛选，也不会因为多取不够而漏掉结果。
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# 过滤字段 -> 元数据中的列
+FILTER_FIELDS = {
+    'law_name': 'law_name',
+    'filename': 'filename',
+    'category': 'category',
+    'chapter': 'chapter',
+    'effective_after': 'effective_date',
+    'effective_before': 'effective_date',
+}
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def extract_category(law_name: str) -> str:
+    """按法规名称后缀判断类别"""
+    if law_name.endswith('解释') or '司法解释' in law_name:
+        return '司法解释'
+    if law_name.endswith('条例'):
+        return '行政法规'
+    if law_name.endswith(('规定', '办法', '细则', '规则')):
+        return '部门规章'
+    if law_name.endswith(('法', '法典')):
+        return '法律'
+    return '其他'
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """校验过滤条件并统一格式（字符串列表字段转为元组），空条件返回空字典"""
+    normalized = {}
+    for name, value in (filters or {}).items():
+        if value is None or value == [] or value == '':
+            continue
+        if name not in FILTER_FIELDS:
+            raise ValueError(f"不支持的过滤字段: {name}")
+        if name.startswith('effective_'):
+            if not DATE_PATTERN.match(str(value)):
+                raise ValueError(f"{name} 需要 YYYY-MM-DD 格式的日期")
+            normalized[name] = str(value)
+        else:
+            values = [value] if isinstance(value, str) else list(value)
+            normalized[name] = tuple(sorted(str(v).strip() for v in values if str(v).strip()))
+    return normalized
+
+
+def _contains_any(values: np.ndarray, needles: tuple, exact: bool) -> np.ndarray:
+    if exact:
+        return np.isin(values, needles)
+    mask = np.zeros(len(values), dtype=bool)
+    for needle in needles:
+        mask |= np.fromiter((needle in v for v in values), dtype=bool, count=len(values))
+    return mask
+
+
+class FilterIndex:
+    """过滤列与位图缓存（与索引一一对应，索引更换时一起重建）"""
+
+    def __init__(self, metadata, max_cached: int = 256):
+        self.count = len(metadata)
+        self.columns: Dict[str, np.ndarray] = {}
+        self._metadata = metadata
+        self._cache: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._max_cached = max_cached
+        self._lock = threading.Lock()
+
+    def _column(self, name: str) -> np.ndarray:
+        column = self.columns.get(name)
+        if column is not None:
+            return column
+
+        metadata = self._metadata
+        if hasattr(metadata, 'get_field'):
+            values = [metadata.get_field(i, name) for i in range(self.count)]
+        else:
+            values = [record.get(name) for record in metadata]
+
+        if name == 'category' and all(v is None for v in values):
+            # 旧索引没有类别列，按法规名称推断
+            values = [extract_category(law_name) for law_name in self._column('law_name')]
+        elif all(v is None for v in values):
+            raise ValueError(f"索引元数据中没有 {name} 字段，请重新运行 build_faiss_index.py")
+
+        column = np.array(['' if v is None else str(v) for v in values], dtype=object)
+        self.columns[name] = column
+        return column
+
+    def values(self, name: str) -> list:
+        """某个元数据字段的全部取值（去重、排序）"""
+        return sorted(set(self._column(name)) - {''})
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """满足全部过滤条件的条文（布尔数组）"""
+        mask = np.ones(self.count, dtype=bool)
+        for name, value in filters.items():
+            column = self._column(FILTER_FIELDS[name])
+            if name == 'effective_after':
+                mask &= (column != '') & (column >= value)
+            elif name == 'effective_before':
+                mask &= (column != '') & (column <= value)
+            else:
+                # 文件名、类别精确匹配；法规名称、章节允许简称（子串匹配）
+                mask &= _contains_any(column, value, exact=name in ('filename', 'category'))
+        return mask
+
+    def selector(self, filters: Dict[str, Any]):
+        """返回 (匹配条数, FAISS IDSelector, 位图)；结果按过滤条件缓存"""
+        key = tuple(sorted(filters.items()))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        import faiss
+
+        mask = self.mask(filters)
+        # IDSelectorBitmap 按小端位序读取位图；bitmap 需与 selector 一起保存，避免被回收
+        bitmap = np.packbits(mask, bitorder='little')
+        selector = faiss.IDSelectorBitmap(self.count, faiss.swig_ptr(bitmap))
+        entry = (int(mask.sum()), selector, bitmap)
+
+        with self._lock:
+            self._cache[key] = entry
+            while len(self._cache) > self._max_cached:
+                self._cache.popitem(last=False)
+        return entry
@@ -0,0 +1,202 @@
+"""
+相同请求合并（single-flight）
+
+热点事件时大量用户几乎同时提交同一个问题。回答只取决于问题和检索到的法条时（没有对话历史），
+这些请求共用一次LLM生成：第一个请求在后台线程中生成并把 token 写入 SharedStream，
+后到的请求从头回放已生成的部分，再接上同一个 token 流。生成结束后合并条目即删除，
+之后的相同请求重新生成（结果缓存不在这里做）。
+"""
+
+import contextvars
+import threading
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class GenerationCancelled(Exception):
+    """所有订阅者都已离开，生成被中止"""
+
+
+class SharedStream:
+    """可被多个订阅者从头读取的 token 流"""
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._subscribers = 0
+        self._subscribed = False
+        self._callbacks: List[Callable[[], None]] = []
+        self._abandon_callbacks: List[Callable[[], None]] = []
+        self._cond = threading.Condition()
+
+    def put(self, chunk: str):
+        with self._cond:
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+            callbacks, self._callbacks = self._callbacks, []
+            self._abandon_callbacks = []
+        for callback in callbacks:
+            callback()
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        """生成结束（含出错、中止）后调用 callback；已结束时立即调用"""
+        with self._cond:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def add_abandon_callback(self, callback: Callable[[], None]):
+        """生成结束前所有订阅者都已离开（取消、断开）时立即调用 callback，不等生成线程发现
+
+        生成线程在下一段到达时才能中止（首token之前则要等首token），名额等资源可以先行归还。
+        """
+        with self._cond:
+            if not self._done:
+                self._abandon_callbacks.append(callback)
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def abandoned(self) -> bool:
+        """曾经有人订阅、但所有订阅者都已离开（客户端断开）"""
+        return self._subscribed and self._subscribers == 0
+
+    def text(self) -> str:
+        with self._cond:
+            return "".join(self._chunks)
+
+    def subscribe(self, timeout: Optional[float] = None) -> "Subscription":
+        """订阅（从第一段开始读）；timeout 为等待下一段的最长秒数"""
+        with self._cond:
+            self._subscribers += 1
+            self._subscribed = True
+        return Subscription(self, timeout)
+
+    def __iter__(self) -> "Subscription":
+        return self.subscribe()
+
+    def _get(self, index: int, timeout: Optional[float]) -> Optional[str]:
+        """第 index 段；流已结束返回 None（生成出错时抛出原异常）"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: index < len(self._chunks) or self._done, timeout):
+                raise TimeoutError("等待生成超时")
+            if index < len(self._chunks):
+                return self._chunks[index]
+            if self._error is not None:
+                raise self._error
+            return None
+
+    def _unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+            callbacks = []
+            if self._subscribers == 0 and not self._done:
+                callbacks, self._abandon_callbacks = self._abandon_callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class Subscription:
+    """SharedStream 的一个读取者；读完、出错或调用 close() 后退出订阅"""
+
+    def __init__(self, stream: SharedStream, timeout: Optional[float] = None):
+        self._stream = stream
+        self._index = 0
+        self._timeout = timeout
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> "Subscription":
+        return self
+
+    def __next__(self) -> str:
+        if self._closed:
+            raise StopIteration
+        try:
+            chunk = self._stream._get(self._index, self._timeout)
+        except BaseException:
+            self.close()
+            raise
+        if chunk is None:
+            self.close()
+            raise StopIteration
+        self._index += 1
+        return chunk
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stream._unsubscribe()
+
+
+class SingleFlight:
+    """按键合并进行中的生成"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, SharedStream] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def get(self, key: Optional[Hashable]) -> Optional[SharedStream]:
+        """进行中的生成（没有时返回 None）"""
+        if key is None:
+            return None
+        with self._lock:
+            return self._flights.get(key)
+
+    def stream(self, key: Optional[Hashable], produce: Callable[[], Iterable[str]]) -> Tuple[SharedStream, bool]:
+        """返回 (token 流, 是否由本次调用发起生成)
+
+        key 为 None 时不参与合并，只是同样在后台线程中生成。生成在调用方的 contextvars
+        上下文中运行，LLM 的 span 仍记在发起请求的 trace 里。
+        """
+        with self._lock:
+            stream = self._flights.get(key) if key is not None else None
+            if stream is not None:
+                return stream, False
+            stream = SharedStream()
+            if key is not None:
+                self._flights[key] = stream
+
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run, args=(self._run, key, stream, produce),
+            name="single-flight", daemon=True
+        ).start()
+        return stream, True
+
+    def _run(self, key: Optional[Hashable], stream: SharedStream, produce: Callable[[], Iterable[str]]):
+        error = None
+        try:
+            chunks = produce()
+            try:
+                for chunk in chunks:
+                    stream.put(chunk)
+                    if stream.abandoned:
+                        # 所有请求都已断开，停止生成；此时才订阅的请求会收到异常而不是半截回答
+                        raise GenerationCancelled("所有请求都已断开，生成已中止")
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+        except BaseException as e:
+            error = e
+        finally:
+            if key is not None:
+                with self._lock:
+                    if self._flights.get(key) is stream:
+                        del self._flights[key]
+            stream.finish(error)
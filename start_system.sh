@@ -76,16 +76,28 @@ FASTAPI_PID=$!
 echo "FastAPI PID: $FASTAPI_PID"
 cd ..
 
-# 等待FastAPI启动
+# 等待FastAPI就绪（模型与索引在后台加载，/health/ready 返回200表示可以处理查询）
 echo "⏳ 等待FastAPI服务启动..."
-sleep 5
+STARTUP_TIMEOUT=${STARTUP_TIMEOUT:-180}
+READY=0
+for ((i = 0; i < STARTUP_TIMEOUT; i++)); do
+    if ! kill -0 $FASTAPI_PID 2>/dev/null; then
+        break
+    fi
+    if curl -sf http://localhost:8000/health/ready > logs/startup.json 2>/dev/null; then
+        READY=1
+        break
+    fi
+    sleep 1
+done
 
 # 检查FastAPI是否启动成功
-curl -s http://localhost:8000/health > /dev/null
-if [ $? -eq 0 ]; then
-    echo "✅ FastAPI后端启动成功"
+if [ $READY -eq 1 ]; then
+    echo "✅ FastAPI后端启动成功 (${i}s)"
+    echo "   启动阶段耗时: $(cat logs/startup.json)"
 else
     echo "❌ FastAPI后端启动失败，请检查日志: logs/fastapi.log"
+    curl -s http://localhost:8000/health/ready 2>/dev/null && echo ""
     kill $FASTAPI_PID 2>/dev/null
     exit 1
 fi
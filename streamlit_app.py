@@ -1,13 +1,28 @@
 import streamlit as st
-import requests
 import json
-import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 
+from legal_client import APIError, LegalClient, LegalClientError
+
+try:
+    # 可选：输入框逐字回传内容（pip install streamlit-keyup），用于输入过程中预取检索
+    from st_keyup import st_keyup
+except ImportError:
+    st_keyup = None
+
+# 停止输入多久后预取检索（毫秒）
+PREFETCH_DEBOUNCE_MS = 400
+
+# 健康状态与会话列表的缓存秒数：每次页面重新运行不再重复请求，刷新按钮与会话变化时清除
+HEALTH_CACHE_TTL = 10
+SESSIONS_CACHE_TTL = 5
+# 会话历史按消息数与最后一条消息的时间区分缓存，过期时间兜底
+HISTORY_CACHE_TTL = 60
+
 # 页面配置
 st.set_page_config(
     page_title="法律咨询助手",
@@ -121,200 +136,111 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_api_client(base_url: str) -> LegalClient:
+    """所有页面与重新运行共用的SDK客户端（连接池），避免每个请求重新建立连接"""
+    return LegalClient(base_url, timeout=120)
+
 class LegalConsultationClient:
-    """法律咨询API客户端"""
+    """法律咨询API客户端（legal_client 的封装，返回 success/data/error 字典供页面显示）"""
     
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url.rstrip('/')
-        
-    def check_health(self) -> Dict:
-        """检查API健康状态"""
+        self.api = get_api_client(self.base_url)
+    
+    @staticmethod
+    def _call(function, *args, **kwargs) -> Dict:
         try:
-            response = requests.get(f"{self.base_url}/health", timeout=5)
             return {
-                "status": "healthy" if response.status_code == 200 else "unhealthy",
-                "data": response.json() if response.status_code == 200 else None,
+                "success": True,
+                "data": function(*args, **kwargs),
                 "error": None
             }
-        except Exception as e:
+        except APIError as e:
             return {
-                "status": "error",
+                "success": False,
                 "data": None,
-                "error": str(e)
-            }
-    
-    def query_law(self, question: str, session_id: Optional[str] = None, show_results: bool = True) -> Dict:
-        """发送法律咨询查询"""
-        try:
-            payload = {
-                "question": question,
-                "show_results": show_results
+                "error": e.detail
             }
-            if session_id:
-                payload["session_id"] = session_id
-                
-            response = requests.post(
-                f"{self.base_url}/query",
-                json=payload,
-                timeout=60  # 增加超时时间到60秒
-            )
-            
-            if response.status_code == 200:
-                return {
-                    "success": True,
-                    "data": response.json(),
-                    "error": None
-                }
-            else:
-                return {
-                    "success": False,
-                    "data": None,
-                    "error": response.json().get("detail", "Unknown error")
-                }
-        except Exception as e:
+        except LegalClientError as e:
             return {
                 "success": False,
                 "data": None,
                 "error": str(e)
             }
+        
+    def check_health(self) -> Dict:
+        """检查API健康状态"""
+        result = self._call(self.api.health)
+        if result["success"]:
+            return {"status": "healthy", "data": result["data"], "error": None}
+        return {"status": "error", "data": None, "error": result["error"]}
+    
+    def query_law(self, question: str, session_id: Optional[str] = None, show_results: bool = True) -> Dict:
+        """发送法律咨询查询"""
+        return self._call(self.api.query, question, session_id=session_id, show_results=show_results)
+    
+    def stream_query(self, question: str, session_id: Optional[str] = None, show_results: bool = True,
+                     meta: Optional[Dict] = None) -> Iterator[str]:
+        """流式法律咨询（/query/stream），逐段返回回答；会话ID等写入 meta，出错时抛出异常"""
+        return self.api.stream_answer(question, session_id, meta=meta, show_results=show_results)
     
     def search_laws(self, query: str, k: int = 5) -> Dict:
         """搜索法律文档"""
+        return self._call(self.api.search, query, k=k)
+    
+    def prefetch(self, question: str, session_id: Optional[str] = None) -> bool:
+        """输入过程中预取检索（服务端立即返回；失败不影响提问）"""
+        return self.api.prefetch(question, session_id=session_id)
+    
+    def start_summary_job(self, session_id: str) -> Dict:
+        """提交会话总结任务，立即返回任务ID（会话内容未变时返回已有任务）"""
+        return self._call(self.api.start_summary_job, session_id)
+    
+    def get_job(self, job_id: str) -> Dict:
+        """查询后台任务的状态与进度"""
+        return self._call(self.api.get_job, job_id)
+    
+    def wait_summary(self, session_id: str, on_progress=None, timeout: float = 180) -> Dict:
+        """提交总结任务并等待结束，每次轮询调用 on_progress(任务状态)"""
         try:
-            payload = {
-                "query": query,
-                "k": k
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/search",
-                json=payload,
-                timeout=20
-            )
-            
-            if response.status_code == 200:
-                return {
-                    "success": True,
-                    "data": response.json(),
-                    "error": None
-                }
-            else:
-                return {
-                    "success": False,
-                    "data": None,
-                    "error": response.json().get("detail", "Unknown error")
-                }
-        except Exception as e:
-            return {
-                "success": False,
-                "data": None,
-                "error": str(e)
-            }
+            return self._call(self.api.summarize, session_id, timeout=timeout, on_progress=on_progress)
+        except TimeoutError:
+            return {"success": False, "data": None, "error": "生成总结超时"}
     
     def get_session_summary(self, session_id: str) -> Dict:
         """获取会话总结"""
-        try:
-            response = requests.get(
-                f"{self.base_url}/sessions/{session_id}/summary",
-                timeout=120  # 增加超时时间到120秒，因为生成总结可能需要较长时间
-            )
-            
-            if response.status_code == 200:
-                return {
-                    "success": True,
-                    "data": response.json(),
-                    "error": None
-                }
-            else:
-                return {
-                    "success": False,
-                    "data": None,
-                    "error": response.json().get("detail", "Unknown error")
-                }
-        except Exception as e:
-            return {
-                "success": False,
-                "data": None,
-                "error": str(e)
-            }
+        return self._call(self.api.get_summary, session_id)
     
     def list_sessions(self) -> Dict:
         """列出所有会话"""
-        try:
-            response = requests.get(f"{self.base_url}/sessions", timeout=10)
-            
-            if response.status_code == 200:
-                return {
-                    "success": True,
-                    "data": response.json(),
-                    "error": None
-                }
-            else:
-                return {
-                    "success": False,
-                    "data": None,
-                    "error": response.json().get("detail", "Unknown error")
-                }
-        except Exception as e:
-            return {
-                "success": False,
-                "data": None,
-                "error": str(e)
-            }
+        return self._call(self.api.list_sessions)
     
     def reset_session(self, session_id: str) -> Dict:
         """重置会话"""
-        try:
-            response = requests.post(
-                f"{self.base_url}/sessions/{session_id}/reset",
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                return {
-                    "success": True,
-                    "data": response.json(),
-                    "error": None
-                }
-            else:
-                return {
-                    "success": False,
-                    "data": None,
-                    "error": response.json().get("detail", "Unknown error")
-                }
-        except Exception as e:
-            return {
-                "success": False,
-                "data": None,
-                "error": str(e)
-            }
+        return self._call(self.api.reset_session, session_id)
     
     def get_session_history(self, session_id: str) -> Dict:
         """获取会话历史消息"""
-        try:
-            response = requests.get(
-                f"{self.base_url}/sessions/{session_id}/history",
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                return {
-                    "success": True,
-                    "data": response.json(),
-                    "error": None
-                }
-            else:
-                return {
-                    "success": False,
-                    "data": None,
-                    "error": response.json().get("detail", "Unknown error")
-                }
-        except Exception as e:
-            return {
-                "success": False,
-                "data": None,
-                "error": str(e)
-            }
+        return self._call(self.api.get_history, session_id)
+
+@st.cache_data(ttl=HEALTH_CACHE_TTL, show_spinner=False)
+def fetch_health(base_url: str) -> Dict:
+    """缓存的健康检查"""
+    return LegalConsultationClient(base_url).check_health()
+
+@st.cache_data(ttl=SESSIONS_CACHE_TTL, show_spinner=False)
+def fetch_sessions(base_url: str) -> Dict:
+    """缓存的会话列表"""
+    return LegalConsultationClient(base_url).list_sessions()
+
+@st.cache_data(ttl=HISTORY_CACHE_TTL, max_entries=64, show_spinner=False)
+def fetch_history(base_url: str, session_id: str, message_count: int, last_activity: Optional[str]) -> Dict:
+    """缓存的会话历史；消息数或最后一条消息的时间变化后按新的键重新获取
+    
+    会话在别处被重置后又达到相同消息数时，最后一条消息的时间不同，不会读到旧历史。
+    """
+    return LegalConsultationClient(base_url).get_session_history(session_id)
 
 def init_session_state():
     """初始化会话状态"""
@@ -329,10 +255,17 @@ def init_session_state():
     
     if 'api_status' not in st.session_state:
         st.session_state.api_status = "checking"
+    
+    # 输入框版本号（发送后递增以清空输入框）与最近一次预取的内容
+    if 'input_version' not in st.session_state:
+        st.session_state.input_version = 0
+    
+    if 'last_prefetch' not in st.session_state:
+        st.session_state.last_prefetch = ""
 
 def display_api_status():
     """显示API状态"""
-    health = st.session_state.client.check_health()
+    health = fetch_health(st.session_state.client.base_url)
     
     if health["status"] == "healthy":
         st.session_state.api_status = "healthy"
@@ -353,13 +286,11 @@ def display_api_status():
     </div>
     """, unsafe_allow_html=True)
 
-def display_session_list():
+def display_session_list(sessions_result: Dict):
     """显示会话列表"""
     st.sidebar.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
     st.sidebar.markdown("### 📋 会话列表")
     
-    # 获取所有会话
-    sessions_result = st.session_state.client.list_sessions()
     
     if sessions_result["success"]:
         sessions_data = sessions_result["data"]
@@ -405,7 +336,8 @@ def display_session_list():
                         st.session_state.session_id = session_id
                         
                         # 获取会话历史
-                        history_result = st.session_state.client.get_session_history(session_id)
+                        history_result = fetch_history(st.session_state.client.base_url, session_id, message_count,
+                                                       session.get("last_activity"))
                         if history_result["success"]:
                             history_data = history_result["data"]
                             st.session_state.messages = history_data.get("messages", [])
@@ -446,6 +378,8 @@ def display_sidebar():
         st.rerun()
     
     if st.sidebar.button("🔄 刷新状态"):
+        fetch_health.clear()
+        fetch_sessions.clear()
         st.rerun()
     
     st.sidebar.markdown('</div>', unsafe_allow_html=True)
@@ -463,6 +397,7 @@ def display_sidebar():
         result = st.session_state.client.reset_session(st.session_state.session_id)
         if result["success"]:
             st.session_state.messages = []
+            fetch_sessions.clear()
             st.success("会话已重置")
         else:
             st.error(f"重置失败: {result['error']}")
@@ -474,13 +409,11 @@ def display_sidebar():
     
     st.sidebar.markdown('</div>', unsafe_allow_html=True)
     
-    # 会话列表
-    if st.session_state.api_status == "healthy":
-        display_session_list()
-    
-    # 统计信息
+    # 会话列表与统计信息共用一次请求
     if st.session_state.api_status == "healthy":
-        sessions_result = st.session_state.client.list_sessions()
+        sessions_result = fetch_sessions(st.session_state.client.base_url)
+        display_session_list(sessions_result)
+        
         if sessions_result["success"]:
             sessions_data = sessions_result["data"]
             
@@ -531,22 +464,25 @@ def display_chat_interface():
         """, unsafe_allow_html=True)
     
     # 输入区域
-    with st.form("chat_form", clear_on_submit=True):
-        col1, col2 = st.columns([4, 1])
-        
-        with col1:
-            user_input = st.text_area(
-                "请输入您的法律问题:",
-                placeholder="例如：关于劳动合同解除的相关法律规定是什么？",
-                height=100,
-                key="user_input"
-            )
-        
-        with col2:
-            st.write("") # 空行用于对齐
-            st.write("") # 空行用于对齐
-            show_results = st.checkbox("显示检索结果", value=True)
-            submit_button = st.form_submit_button("🚀 发送", use_container_width=True)
+    if st_keyup is not None:
+        user_input, show_results, submit_button = display_prefetch_input()
+    else:
+        with st.form("chat_form", clear_on_submit=True):
+            col1, col2 = st.columns([4, 1])
+            
+            with col1:
+                user_input = st.text_area(
+                    "请输入您的法律问题:",
+                    placeholder="例如：关于劳动合同解除的相关法律规定是什么？",
+                    height=100,
+                    key="user_input"
+                )
+            
+            with col2:
+                st.write("") # 空行用于对齐
+                st.write("") # 空行用于对齐
+                show_results = st.checkbox("显示检索结果", value=True)
+                submit_button = st.form_submit_button("🚀 发送", use_container_width=True)
     
     # 处理用户输入
     if submit_button and user_input.strip():
@@ -557,32 +493,70 @@ def display_chat_interface():
             "timestamp": datetime.now().isoformat()
         })
         
-        # 显示加载状态
-        with st.spinner("🤔 正在思考您的问题..."):
-            # 调用API
-            result = st.session_state.client.query_law(
+        st.markdown(f"""
+        <div class="chat-message user-message">
+            <strong>👤 您:</strong><br>
+            {user_input}
+        </div>
+        """, unsafe_allow_html=True)
+        st.markdown("**⚖️ 法律助手:**")
+        
+        # 边生成边显示回答
+        meta = {}
+        try:
+            answer = st.write_stream(st.session_state.client.stream_query(
                 question=user_input,
                 session_id=st.session_state.session_id,
-                show_results=show_results
-            )
+                show_results=show_results,
+                meta=meta
+            ))
+        except Exception as e:
+            st.error(f"❌ 查询失败: {e}")
+            return
         
-        if result["success"]:
-            response_data = result["data"]
-            
-            # 更新会话ID
-            if not st.session_state.session_id:
-                st.session_state.session_id = response_data["session_id"]
-            
-            # 添加助手回复到聊天历史
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": response_data["answer"],
-                "timestamp": response_data["timestamp"]
-            })
-            
-            st.rerun()
-        else:
-            st.error(f"❌ 查询失败: {result['error']}")
+        # 更新会话ID
+        if not st.session_state.session_id:
+            st.session_state.session_id = meta.get("session_id")
+        
+        # 添加助手回复到聊天历史
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": answer,
+            "timestamp": meta.get("timestamp", datetime.now().isoformat())
+        })
+        fetch_sessions.clear()
+        
+        st.rerun()
+
+def display_prefetch_input():
+    """逐字回传的输入框：停止输入 PREFETCH_DEBOUNCE_MS 毫秒后预取检索，
+    点击发送时检索结果已在服务端缓存中，只需等待LLM生成"""
+    col1, col2 = st.columns([4, 1])
+    
+    with col1:
+        user_input = st_keyup(
+            "请输入您的法律问题:",
+            placeholder="例如：关于劳动合同解除的相关法律规定是什么？",
+            debounce=PREFETCH_DEBOUNCE_MS,
+            key=f"user_input_{st.session_state.input_version}"
+        ) or ""
+    
+    with col2:
+        st.write("") # 空行用于对齐
+        st.write("") # 空行用于对齐
+        show_results = st.checkbox("显示检索结果", value=True)
+        submit_button = st.button("🚀 发送", use_container_width=True)
+    
+    draft = user_input.strip()
+    if submit_button:
+        # 更换输入框的 key，下次渲染时为空
+        st.session_state.input_version += 1
+        st.session_state.last_prefetch = ""
+    elif draft and draft != st.session_state.last_prefetch:
+        st.session_state.client.prefetch(draft, st.session_state.session_id)
+        st.session_state.last_prefetch = draft
+    
+    return user_input, show_results, submit_button
 
 def display_search_interface():
     """显示搜索界面"""
@@ -692,30 +666,20 @@ def display_summary_interface():
     
     with col2:
         if st.button("📋 生成总结", use_container_width=True):
-            # 显示预估时间提示
-            with st.info("⏱️ 正在生成会话总结，预计需要30-60秒，请耐心等待..."):
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                # 模拟进度条
-                for i in range(100):
-                    progress_bar.progress(i + 1)
-                    if i < 20:
-                        status_text.text("� 分析对话内容...")
-                    elif i < 50:
-                        status_text.text("🤖 AI正在理解对话主题...")
-                    elif i < 80:
-                        status_text.text("📝 生成总结中...")
-                    else:
-                        status_text.text("✅ 即将完成...")
-                    time.sleep(0.1)
-                
-                # 调用API生成总结
-                result = st.session_state.client.get_session_summary(st.session_state.session_id)
-                
-                # 清除进度条
-                progress_bar.empty()
-                status_text.empty()
+            progress_bar = st.progress(0.0, text="⏳ 已提交总结任务，排队中...")
+            partial_text = st.empty()
+            
+            def show_progress(job):
+                progress_bar.progress(job["progress"], text=f"📝 {job['stage']}（{job['progress']:.0%}）")
+                if job["partial"]:
+                    partial_text.markdown(job["partial"])
+            
+            # 后台任务生成总结，按实际进度更新；会话内容未变时直接返回上次的结果
+            result = st.session_state.client.wait_summary(st.session_state.session_id, show_progress)
+            
+            # 清除进度条
+            progress_bar.empty()
+            partial_text.empty()
             
             if result["success"]:
                 summary_data = result["data"]
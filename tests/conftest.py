@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 与 benchmark_*.py 相同：项目根目录与 restful/ 下的模块直接按文件名导入
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "restful"))
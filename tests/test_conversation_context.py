@@ -0,0 +1,84 @@
+"""ConversationContext 的序列化，以及 LegalConsultationSystem.save_session / load_session 的往返"""
+
+import json
+
+import pytest
+
+from agent import ConversationContext, LegalConsultationSystem, Message, Role
+
+
+def _context() -> ConversationContext:
+    context = ConversationContext(session_id="s1", current_topic="劳动合同", last_query="试用期能辞退吗？",
+                                  retrieved_ids=[3, 1, 4], retrieved_version="v1", archived=2)
+    context.add_message("user", "试用期能辞退吗？")
+    context.add_message("assistant", "用人单位需证明不符合录用条件。")
+    context.add_message("user", "需要赔偿吗？")
+    context.add_message("assistant", "符合法定情形的无需支付经济补偿。")
+    return context
+
+
+def _system(context: ConversationContext = None) -> LegalConsultationSystem:
+    """不加载模型与索引，只初始化会话相关的属性"""
+    ConversationBufferWindowMemory = pytest.importorskip("langchain.memory").ConversationBufferWindowMemory
+    system = LegalConsultationSystem.__new__(LegalConsultationSystem)
+    system.context = context or ConversationContext()
+    system.memory = ConversationBufferWindowMemory(k=10, return_messages=True, memory_key="chat_history")
+    return system
+
+
+def _assert_same(restored: ConversationContext, context: ConversationContext):
+    assert restored.to_dict() == context.to_dict()
+    assert restored.version() == context.version()
+    assert all(isinstance(msg, Message) and isinstance(msg.role, Role) for msg in restored.history)
+
+
+def test_to_dict_round_trip():
+    context = _context()
+    data = json.loads(json.dumps(context.to_dict(), ensure_ascii=False))
+    _assert_same(ConversationContext.from_dict(data), context)
+
+
+def test_from_dict_legacy_format():
+    data = {
+        "history": [
+            {"role": "user", "content": "问题", "timestamp": "2024-01-01T10:00:00"},
+            {"role": "assistant", "content": "回答", "timestamp": "2024-01-01T10:00:05"},
+        ],
+        "current_topic": "",
+        "retrieved_context": ["法条全文"],
+        "last_query": "问题",
+        "session_id": "old",
+    }
+    context = ConversationContext.from_dict(data)
+    assert [msg.role for msg in context.history] == [Role.USER, Role.ASSISTANT]
+    assert context.history[1].timestamp - context.history[0].timestamp == 5
+    assert context.retrieved_ids == [] and context.archived == 0
+
+
+def test_save_and_load_session(tmp_path):
+    path = str(tmp_path / "session.json")
+    context = _context()
+    _system(context).save_session(path)
+
+    system = _system()
+    system.load_session(path)
+    _assert_same(system.context, context)
+    messages = system.memory.load_memory_variables({})["chat_history"]
+    assert [msg.content for msg in messages] == [msg.content for msg in context.history]
+
+
+def test_load_session_legacy_file(tmp_path):
+    path = tmp_path / "session.json"
+    path.write_text(json.dumps({"context": {
+        "history": [
+            {"role": "user", "content": "问题", "timestamp": "2024-01-01T10:00:00"},
+            {"role": "assistant", "content": "回答", "timestamp": "2024-01-01T10:00:05"},
+        ],
+        "retrieved_context": ["法条全文"],
+        "session_id": "old",
+    }}, ensure_ascii=False), encoding="utf-8")
+
+    system = _system()
+    system.load_session(str(path))
+    assert system.context.session_id == "old"
+    assert [msg.content for msg in system.context.history] == ["问题", "回答"]
@@ -0,0 +1,150 @@
+"""
+LLMPool 对接本地模拟LLM服务（mock_llm_server.py）的测试：流式输出、故障转移、熔断后重试与对冲请求
+
+每个模拟服务在独立子进程中运行（模拟参数是模块级全局变量，同一进程内不能配置出不同的服务）。
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("langchain_openai")
+pytest.importorskip("uvicorn")
+
+from agent import create_chat_llm
+from llm_pool import Backend, LLMPool
+from metrics import LLM_FAILOVERS, LLM_HEDGES
+from mock_llm_server import _tokens
+
+OUTPUT_TOKENS = 10
+EXPECTED_TEXT = "".join(_tokens(OUTPUT_TOKENS))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MESSAGES = [("system", "你是法律助手"), ("user", "试用期可以随时解除劳动合同吗？")]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_mock(ttft_ms: float = 20, error_rate: float = 0):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(PROJECT_ROOT, "mock_llm_server.py"), "--host", "127.0.0.1",
+         "--port", str(port), "--ttft-ms", str(ttft_ms), "--tokens-per-sec", "0",
+         "--output-tokens", str(OUTPUT_TOKENS), "--jitter", "0", "--error-rate", str(error_rate)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f"{base_url}/models", timeout=1).raise_for_status()
+            return process, base_url
+        except httpx.HTTPError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("模拟LLM服务启动失败")
+            time.sleep(0.1)
+
+
+@pytest.fixture(scope="module")
+def mock_servers():
+    """fast：20ms 首token；slow：1.5s 首token；broken：全部返回500"""
+    servers = {
+        "fast": _start_mock(ttft_ms=20),
+        "slow": _start_mock(ttft_ms=1500),
+        "broken": _start_mock(error_rate=1),
+    }
+    yield {name: base_url for name, (_, base_url) in servers.items()}
+    for process, _ in servers.values():
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def _backend(mock_servers, server: str, name: str, **kwargs) -> Backend:
+    llm = create_chat_llm("mock", mock_servers[server], "mock-llm")
+    return Backend(name, llm, **kwargs)
+
+
+def _collect(pool: LLMPool) -> str:
+    return "".join(chunk.content for chunk in pool.stream(MESSAGES))
+
+
+def test_stream_single_backend(mock_servers):
+    backend = _backend(mock_servers, "fast", "single-fast")
+    pool = LLMPool([backend])
+
+    assert _collect(pool) == EXPECTED_TEXT
+    stats = backend.stats()
+    assert stats["requests"] == 1 and stats["errors"] == 0
+    assert stats["ttft_p50_ms"] is not None
+
+
+def test_failover_before_first_token(mock_servers):
+    broken = _backend(mock_servers, "broken", "failover-broken")
+    fast = _backend(mock_servers, "fast", "failover-fast")
+    pool = LLMPool([broken, fast], hedge=False)
+
+    assert _collect(pool) == EXPECTED_TEXT
+    assert LLM_FAILOVERS.value(backend="failover-broken") == 1
+    assert broken.errors == 1 and broken.consecutive_failures == 1
+    assert fast.requests == 1 and fast.errors == 0
+
+
+def test_all_backends_failing_raises(mock_servers):
+    pool = LLMPool([
+        _backend(mock_servers, "broken", "all-broken-1"),
+        _backend(mock_servers, "broken", "all-broken-2"),
+    ], hedge=False)
+
+    with pytest.raises(Exception):
+        _collect(pool)
+
+
+def test_circuit_breaker_retries_after_cooldown(mock_servers):
+    broken = _backend(mock_servers, "broken", "breaker-broken", failure_threshold=1, cooldown=0.5)
+    fast = _backend(mock_servers, "fast", "breaker-fast")
+    pool = LLMPool([broken, fast], hedge=False)
+
+    assert _collect(pool) == EXPECTED_TEXT
+    assert not broken.available
+    assert pool.ordered_backends()[0] is fast
+
+    # 熔断期间不再调用出错的后端
+    assert _collect(pool) == EXPECTED_TEXT
+    assert broken.requests == 1
+
+    # 熔断期过后重新尝试，仍然失败则再次熔断并转到下一个后端
+    time.sleep(0.6)
+    assert broken.available
+    assert pool.ordered_backends()[0] is broken
+    assert _collect(pool) == EXPECTED_TEXT
+    assert broken.requests == 2
+    assert not broken.available
+
+
+def test_hedge_when_primary_is_slow(mock_servers, monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_DEFAULT_MS", "100")
+    monkeypatch.setenv("LLM_HEDGE_MIN_MS", "50")
+    slow = _backend(mock_servers, "slow", "hedge-slow")
+    fast = _backend(mock_servers, "fast", "hedge-fast")
+    pool = LLMPool([slow, fast], hedge=True)
+    won = LLM_HEDGES.value(outcome="won")
+
+    start = time.perf_counter()
+    chunks = pool.stream(MESSAGES)
+    first = next(chunk for chunk in chunks if chunk.content)
+    first_token = time.perf_counter() - start
+    text = first.content + "".join(chunk.content for chunk in chunks)
+
+    assert text == EXPECTED_TEXT
+    assert first_token < 1.0
+    assert LLM_HEDGES.value(outcome="won") == won + 1
+    assert pool.stats()["recent_hedge_ratio"] == 1.0
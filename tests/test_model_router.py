@@ -0,0 +1,31 @@
+"""模型路由：按检索置信度、问题长度与对话轮数选择模型"""
+
+from model_router import ModelRouter
+
+
+def _router(monkeypatch) -> ModelRouter:
+    monkeypatch.setenv("ROUTER_MIN_SCORE", "0.6")
+    monkeypatch.setenv("ROUTER_MIN_MARGIN", "0.02")
+    return ModelRouter(fast_llm=object(), strong_llm=object())
+
+
+def test_confident_short_question_goes_fast(monkeypatch):
+    decision = _router(monkeypatch).route("醉酒驾驶会被怎么处罚", 0, [0.82, 0.61])
+    assert decision.route == "fast" and decision.reasons == []
+
+
+def test_low_score_goes_strong(monkeypatch):
+    decision = _router(monkeypatch).route("醉酒驾驶会被怎么处罚", 0, [0.45, 0.30])
+    assert decision.route == "strong" and "low_score" in decision.reasons
+
+
+def test_l2_index_disables_score_routing(monkeypatch, capsys):
+    router = _router(monkeypatch)
+    # L2 索引的分数为 1/(1+距离)，数值上超过阈值也不能当作余弦相似度比较
+    decision = router.route("醉酒驾驶会被怎么处罚", 0, [0.9, 0.5], cosine=False)
+    assert decision.route == "strong" and decision.reasons == ["non_cosine_index"]
+    assert "L2索引" in capsys.readouterr().out
+
+    # 只提示一次
+    router.route("醉酒驾驶会被怎么处罚", 0, [0.9, 0.5], cosine=False)
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,125 @@
+"""问答接口的会话处理
+
+- /query/stream：客户端在读取 body 之前断开时，会话锁与订阅仍会释放
+- /query：会话的读写（SQLite 存储时为磁盘 I/O）不在事件循环中执行
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+import main
+from single_flight import SharedStream, SingleFlight
+
+
+class FakeSystem:
+    """只实现 /query/stream 用到的接口，不加载模型与索引"""
+
+    def __init__(self):
+        self.single_flight = SingleFlight()
+        self.streams = []
+
+    def prepare_query(self, query, show_results=True, context=None, filters=None):
+        return "", None, SimpleNamespace(route="strong")
+
+    def answer_stream(self, query, context, retrieved_context, flight_key=None, decision=None):
+        stream = SharedStream()
+        self.streams.append(stream)
+
+        def produce():
+            time.sleep(0.05)
+            for chunk in ("根据", "规定"):
+                stream.put(chunk)
+            stream.finish()
+
+        threading.Thread(target=produce, daemon=True).start()
+        return stream, False
+
+    def complete_turn(self, query, answer, context):
+        context.add_message("user", query)
+        context.add_message("assistant", answer)
+
+
+class LoopCheckingStore(dict):
+    """记录是否在事件循环线程中被访问"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls_on_loop = []
+
+    def _check(self, name: str):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.calls_on_loop.append(name)
+
+    def __contains__(self, key):
+        self._check("__contains__")
+        return super().__contains__(key)
+
+    def __getitem__(self, key):
+        self._check("__getitem__")
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self._check("__setitem__")
+        super().__setitem__(key, value)
+
+
+@pytest.fixture
+def system(monkeypatch):
+    system = FakeSystem()
+    monkeypatch.setattr(main, "consultation_system", system)
+    return system
+
+
+async def _respond_without_reading(request: main.QueryRequest):
+    """调用接口后发送响应，但 http.response.start 时连接已断开（body 生成器从未开始）"""
+    response = await main.query_law_stream(request)
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        await response({"type": "http", "asgi": {"version": "3.0"}}, receive, send)
+
+
+def test_unread_stream_releases_session(system):
+    session_id = "stream-unread"
+    asyncio.run(_respond_without_reading(main.QueryRequest(question="试用期能辞退吗？", session_id=session_id)))
+
+    assert not main.get_session_lock(session_id).locked()
+    assert system.streams[0].abandoned
+
+    # 同一会话的下一个请求不会卡在 session_lock_wait
+    client = TestClient(main.app)
+    response = client.post("/query/stream", json={"question": "需要赔偿吗？", "session_id": session_id})
+    assert response.status_code == 200
+    assert "event: done" in response.text
+    assert not main.get_session_lock(session_id).locked()
+    assert [msg.content for msg in main.sessions[session_id].history] == ["需要赔偿吗？", "根据规定"]
+
+
+def test_query_session_io_off_event_loop(system, monkeypatch):
+    store = LoopCheckingStore()
+    monkeypatch.setattr(main, "sessions", store)
+    client = TestClient(main.app)
+
+    for question in ("试用期能辞退吗？", "需要赔偿吗？"):
+        response = client.post("/query", json={"question": question, "session_id": "query-io"})
+        assert response.status_code == 200
+        assert response.json()["answer"] == "根据规定"
+
+    assert len(store["query-io"].history) == 4
+    assert store.calls_on_loop == []
@@ -0,0 +1,69 @@
+"""会话存储：按 SESSION_HISTORY_LIMIT 截断内存中的历史，更早的消息转存后完整历史仍可读出"""
+
+import os
+
+from agent import ConversationContext
+from session_store import MemorySessionStore, SQLiteSessionStore, create_session_store
+
+ALL_MESSAGES = [f"{kind}{i}" for i in range(5) for kind in ("问题", "回答")]
+
+
+def _context(turns: int) -> ConversationContext:
+    context = ConversationContext(session_id="s1")
+    for i in range(turns):
+        context.add_message("user", f"问题{i}")
+        context.add_message("assistant", f"回答{i}")
+    return context
+
+
+def test_memory_store_default_keeps_everything_without_disk(tmp_path, monkeypatch):
+    db_path = tmp_path / "sessions.db"
+    monkeypatch.setenv("SESSION_STORE", "memory")
+    monkeypatch.delenv("SESSION_HISTORY_LIMIT", raising=False)
+    monkeypatch.setenv("SESSION_DB_PATH", str(db_path))
+    store = create_session_store()
+    assert isinstance(store, MemorySessionStore)
+
+    store["s1"] = _context(5)
+    assert len(store["s1"].history) == 10 and store["s1"].archived == 0
+    assert [msg.content for msg in store.history("s1")] == ALL_MESSAGES
+    del store["s1"]
+    assert not os.path.exists(db_path)
+
+
+def test_memory_store_with_limit_archives_overflow(tmp_path, monkeypatch):
+    monkeypatch.setenv("SESSION_STORE", "memory")
+    monkeypatch.setenv("SESSION_HISTORY_LIMIT", "4")
+    monkeypatch.setenv("SESSION_DB_PATH", str(tmp_path / "sessions.db"))
+    store = create_session_store()
+
+    context = _context(3)
+    store["s1"] = context
+    for i in range(3, 5):
+        context.add_message("user", f"问题{i}")
+        context.add_message("assistant", f"回答{i}")
+        store["s1"] = context
+    assert [msg.content for msg in store["s1"].history] == ["问题3", "回答3", "问题4", "回答4"]
+    assert store["s1"].message_count == 10
+    assert [msg.content for msg in store.history("s1")] == ALL_MESSAGES
+
+    del store["s1"]
+    assert store.archive.load("s1", 10) == []
+
+
+def test_sqlite_store_archives_overflow(tmp_path, monkeypatch):
+    monkeypatch.setenv("SESSION_STORE", "sqlite")
+    monkeypatch.delenv("SESSION_HISTORY_LIMIT", raising=False)
+    monkeypatch.setenv("SESSION_DB_PATH", str(tmp_path / "sessions.db"))
+    store = create_session_store()
+    assert isinstance(store, SQLiteSessionStore)
+    assert store.history_limit == 40
+
+    store.history_limit = 4
+    store["s1"] = _context(5)
+    assert len(store["s1"].history) == 4
+    assert [msg.content for msg in store.history("s1")] == ALL_MESSAGES
+
+    del store["s1"]
+    assert "s1" not in store
+    assert store.archive.load("s1", 10) == []
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+轻量级请求追踪
+
+每个 HTTP 请求是一条 trace，咨询流程的各阶段（会话加载、检索、编码、向量搜索、
+Prompt构建、LLM调用等）是其中的 span。当前 span 通过 contextvars 传递，
+FastAPI 处理函数、线程池中的 RetrievalAgent / QAAgent 都能挂到同一棵树上。
+请求结束后整条 trace 在后台线程导出到本地 JSONL 文件或 OTLP/HTTP 收集器。
+
+用法:
+    TRACE_EXPORTER=jsonl TRACE_FILE=logs/traces.jsonl      # 写本地文件
+    TRACE_EXPORTER=otlp OTLP_ENDPOINT=http://localhost:4318  # 发送到OTLP收集器
+    TRACE_MIN_DURATION_MS=1000                              # 只导出慢请求
+
+    python tracing.py show logs/traces.jsonl --slowest 5     # 查看最慢的请求
+    python tracing.py collector --port 4318                  # 本地OTLP收集器替身
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from metrics import TRACES_DROPPED
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """一个计时区间"""
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"] = None,
+                 attributes: Dict[str, Any] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._start_perf = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        # 同一 trace 的所有 span 共用一个列表
+        self.spans: List["Span"] = parent.spans if parent else []
+        self.spans.append(self)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._start_perf) * 1000
+        self.end_ns = self.start_ns + int(self.duration_ms * 1e6)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attribute(key: str, value: Any):
+    """给当前 span 添加属性（没有进行中的 trace 时忽略）"""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """在当前 trace 中创建子 span；没有进行中的 trace 时不做任何事"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, parent.trace_id, parent, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.status = "error"
+        child.set_attribute("error", str(e))
+        raise
+    finally:
+        child.end()
+        _current_span.reset(token)
+
+
+def trace_id_for(request_id: str) -> str:
+    """由请求ID得到32位十六进制的 trace id（请求ID本身合法时直接使用）"""
+    candidate = request_id.replace("-", "").lower()
+    if len(candidate) == 32 and all(c in "0123456789abcdef" for c in candidate):
+        return candidate
+    return hashlib.md5(request_id.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def start_trace(name: str, request_id: str, finish: bool = True, **attributes) -> Iterator[Span]:
+    """开始一条 trace（根 span），结束时交给导出器
+
+    finish=False 时离开 with 块只恢复当前 span，不结束 trace（出错时除外），
+    由调用方稍后调用 finish_trace（例如流式响应体发送完之后）。
+    """
+    root = Span(name, trace_id_for(request_id), None, attributes)
+    root.set_attribute("request.id", request_id)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        _current_span.reset(token)
+        finish_trace(root, e)
+        raise
+    _current_span.reset(token)
+    if finish:
+        finish_trace(root)
+
+
+def finish_trace(root: Span, error: BaseException = None):
+    """结束 trace 并交给导出器"""
+    if error is not None:
+        root.status = "error"
+        root.set_attribute("error", str(error))
+    root.end()
+    TRACER.finish(root)
+
+
+async def finish_trace_after(body: AsyncIterator[Any], root: Span) -> AsyncIterator[Any]:
+    """逐块转发响应体，发送完（或客户端断开）后才结束 trace
+
+    流式响应的生成在处理函数返回之后才进行，这样生成阶段的 span 也计入这条 trace。
+    """
+    error = None
+    try:
+        async for chunk in body:
+            yield chunk
+    except (GeneratorExit, asyncio.CancelledError):
+        root.set_attribute("client.disconnected", True)
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        finish_trace(root, error)
+
+
+# ========================
+# 导出器
+# ========================
+class JSONLExporter:
+    """每条 trace 写一行 JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, root: Span):
+        record = {
+            "trace_id": root.trace_id,
+            "request_id": root.attributes.get("request.id"),
+            "name": root.name,
+            "start_ns": root.start_ns,
+            "duration_ms": round(root.duration_ms, 3),
+            "pid": os.getpid(),
+            "spans": [s.to_dict() for s in root.spans],
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter:
+    """以 OTLP/HTTP JSON 格式发送到收集器（POST {endpoint}/v1/traces）"""
+
+    def __init__(self, endpoint: str, service_name: str = "pku-law-api", timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def to_payload(self, root: Span) -> Dict[str, Any]:
+        spans = []
+        for s in root.spans:
+            spans.append({
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 2 if s is root else 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                "status": {"code": 2 if s.status == "error" else 1},
+            })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{"scope": {"name": "pku_law.tracing"}, "spans": spans}],
+            }]
+        }
+
+    def export(self, root: Span):
+        body = json.dumps(self.to_payload(root), ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(
+            self.url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class Tracer:
+    """按配置过滤并在后台线程中导出已完成的 trace"""
+
+    def __init__(self):
+        self.exporter = None
+        self.min_duration_ms = 0.0
+        self._queue: Optional[queue.Queue] = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        self.configure()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(self, exporter: str = None, min_duration_ms: float = None):
+        """读取 TRACE_EXPORTER / TRACE_FILE / OTLP_ENDPOINT / TRACE_MIN_DURATION_MS"""
+        kind = (exporter or os.getenv("TRACE_EXPORTER", "none")).lower()
+        if kind == "jsonl":
+            path = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+            if not os.path.isabs(path):
+                path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+            self.exporter = JSONLExporter(path)
+        elif kind == "otlp":
+            self.exporter = OTLPExporter(os.getenv("OTLP_ENDPOINT", "http://localhost:4318"))
+        else:
+            self.exporter = None
+
+        if min_duration_ms is None:
+            min_duration_ms = float(os.getenv("TRACE_MIN_DURATION_MS", "0"))
+        self.min_duration_ms = min_duration_ms
+
+    def finish(self, root: Span):
+        if self.exporter is None or root.duration_ms < self.min_duration_ms:
+            return
+        self._ensure_worker()
+        # 在事件循环中调用：队列满时直接丢弃，追踪不能反过来拖慢请求
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            TRACES_DROPPED.inc()
+
+    def _ensure_worker(self):
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=10000)
+            threading.Thread(target=self._run, args=(self._queue,), name="trace-exporter", daemon=True).start()
+            self._worker_pid = os.getpid()
+
+    def _run(self, pending: queue.Queue):
+        while True:
+            root = pending.get()
+            try:
+                self.exporter.export(root)
+            except Exception as e:
+                print(f"⚠️ trace导出失败: {e}")
+
+
+TRACER = Tracer()
+
+
+# ========================
+# 命令行工具
+# ========================
+def _print_tree(record: Dict[str, Any]):
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for s in record["spans"]:
+        children.setdefault(s["parent_id"], []).append(s)
+
+    def walk(parent_id, depth):
+        for s in sorted(children.get(parent_id, []), key=lambda x: x["start_ns"]):
+            offset = (s["start_ns"] - record["start_ns"]) / 1e6
+            attrs = {k: v for k, v in s["attributes"].items() if k != "request.id"}
+            flag = " ❌" if s["status"] == "error" else ""
+            print(f"{'  ' * depth}{s['name']:<{40 - 2 * depth}} +{offset:>9.1f}ms {s['duration_ms']:>10.1f}ms{flag} {attrs if attrs else ''}")
+            walk(s["span_id"], depth + 1)
+
+    print(f"\n[{record['request_id']}] {record['name']}  {record['duration_ms']:.1f}ms")
+    walk(None, 1)
+
+
+def show(path: str, slowest: int = 5, request_id: str = None):
+    """打印 JSONL 中最慢的若干条（或指定请求ID的）trace"""
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if request_id:
+        records = [r for r in records if r.get("request_id") == request_id]
+    else:
+        records = sorted(records, key=lambda r: r["duration_ms"], reverse=True)[:slowest]
+    for record in records:
+        _print_tree(record)
+
+
+def run_collector(port: int, output: str):
+    """本地 OTLP/HTTP 收集器替身：把收到的 span 逐行写入 JSONL"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_response(404)
+                self.end_headers()
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            with lock, open(output, "a", encoding="utf-8") as f:
+                for resource_spans in payload.get("resourceSpans", []):
+                    for scope_spans in resource_spans.get("scopeSpans", []):
+                        for s in scope_spans.get("spans", []):
+                            f.write(json.dumps(s, ensure_ascii=False) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"OTLP collector stand-in listening on :{port}, writing spans to {output}")
+    ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="请求追踪工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = subparsers.add_parser("show", help="查看 JSONL 中的 trace")
+    show_parser.add_argument("path", nargs="?", default="logs/traces.jsonl")
+    show_parser.add_argument("--slowest", type=int, default=5)
+    show_parser.add_argument("--request-id", default=None)
+
+    collector_parser = subparsers.add_parser("collector", help="本地OTLP收集器替身")
+    collector_parser.add_argument("--port", type=int, default=4318)
+    collector_parser.add_argument("--output", default="logs/otlp_spans.jsonl")
+
+    args = parser.parse_args()
+    if args.command == "show":
+        show(args.path, args.slowest, args.request_id)
+    else:
+        run_collector(args.port, args.output)
+
+
+if __name__ == "__main__":
+    main()